@@ -0,0 +1,71 @@
+"""
+Benchmark of the start-up time of the command line interface.
+
+Every command runs in a fresh interpreter a number of times and the median wall time is reported, together with
+the cumulative import time of the slowest top-level packages from python -X importtime (of the last run).
+
+    python benchmarks/bench_import_time.py --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+COMMANDS = {
+    'python -c pass': ['-c', 'pass'],
+    'import empire_movies': ['-c', 'import empire_scraper.empire_movies'],
+    'empire_scraper --help': ['-m', 'empire_scraper', '--help'],
+    'empire_scraper crawl --help': ['-m', 'empire_scraper', 'crawl', '--help'],
+    'empire_scraper stats': ['-m', 'empire_scraper', 'stats'],
+}
+
+
+def parse_importtime(stderr):
+    """
+    :return: dict with the cumulative import time in ms per top-level package
+    """
+    packages = dict()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        package = name.split('.')[0]
+        # The outermost import of a package has the largest cumulative time
+        packages[package] = max(packages.get(package, 0), int(cumulative) / 1000)
+    return packages
+
+
+def bench_command(arguments, repeat):
+    """
+    :return: list with the wall times in seconds and the import times of the last run
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *arguments], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    completed = subprocess.run([sys.executable, '-X', 'importtime', *arguments], cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return timings, parse_importtime(completed.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help='number of packages per command')
+    args = parser.parse_args()
+
+    print(f'{"command":30s} {"median ms":>9} {"min ms":>8}  slowest imports (cumulative ms)')
+    for name, arguments in COMMANDS.items():
+        timings, packages = bench_command(arguments, args.repeat)
+        slowest = sorted(packages.items(), key=lambda item: -item[1])[:args.top]
+        print(f'{name:30s} {1000 * statistics.median(timings):9.1f} {1000 * min(timings):8.1f}  '
+              + ', '.join(f'{package} {ms:.0f}' for package, ms in slowest))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Offline benchmark of the scraper against recorded responses.
+
+Every configuration (number of review processes x concurrency) scrapes the same listing pages through a
+ReplayTransport, which serves the fixture archive with the given latency and error rate. Reported are pages/s,
+reviews/s, the parse time per review, the time per review in the workers and the peak memory. The parse time of
+EmpireMovie.get_review is also measured on its own, on all recorded review pages.
+
+Record the fixtures once (needs network access):
+    python benchmarks/bench_replay.py --record --fixtures fixtures --pages 1-20
+
+Run the benchmark:
+    python benchmarks/bench_replay.py --fixtures fixtures --pages 1-20 --processors 1 2 4 --concurrency 5 20 \
+        --latency 0.05 --jitter 0.05 --error-rate 0.02
+
+The scraper runs in a scratch directory (--workdir), so results, thumbnails and logs of the benchmark do not mix
+with those of real runs.
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from empire_scraper.empire_movie import EmpireMovie  # noqa: E402
+from empire_scraper.empire_movies import EmpireMovies  # noqa: E402
+from empire_scraper.empire_profiler import get_profiler  # noqa: E402
+from empire_scraper.empire_replay import FixtureArchive, ReplayTransport  # noqa: E402
+
+# Listener configuration of the benchmark: the worker logs only go to a file
+LISTENER_CONFIG = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {'simple': {'format': '%(asctime)s|%(levelname)s|%(message)s'}},
+    'handlers': {'file': {'class': 'logging.FileHandler', 'filename': 'empire_movies.log', 'mode': 'w',
+                          'formatter': 'simple'}},
+    'root': {'level': 'INFO', 'handlers': ['file']},
+}
+
+
+def parse_pages(value):
+    """
+    :param value: e.g. 1-20 or 1,2,5
+    :return: list of pages
+    """
+    pages = []
+    for part in value.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            pages += list(range(int(first), int(last) + 1))
+        else:
+            pages.append(int(part))
+    return pages
+
+
+def get_max_rss():
+    """
+    :return: peak resident memory in MB of the main process and of the largest worker process
+    """
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+
+
+def record(args):
+    empire_movies = EmpireMovies(process_images=args.images, number_of_processors=args.processors[0],
+                                 use_proxies=False, use_cache=False, record_fixtures=args.fixtures)
+    movies = empire_movies.get_movies_for_pages(args.pages)
+    print(f'Recorded {len(args.pages)} pages and {len(movies)} reviews in {args.fixtures}')
+
+
+def bench_parsing(archive, repeat):
+    """
+    :return: list with the best parse time in seconds per recorded review page
+    """
+    timings = []
+    logger = logging.getLogger('bench')
+    for url in archive.get_urls('review'):
+        recorded = archive.get(url)
+        if recorded['status'] != 200:
+            continue
+        best = None
+        for _ in range(repeat):
+            info = {'000-00': {'InfoMovie': None, 'InfoRating': None, 'InfoReviewUrl': url}}
+            movie = EmpireMovie(logger, info, process_images=False, use_proxies=False)
+            start = time.perf_counter()
+            movie.get_review(recorded['content'])
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+    return timings
+
+
+def bench_scraping(args, number_of_processors, concurrency):
+    transport = ReplayTransport(args.fixtures, latency=args.latency, jitter=args.jitter,
+                                error_rate=args.error_rate, seed=args.seed)
+    empire_movies = EmpireMovies(process_images=args.images, number_of_processors=number_of_processors,
+                                 use_proxies=False, use_cache=False, max_concurrency=concurrency,
+                                 max_per_host=concurrency, number_of_review_threads=concurrency, rate=None,
+                                 rate_per_host=None, transport=transport, adaptive=args.adaptive)
+    get_profiler().drain()
+    start = time.perf_counter()
+    movies = empire_movies.get_movies_for_pages(args.pages)
+    elapsed = time.perf_counter() - start
+    samples = get_profiler().drain()
+
+    def get_mean(stage):
+        values = samples.get(stage, [])
+        return 1000 * statistics.mean(values) if len(values) > 0 else None
+
+    main_rss, worker_rss = get_max_rss()
+    return {'processors': number_of_processors,
+            'concurrency': concurrency,
+            'seconds': elapsed,
+            'pages_per_second': len(args.pages) / elapsed,
+            'reviews_per_second': len(movies) / elapsed,
+            'reviews': len(movies),
+            'review_ms': get_mean('review.total'),
+            'parse_ms': get_mean('review.single_pass'),
+            'main_rss_mb': main_rss,
+            'worker_rss_mb': worker_rss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixtures', default='fixtures')
+    parser.add_argument('--pages', type=parse_pages, default=parse_pages('1-5'))
+    parser.add_argument('--processors', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10])
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--images', action='store_true')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='concurrency per host as an AIMD limit up to --concurrency')
+    parser.add_argument('--record', action='store_true')
+    parser.add_argument('--workdir', default=None)
+    parser.add_argument('--output', default=None, help='JSON file for the results')
+    args = parser.parse_args()
+    args.fixtures = os.path.abspath(args.fixtures)
+    output = None if args.output is None else os.path.abspath(args.output)
+
+    workdir = args.workdir if args.workdir is not None else tempfile.mkdtemp(prefix='empire_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    with open('listener.yaml', 'w') as f:
+        json.dump(LISTENER_CONFIG, f)
+
+    if args.record:
+        record(args)
+        return
+
+    archive = FixtureArchive(args.fixtures)
+    if len(archive.get_urls()) == 0:
+        print(f'No fixtures found in {args.fixtures}')
+        return
+
+    parse_timings = bench_parsing(archive, args.repeat)
+    if len(parse_timings) > 0:
+        print(f'get_review: {len(parse_timings)} reviews, mean {1000 * statistics.mean(parse_timings):.2f} ms, '
+              f'median {1000 * statistics.median(parse_timings):.2f} ms')
+
+    results = []
+    print(f'{"procs":>5} {"conc":>5} {"seconds":>8} {"pages/s":>8} {"reviews/s":>9} {"reviews":>7} '
+          f'{"review ms":>9} {"parse ms":>8} {"main MB":>8} {"worker MB":>9}')
+    for number_of_processors in args.processors:
+        for concurrency in args.concurrency:
+            result = bench_scraping(args, number_of_processors, concurrency)
+            results.append(result)
+            print(f'{result["processors"]:5d} {result["concurrency"]:5d} {result["seconds"]:8.2f} '
+                  f'{result["pages_per_second"]:8.2f} {result["reviews_per_second"]:9.2f} {result["reviews"]:7d} '
+                  f'{result["review_ms"] or 0:9.2f} {result["parse_ms"] or 0:8.2f} {result["main_rss_mb"]:8.1f} '
+                  f'{result["worker_rss_mb"]:9.1f}')
+
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump({'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+                       'parsing_ms': [1000 * timing for timing in parse_timings],
+                       'scraping': results}, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark the per-review parse time of the BeautifulSoup based get_review_* methods against the single-pass
+ReviewExtractor, and check that both produce the same movie dict.
+
+Usage (from the empire_scraper directory, so the cache directory is found):
+    python ../benchmarks/bench_review_parsing.py [--repeat 5] [html files or directories ...]
+
+Without files, the review pages in the response cache are used.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from empire_scraper.empire_movie import EmpireMovie  # noqa: E402
+
+
+def get_html_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(path, file) for file in sorted(os.listdir(path)) if file.endswith('.html')]
+        else:
+            files.append(path)
+    return files
+
+
+def get_cached_reviews(directory='cache'):
+    index = os.path.join(directory, 'index.sqlite')
+    if not os.path.exists(index):
+        return []
+    with sqlite3.connect(index) as connection:
+        digests = connection.execute('SELECT digest FROM entries WHERE url_class = "review"').fetchall()
+    return [os.path.join(directory, 'objects', digest[:2], digest) for digest, in digests]
+
+
+def parse(html, single_pass):
+    info = {'000-00': {'InfoMovie': None, 'InfoRating': None, 'InfoReviewUrl': None}}
+    movie = EmpireMovie(logging.getLogger('bench'), info, process_images=False, use_proxies=False,
+                        single_pass=single_pass)
+    start = time.perf_counter()
+    movie.get_review(html)
+    return time.perf_counter() - start, movie.movie
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    files = get_html_files(args.paths) if args.paths else get_cached_reviews()
+    if len(files) == 0:
+        print('No review pages found')
+        return
+
+    timings = {False: [], True: []}
+    mismatches = []
+    for file in files:
+        with open(file, 'rb') as f:
+            html = f.read()
+        for single_pass in timings:
+            timings[single_pass].append(min(parse(html, single_pass)[0] for _ in range(args.repeat)))
+        if parse(html, False)[1] != parse(html, True)[1]:
+            mismatches.append(file)
+
+    print(f'Reviews: {len(files)}')
+    for single_pass, label in [(False, 'BeautifulSoup'), (True, 'Single pass')]:
+        print(f'{label:15s} mean {1000 * statistics.mean(timings[single_pass]):7.2f} ms  '
+              f'median {1000 * statistics.median(timings[single_pass]):7.2f} ms')
+    speedup = statistics.mean(timings[False]) / statistics.mean(timings[True])
+    print(f'Speedup: {speedup:.1f}x')
+    print(f'Mismatches: {len(mismatches)}')
+    for file in mismatches:
+        print(f'  {file}')
+
+
+if __name__ == '__main__':
+    main()
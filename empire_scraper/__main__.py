@@ -0,0 +1,5 @@
+import sys
+
+from empire_scraper.cli import main
+
+sys.exit(main())
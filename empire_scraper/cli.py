@@ -0,0 +1,286 @@
+"""
+Command line interface of the scraper.
+
+    python -m empire_scraper crawl --pages 1-20 --processors 4
+    python -m empire_scraper resume
+    python -m empire_scraper retry
+    python -m empire_scraper export --format csv --output movies.csv
+    python -m empire_scraper stats
+    python -m empire_scraper search '"dark knight" nolan'
+
+Run it from the directory with root.yaml and listener.yaml (the empire_scraper directory). Only the modules of the
+chosen subcommand are imported: stats needs the standard library only, search, index and images need numpy (and
+PIL), export needs pyarrow and pandas and only crawl, resume and retry load the scraper itself.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def parse_pages(value):
+    """
+    :param value: e.g. 20 (pages 1 to 20), 5-20 or 1,2,5
+    :return: list of pages
+    """
+    if value.isdigit():
+        return list(range(1, int(value) + 1))
+    pages = []
+    for part in value.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            pages += list(range(int(first), int(last) + 1))
+        else:
+            pages.append(int(part))
+    return pages
+
+
+def get_latest_run(directory='results'):
+    """
+    :return: name of the most recent run with a checkpoint or None
+    """
+    from empire_scraper.empire_checkpoint import get_latest_checkpoint_file
+    return get_latest_checkpoint_file(directory)[0]
+
+
+def configure_logging():
+    from logging.config import dictConfig
+    import yaml
+    config_file = 'root.yaml' if os.path.exists('root.yaml') else os.path.join(os.path.dirname(__file__), 'root.yaml')
+    with open(config_file, 'r') as f:
+        dictConfig(yaml.safe_load(f.read()))
+
+
+def create_empire_movies(args):
+    from empire_scraper.empire_movies import EmpireMovies
+    return EmpireMovies(process_images=not args.no_images,
+                        number_of_processors=args.processors,
+                        use_proxies=not args.no_proxies,
+                        max_concurrency=args.concurrency,
+                        max_per_host=args.max_per_host,
+                        min_per_host=args.min_per_host,
+                        adaptive=args.adaptive,
+                        number_of_listing_workers=args.listing_workers,
+                        number_of_review_threads=args.threads,
+                        use_cache=not args.no_cache,
+                        cache_only=args.cache_only,
+                        rate=args.rate,
+                        rate_per_host=args.rate_per_host,
+                        export_excel=args.excel,
+                        metrics_port=args.metrics_port,
+                        progress=args.progress)
+
+
+def crawl(args):
+    configure_logging()
+    empire_movies = create_empire_movies(args)
+    empire_movies.get_movies(args.pages, args.article, incremental=args.incremental)
+
+
+def resume(args):
+    configure_logging()
+    empire_movies = create_empire_movies(args)
+    empire_movies.get_movies(args.pages, args.article, resume=True)
+
+
+def retry(args):
+    configure_logging()
+    empire_movies = create_empire_movies(args)
+    empire_movies.resume()
+    empire_movies.retry_failures()
+    empire_movies.save_to_store()
+
+
+def export(args):
+    from empire_scraper.empire_storage import EmpireStore
+    store = EmpireStore(os.path.join('results', 'store'))
+    runs = store.get_runs()
+    if len(runs) == 0:
+        print('No runs in the store')
+        return 1
+    run = args.run if args.run is not None else runs[-1]
+    output = args.output if args.output is not None else f'{run}_empire_movies.{args.format}'
+    if args.format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(store.load_table(run), output)
+        print(f'Exported run {run} to {output}')
+        return 0
+    df = store.load(run=run)
+    if args.format == 'csv':
+        df.to_csv(output, sep=';')
+    elif args.format == 'json':
+        df.to_json(output, orient='index', indent=4)
+    else:
+        df.drop(labels=['Introduction', 'Review'], axis=1).to_excel(output, index=True)
+    print(f'Exported {len(df)} movies of run {run} to {output}')
+    return 0
+
+
+def stats(args):
+    from empire_scraper.empire_checkpoint import EmpireCheckpoint
+    from empire_scraper.empire_frontier import UrlFrontier
+    from empire_scraper.empire_ledger import ErrorLedger
+
+    run = args.run if args.run is not None else get_latest_run()
+    if run is None:
+        print('No runs found')
+        return 1
+    directory = os.path.join('results', run)
+    checkpoint = EmpireCheckpoint(os.path.join(directory, f'{run}_checkpoint.jsonl'))
+    print(f'Run: {run}')
+    print(f'Movies: {len(checkpoint.get_ids())}')
+
+    ledger_file = os.path.join(directory, f'{run}_errors.sqlite')
+    if os.path.exists(ledger_file):
+        errors = ErrorLedger(ledger_file).get_errors()
+        retryable = sum(error['retryable'] for error in errors)
+        print(f'Errors: {len(errors)} ({retryable} retryable)')
+        error_classes = dict()
+        for error in errors:
+            key = f'{error["kind"]} {error["error_class"]} {error["status"]}'
+            error_classes[key] = error_classes.get(key, 0) + 1
+        for key, count in sorted(error_classes.items(), key=lambda item: -item[1]):
+            print(f'    {key}: {count}')
+
+    frontier_file = os.path.join(directory, f'{run}_frontier.sqlite')
+    if os.path.exists(frontier_file):
+        print(f'Frontier: {UrlFrontier(frontier_file).get_counts()}')
+
+    profile_file = os.path.join(directory, f'{run}_profile.json')
+    if os.path.exists(profile_file):
+        with open(profile_file, 'r') as f:
+            summary = json.load(f)
+        stages = sorted(((stage, values) for stage, values in summary.items() if not stage.startswith('bytes')),
+                        key=lambda item: -item[1]['total'])
+        print('Slowest stages (total seconds, count, mean ms, p95 ms):')
+        for stage, values in stages[:args.top]:
+            print(f'    {stage:45s} {values["total"]:9.1f} {values["count"]:8d} {1000 * values["mean"]:9.1f} '
+                  f'{1000 * values["p95"]:9.1f}')
+    return 0
+
+
+def index(args):
+    """
+    Add the movies of a run, e.g. of a run from before the search index, from its checkpoint to the search index.
+    """
+    from empire_scraper.empire_checkpoint import EmpireCheckpoint
+    from empire_scraper.empire_search import SearchIndex
+
+    run = args.run if args.run is not None else get_latest_run()
+    if run is None:
+        print('No runs found')
+        return 1
+    search_index = SearchIndex(os.path.join('results', 'index'))
+    checkpoint = EmpireCheckpoint(os.path.join('results', run, f'{run}_checkpoint.jsonl'))
+    for movies in checkpoint.iter_movies(batch_size=search_index.segment_size):
+        search_index.add_movies(movies, run=run)
+    search_index.commit()
+    if args.merge:
+        search_index.merge()
+    print(f'Index: {search_index.get_counts()}')
+    return 0
+
+
+def search(args):
+    from empire_scraper.empire_search import SearchIndex
+
+    start = time.perf_counter()
+    results = SearchIndex(os.path.join('results', 'index')).search(args.query, limit=args.limit,
+                                                                     match_all=args.all)
+    elapsed = time.perf_counter() - start
+    for result in results:
+        print(f'{result["Score"]:7.2f}  {result["Run"]}  {result["ID"]}  {result["InfoMovie"]}  '
+              f'{result["InfoReviewUrl"]}')
+    print(f'{len(results)} results in {1000 * elapsed:.1f} ms')
+    return 0
+
+
+def images(args):
+    from empire_scraper.empire_imaging import ImageCatalog, ImageProcessor
+
+    catalog = ImageCatalog(os.path.join('results', 'images.sqlite'))
+    ImageProcessor(catalog, number_of_processes=args.processes).run()
+    print(f'Images: {catalog.get_counts()}')
+    if args.duplicates:
+        for group in catalog.find_duplicates(args.max_distance):
+            print('    ' + ', '.join(group))
+    return 0
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='empire_scraper', description='Scraper of the Empire movie reviews')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scrape_parent = argparse.ArgumentParser(add_help=False)
+    scrape_parent.add_argument('--pages', type=parse_pages, default=None,
+                               help='e.g. 20, 5-20 or 1,2,5 (default: all pages)')
+    scrape_parent.add_argument('--article', type=int, default=None, help='only this article of every page')
+    scrape_parent.add_argument('--processors', type=int, default=1, help='number of review processes')
+    scrape_parent.add_argument('--listing-workers', type=int, default=1)
+    scrape_parent.add_argument('--threads', type=int, default=10, help='review threads per process')
+    scrape_parent.add_argument('--concurrency', type=int, default=100, help='concurrent requests per process')
+    scrape_parent.add_argument('--max-per-host', type=int, default=10,
+                               help='concurrent requests per host and process (upper bound if adaptive)')
+    scrape_parent.add_argument('--min-per-host', type=int, default=1, help='lower bound if adaptive')
+    scrape_parent.add_argument('--adaptive', action='store_true',
+                               help='adapt the concurrent requests per host to the errors and latencies (AIMD)')
+    scrape_parent.add_argument('--rate', type=float, default=10, help='requests per second')
+    scrape_parent.add_argument('--rate-per-host', type=float, default=5, help='requests per second per host')
+    scrape_parent.add_argument('--no-proxies', action='store_true')
+    scrape_parent.add_argument('--no-cache', action='store_true')
+    scrape_parent.add_argument('--cache-only', action='store_true', help='only use the cache (offline)')
+    scrape_parent.add_argument('--no-images', action='store_true')
+    scrape_parent.add_argument('--excel', action='store_true', help='also export the movies to Excel')
+    scrape_parent.add_argument('--metrics-port', type=int, default=None,
+                               help='serve the metrics in the Prometheus format on this port')
+    scrape_parent.add_argument('--progress', action='store_true', help='show a progress line')
+
+    crawl_parser = subparsers.add_parser('crawl', parents=[scrape_parent], help='scrape the reviews')
+    crawl_parser.add_argument('--incremental', action='store_true', help='only scrape new reviews')
+    crawl_parser.set_defaults(function=crawl)
+
+    resume_parser = subparsers.add_parser('resume', parents=[scrape_parent], help='continue the latest run')
+    resume_parser.set_defaults(function=resume)
+
+    retry_parser = subparsers.add_parser('retry', parents=[scrape_parent],
+                                         help='retry the retryable failures of the latest run')
+    retry_parser.set_defaults(function=retry)
+
+    export_parser = subparsers.add_parser('export', help='export a run from the store')
+    export_parser.add_argument('--run', default=None, help='default: latest run')
+    export_parser.add_argument('--format', choices=['csv', 'excel', 'json', 'parquet'], default='csv')
+    export_parser.add_argument('--output', default=None)
+    export_parser.set_defaults(function=export)
+
+    stats_parser = subparsers.add_parser('stats', help='show the statistics of a run')
+    stats_parser.add_argument('--run', default=None, help='default: latest run')
+    stats_parser.add_argument('--top', type=int, default=10, help='number of stages')
+    stats_parser.set_defaults(function=stats)
+
+    index_parser = subparsers.add_parser('index', help='add a run to the search index')
+    index_parser.add_argument('--run', default=None, help='default: latest run')
+    index_parser.add_argument('--merge', action='store_true', help='merge the segments of the index')
+    index_parser.set_defaults(function=index)
+
+    search_parser = subparsers.add_parser('search', help='search the reviews')
+    search_parser.add_argument('query', help='words and "quoted phrases"')
+    search_parser.add_argument('--limit', type=int, default=10)
+    search_parser.add_argument('--all', action='store_true', help='only reviews, which match every word and phrase')
+    search_parser.set_defaults(function=search)
+
+    images_parser = subparsers.add_parser('images', help='resize and hash the new thumbnails and pictures')
+    images_parser.add_argument('--processes', type=int, default=os.cpu_count())
+    images_parser.add_argument('--duplicates', action='store_true', help='show the groups of duplicate images')
+    images_parser.add_argument('--max-distance', type=int, default=4, help='bits, in which duplicates may differ')
+    images_parser.set_defaults(function=images)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    return args.function(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
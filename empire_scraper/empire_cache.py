@@ -0,0 +1,207 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from urllib.parse import urlsplit
+
+from empire_scraper.empire_database import SharedDatabase
+
+
+class EmpireCache(SharedDatabase):
+    """
+    Persistent on-disk HTTP response cache.
+
+    The bodies are stored content-addressed (by their SHA-256) in the objects directory and an SQLite index maps
+    every URL to its body, ETag and Last-Modified header. Entries older than the TTL of their URL class are
+    revalidated with a conditional request. The least recently used entries are evicted once the bodies exceed the
+    maximum size. In offline mode only the cache is used, whatever the age of the entries.
+    """
+
+    schema = ['CREATE TABLE IF NOT EXISTS entries (url TEXT PRIMARY KEY, digest TEXT, etag TEXT, last_modified TEXT, '
+              'url_class TEXT, stored_at REAL, accessed_at REAL)',
+              'CREATE TABLE IF NOT EXISTS objects (digest TEXT PRIMARY KEY, size INTEGER)',
+              'CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest)',
+              'CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)']
+
+    default_ttl = {
+        'listing': 6 * 3600,
+        'review': 30 * 24 * 3600,
+        'image': 365 * 24 * 3600,
+    }
+
+    def __init__(self, directory='cache', ttl=None, max_size=2 * 1024 ** 3, offline=False, evict_every=50):
+        """
+        :param directory: directory of the cache
+        :param ttl: dict with the time to live in seconds per URL class (listing, review, image)
+        :param max_size: maximum size of all bodies in bytes
+        :param offline: only use the cache and never access the network
+        :param evict_every: number of stores between two checks of the size of the cache
+        """
+        self.directory = directory
+        self.ttl = dict(self.default_ttl)
+        if ttl is not None:
+            self.ttl.update(ttl)
+        self.max_size = max_size
+        self.offline = offline
+        self.evict_every = evict_every
+        self.number_of_stores = 0
+        super().__init__(os.path.join(directory, 'index.sqlite'))
+
+    @staticmethod
+    def get_url_class(url):
+        """
+        :return: listing, review or image
+        """
+        parts = urlsplit(url)
+        if re.match(r'^/movies/reviews/\d+/?$', parts.path):
+            return 'listing'
+        if parts.netloc != 'www.empireonline.com' or re.search(r'\.(jpe?g|png|gif|webp)$', parts.path.lower()):
+            return 'image'
+        return 'review'
+
+    def __get_object_file(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    @staticmethod
+    def __link(source, target):
+        # The files are never changed in place, so a hard link is as good as a copy; copy across file systems
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+    def lookup(self, url):
+        """
+        :return: dict with the entry of the URL, including whether it is still fresh, or None
+        """
+        with self.lock:
+            row = self.connect().execute('SELECT digest, etag, last_modified, url_class, stored_at FROM entries '
+                                         'WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(['digest', 'etag', 'last_modified', 'url_class', 'stored_at'], row))
+        ttl = self.ttl.get(entry['url_class'])
+        entry['fresh'] = ttl is None or time.time() - entry['stored_at'] < ttl
+        return entry
+
+    def get_object_size(self, url):
+        """
+        :return: size of the stored body of the URL or None
+        """
+        with self.lock:
+            row = self.connect().execute('SELECT objects.size FROM entries JOIN objects ON entries.digest = '
+                                         'objects.digest WHERE entries.url = ?', (url,)).fetchone()
+        return None if row is None else row[0]
+
+    def load(self, url, entry, out_file=None):
+        """
+        :param out_file: link (or copy) the body to this file instead of reading it (used for images)
+        :return: body of the entry (bytes), out_file or None if the body has disappeared
+        """
+        object_file = self.__get_object_file(entry['digest'])
+        try:
+            if out_file is None:
+                with open(object_file, 'rb') as f:
+                    content = f.read()
+            else:
+                # The file only gets its name once it is complete
+                temp_file = f'{out_file}.{os.getpid()}.{threading.get_ident()}.part'
+                self.__link(object_file, temp_file)
+                os.replace(temp_file, out_file)
+                content = out_file
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            self.connect().execute('UPDATE entries SET accessed_at = ? WHERE url = ?', (time.time(), url))
+        return content
+
+    @staticmethod
+    def get_conditional_headers(entry):
+        headers = dict()
+        if entry is not None:
+            if entry['etag'] is not None:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified'] is not None:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def revalidate(self, url, entry, out_file=None):
+        """
+        Handle a 304 response: the entry is fresh again.
+        :return: body of the entry (bytes), out_file or None if the body has disappeared
+        """
+        with self.lock:
+            self.connect().execute('UPDATE entries SET stored_at = ? WHERE url = ?', (time.time(), url))
+        return self.load(url, entry, out_file)
+
+    def store(self, url, content, headers):
+        """
+        Store the body and the validators of a 200 response.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        out_file = self.__get_object_file(digest)
+        if not os.path.exists(out_file):
+            os.makedirs(os.path.dirname(out_file), exist_ok=True)
+            temp_file = f'{out_file}.{os.getpid()}.{threading.get_ident()}'
+            with open(temp_file, 'wb') as f:
+                f.write(content)
+            os.replace(temp_file, out_file)
+        self.__add_entry(url, digest, len(content), headers)
+
+    def store_file(self, url, file, headers):
+        """
+        Store a body, which has been streamed to a file (an image), and the validators of the 200 response. The
+        object is a hard link to the file if possible, so it takes no extra space.
+        """
+        digest = hashlib.sha256()
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        out_file = self.__get_object_file(digest)
+        if not os.path.exists(out_file):
+            os.makedirs(os.path.dirname(out_file), exist_ok=True)
+            temp_file = f'{out_file}.{os.getpid()}.{threading.get_ident()}'
+            self.__link(file, temp_file)
+            os.replace(temp_file, out_file)
+        self.__add_entry(url, digest, os.path.getsize(out_file), headers)
+
+    def __add_entry(self, url, digest, size, headers):
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            connection.execute('INSERT OR REPLACE INTO objects (digest, size) VALUES (?, ?)', (digest, size))
+            connection.execute('INSERT OR REPLACE INTO entries (url, digest, etag, last_modified, url_class, '
+                               'stored_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (url, digest, headers.get('ETag'), headers.get('Last-Modified'),
+                                self.get_url_class(url), now, now))
+            self.number_of_stores += 1
+            if self.number_of_stores % self.evict_every == 0:
+                self.__evict(connection)
+
+    def get_size(self):
+        with self.lock:
+            return self.connect().execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+
+    def __evict(self, connection):
+        size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM objects').fetchone()[0]
+        if size <= self.max_size:
+            return
+        # Evict the least recently used entries until the cache is back at 90% of its maximum size
+        target_size = 0.9 * self.max_size
+        rows = connection.execute('SELECT url, digest FROM entries ORDER BY accessed_at').fetchall()
+        for url, digest in rows:
+            if size <= target_size:
+                break
+            connection.execute('DELETE FROM entries WHERE url = ?', (url,))
+            if connection.execute('SELECT 1 FROM entries WHERE digest = ?', (digest,)).fetchone() is None:
+                object_size = connection.execute('SELECT size FROM objects WHERE digest = ?', (digest,)).fetchone()
+                connection.execute('DELETE FROM objects WHERE digest = ?', (digest,))
+                if object_size is not None:
+                    size -= object_size[0]
+                try:
+                    os.remove(self.__get_object_file(digest))
+                except FileNotFoundError:
+                    pass
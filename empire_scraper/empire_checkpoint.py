@@ -0,0 +1,118 @@
+import json
+import os
+
+
+class EmpireCheckpoint(object):
+    """
+    Append-only JSONL checkpoint with one line per finished movie. Every line is flushed as soon as the movie is
+    finished, so a crash or Ctrl-C loses at most the line that was being written; that (truncated) line is removed
+    when the checkpoint is opened again. If a movie occurs more than once, e.g. after a retry, the last line wins.
+    """
+
+    def __init__(self, file, sync_every=100):
+        """
+        :param file: path of the checkpoint
+        :param sync_every: number of movies between two fsyncs
+        """
+        self.file = file
+        self.sync_every = sync_every
+        self.f = None
+        self.number_of_movies = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['f'] = None
+        return state
+
+    def exists(self):
+        return os.path.exists(self.file)
+
+    def open(self):
+        if self.f is not None:
+            return
+        self.__repair()
+        self.f = open(self.file, 'a', encoding='utf-8')
+
+    def __repair(self):
+        # Remove a line that was cut off by a crash
+        if not self.exists():
+            return
+        with open(self.file, 'rb+') as f:
+            content = f.read()
+            if len(content) > 0 and not content.endswith(b'\n'):
+                f.truncate(content.rfind(b'\n') + 1)
+
+    def append(self, movies):
+        """
+        :param movies: dict with per ID a movie
+        """
+        for info_id, movie in movies.items():
+            self.f.write(json.dumps({'ID': info_id, 'Movie': movie}, default=str) + '\n')
+            self.number_of_movies += 1
+        self.f.flush()
+        if self.number_of_movies % self.sync_every == 0:
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        if self.f is not None:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.f.close()
+            self.f = None
+
+    def __iter_lines(self):
+        if not self.exists():
+            return
+        with open(self.file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f):
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def get_ids(self):
+        """
+        :return: set with the IDs in the checkpoint
+        """
+        return {record['ID'] for _, record in self.__iter_lines()}
+
+    def iter_movies(self, batch_size=1000, ids=None):
+        """
+        Read the movies in batches without loading the whole checkpoint.
+        :param batch_size: number of movies per batch
+        :param ids: only read these IDs (optional)
+        :return: generator, which yields dicts with per ID a movie
+        """
+        last_lines = {record['ID']: line_number for line_number, record in self.__iter_lines()}
+        batch = dict()
+        for line_number, record in self.__iter_lines():
+            if last_lines[record['ID']] != line_number or (ids is not None and record['ID'] not in ids):
+                continue
+            batch[record['ID']] = record['Movie']
+            if len(batch) >= batch_size:
+                yield batch
+                batch = dict()
+        if len(batch) > 0:
+            yield batch
+
+    def get_movies(self, ids=None):
+        """
+        :return: dict with the (requested) movies
+        """
+        movies = dict()
+        for batch in self.iter_movies(ids=ids):
+            movies.update(batch)
+        return movies
+
+
+def get_latest_checkpoint_file(directory='results'):
+    """
+    :return: run and path of the most recent checkpoint or (None, None)
+    """
+    if not os.path.exists(directory):
+        return None, None
+    for now in sorted(os.listdir(directory), reverse=True):
+        checkpoint_file = os.path.join(directory, now, f'{now}_checkpoint.jsonl')
+        if os.path.exists(checkpoint_file):
+            return now, checkpoint_file
+    return None, None
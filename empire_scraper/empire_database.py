@@ -0,0 +1,49 @@
+import os
+import sqlite3
+import threading
+
+
+class SharedDatabase(object):
+    """
+    SQLite database, which is shared by all processes of a crawl (e.g. the cache, the error ledger, the frontier and
+    the task queue of a distributed crawl). Every process has its own connection, which is shared by its threads and
+    opened on first use, so only the path travels to other processes. The statements in schema create the tables.
+    """
+
+    schema = []
+
+    def __init__(self, file):
+        """
+        :param file: path of the SQLite database
+        """
+        self.file = file
+        self.connection = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['connection'], state['pid'], state['lock'] = None, None, None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.connection is None or self.pid != os.getpid():
+            directory = os.path.dirname(self.file)
+            if directory != '':
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.file, timeout=60, check_same_thread=False, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            for statement in self.schema:
+                self.connection.execute(statement)
+            self.pid = os.getpid()
+        return self.connection
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.pid == os.getpid():
+                self.connection.close()
+            self.connection = None
@@ -0,0 +1,485 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+
+from empire_scraper.empire_database import SharedDatabase
+from empire_scraper.empire_frontier import normalize_url
+from empire_scraper.empire_images import ImageDownloader, get_image_downloader
+from empire_scraper.empire_ledger import ErrorLedger
+from empire_scraper.empire_movies import EmpireMovies
+from empire_scraper.empire_profiler import get_profiler
+
+
+class TaskQueue(SharedDatabase):
+    """
+    Work queue of a distributed crawl with page and review tasks.
+
+    A worker leases a task for visibility_timeout seconds; if it does not complete the task in time (e.g. because
+    the node died), the task becomes visible again for other workers. A task, which has been leased max_attempts
+    times without success, is failed. Tasks are unique by key, so a review, which is found on two listing pages,
+    is only queued once. Review tasks go before page tasks, so the discovered reviews are finished first.
+    """
+
+    schema = ['CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, key TEXT UNIQUE, kind TEXT, '
+              'priority INTEGER, payload TEXT, state TEXT, worker TEXT, attempts INTEGER, lease_until REAL, '
+              'updated_at REAL)',
+              'CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, kind, priority)',
+              'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)']
+
+    def __init__(self, file, visibility_timeout=300, max_attempts=3):
+        super().__init__(file)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    def publish(self, kind, tasks):
+        """
+        :param kind: page or review
+        :param tasks: list of tuples with key, priority and payload (JSON serializable)
+        :return: number of new tasks
+        """
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            cursor = connection.executemany(
+                "INSERT OR IGNORE INTO tasks (key, kind, priority, payload, state, attempts, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', 0, ?)",
+                [(key, kind, priority, json.dumps(payload), now) for key, priority, payload in tasks])
+        return cursor.rowcount
+
+    def lease(self, worker):
+        """
+        :param worker: name of the worker
+        :return: dict with the id, kind and payload of a task or None if there is nothing to do right now
+        """
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                # Tasks, whose lease expired too often, are failed
+                connection.execute("UPDATE tasks SET state = 'failed', updated_at = ? WHERE state = 'leased' AND "
+                                   "lease_until < ? AND attempts >= ?", (now, now, self.max_attempts))
+                row = connection.execute(
+                    "SELECT id, kind, payload, attempts FROM tasks WHERE state = 'queued' OR "
+                    "(state = 'leased' AND lease_until < ?) ORDER BY kind = 'page', priority, id LIMIT 1",
+                    (now,)).fetchone()
+                if row is not None:
+                    connection.execute("UPDATE tasks SET state = 'leased', worker = ?, attempts = attempts + 1, "
+                                       "lease_until = ?, updated_at = ? WHERE id = ?",
+                                       (worker, now + self.visibility_timeout, now, row[0]))
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+        if row is None:
+            return None
+        return {'id': row[0], 'kind': row[1], 'payload': json.loads(row[2]), 'attempts': row[3] + 1}
+
+    def complete(self, task_id):
+        with self.lock:
+            self.connect().execute("UPDATE tasks SET state = 'done', updated_at = ? WHERE id = ?",
+                                   (time.time(), task_id))
+
+    def fail(self, task_id, attempts):
+        """
+        Make a task visible again or fail it after max_attempts.
+        """
+        state = 'queued' if attempts < self.max_attempts else 'failed'
+        with self.lock:
+            self.connect().execute('UPDATE tasks SET state = ?, updated_at = ? WHERE id = ?',
+                                   (state, time.time(), task_id))
+
+    def clear(self):
+        """
+        Remove all tasks and the meta data, e.g. of a previous crawl.
+        """
+        with self.lock:
+            connection = self.connect()
+            connection.execute('DELETE FROM tasks')
+            connection.execute('DELETE FROM meta')
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.connect().execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.connect().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def get_counts(self):
+        """
+        :return: dict with per kind a dict with the number of tasks per state
+        """
+        with self.lock:
+            rows = self.connect().execute('SELECT kind, state, COUNT(*) FROM tasks GROUP BY kind, state').fetchall()
+        counts = dict()
+        for kind, state, count in rows:
+            counts.setdefault(kind, dict())[state] = count
+        return counts
+
+    def is_finished(self):
+        """
+        :return: whether all pages have been published and no task is queued or leased
+        """
+        if not self.get_meta('closed', False):
+            return False
+        with self.lock:
+            row = self.connect().execute("SELECT COUNT(*) FROM tasks WHERE state IN ('queued', 'leased')").fetchone()
+        return row[0] == 0
+
+
+class ResultStore(SharedDatabase):
+    """
+    Shared store of the finished movies and of the statistics of the workers of a distributed crawl.
+    """
+
+    schema = ['CREATE TABLE IF NOT EXISTS results (id TEXT PRIMARY KEY, movie TEXT, worker TEXT, finished_at REAL)',
+              'CREATE TABLE IF NOT EXISTS workers (worker TEXT PRIMARY KEY, host TEXT, pages INTEGER, '
+              'reviews INTEGER, failures INTEGER, started_at REAL, heartbeat_at REAL, profile TEXT)']
+
+    def put(self, movies, worker):
+        """
+        :param movies: dict with per ID a movie
+        """
+        now = time.time()
+        with self.lock:
+            self.connect().executemany('INSERT OR REPLACE INTO results (id, movie, worker, finished_at) '
+                                       'VALUES (?, ?, ?, ?)',
+                                       [(info_id, json.dumps(movie, default=str), worker, now)
+                                        for info_id, movie in movies.items()])
+
+    def iter_movies(self, batch_size=1000):
+        """
+        :return: generator, which yields dicts with per ID a movie
+        """
+        last_id = ''
+        while True:
+            with self.lock:
+                rows = self.connect().execute('SELECT id, movie FROM results WHERE id > ? ORDER BY id LIMIT ?',
+                                              (last_id, batch_size)).fetchall()
+            if len(rows) == 0:
+                return
+            yield {info_id: json.loads(movie) for info_id, movie in rows}
+            last_id = rows[-1][0]
+
+    def __len__(self):
+        with self.lock:
+            return self.connect().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def clear(self):
+        """
+        Remove all results and workers, e.g. of a previous crawl.
+        """
+        with self.lock:
+            connection = self.connect()
+            connection.execute('DELETE FROM results')
+            connection.execute('DELETE FROM workers')
+
+    def register(self, worker):
+        now = time.time()
+        with self.lock:
+            self.connect().execute('INSERT OR REPLACE INTO workers (worker, host, pages, reviews, failures, '
+                                   'started_at, heartbeat_at) VALUES (?, ?, 0, 0, 0, ?, ?)',
+                                   (worker, socket.gethostname(), now, now))
+
+    def report(self, worker, pages=0, reviews=0, failures=0, profile=None):
+        """
+        Add to the counters of a worker and update its heartbeat.
+        """
+        with self.lock:
+            self.connect().execute('UPDATE workers SET pages = pages + ?, reviews = reviews + ?, '
+                                   'failures = failures + ?, heartbeat_at = ?, profile = COALESCE(?, profile) '
+                                   'WHERE worker = ?',
+                                   (pages, reviews, failures, time.time(),
+                                    None if profile is None else json.dumps(profile), worker))
+
+    def get_workers(self):
+        """
+        :return: list with a dict per worker
+        """
+        columns = ['worker', 'host', 'pages', 'reviews', 'failures', 'started_at', 'heartbeat_at', 'profile']
+        with self.lock:
+            rows = self.connect().execute(f'SELECT {", ".join(columns)} FROM workers ORDER BY worker').fetchall()
+        workers = [dict(zip(columns, row)) for row in rows]
+        for worker in workers:
+            worker['profile'] = None if worker['profile'] is None else json.loads(worker['profile'])
+        return workers
+
+
+def get_shared_files(directory):
+    os.makedirs(directory, exist_ok=True)
+    return (os.path.join(directory, 'tasks.sqlite'), os.path.join(directory, 'results.sqlite'),
+            os.path.join(directory, 'errors.sqlite'))
+
+
+def get_shared_image_file(directory, file):
+    """
+    :param file: path of an image on a node, e.g. thumbnails/name.jpg
+    :return: path of the image in the shared directory
+    """
+    return os.path.join(directory, 'images', os.path.basename(os.path.dirname(file)), os.path.basename(file))
+
+
+def copy_file(source, target):
+    # The file only gets its name once it is complete, so a reader never sees half an image
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp_file = f'{target}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.part'
+    shutil.copyfile(source, temp_file)
+    os.replace(temp_file, target)
+
+
+class EmpireCoordinator(object):
+    """
+    Publishes the listing pages of a crawl to the shared task queue, reports the progress of all workers and
+    collects the results in the checkpoint and the store of the run.
+
+    A shared directory holds one crawl at a time, which is identified by the run of the coordinator: the tasks are
+    unique by key, so a second crawl in the same directory would publish no tasks and collect the results of the
+    previous one. It has to be reset first.
+    """
+
+    def __init__(self, empire_movies, directory='shared', visibility_timeout=300, max_attempts=3):
+        self.empire_movies = empire_movies
+        self.directory = directory
+        tasks_file, results_file, errors_file = get_shared_files(directory)
+        self.tasks = TaskQueue(tasks_file, visibility_timeout, max_attempts)
+        self.results = ResultStore(results_file)
+        self.ledger = ErrorLedger(errors_file)
+
+    def get_crawl(self):
+        """
+        :return: run of the crawl in the shared directory or None if it is empty
+        """
+        crawl = self.tasks.get_meta('crawl')
+        if crawl is None and (self.tasks.get_meta('closed', False) or len(self.results) > 0):
+            # Queue of an older version without a crawl
+            crawl = 'unknown'
+        return crawl
+
+    def reset(self):
+        """
+        Remove the tasks, the results, the failures and the images of the previous crawl in the shared directory.
+        """
+        logging.getLogger('root').info(f'ResetSharedDirectory|{self.get_crawl()}|{self.directory}')
+        self.tasks.clear()
+        self.results.clear()
+        self.ledger.clear()
+        shutil.rmtree(os.path.join(self.directory, 'images'), ignore_errors=True)
+
+    def publish(self, pages=None, reset=False):
+        """
+        :param pages: page, iterable of pages or None for all pages
+        :param reset: remove the previous crawl in the shared directory first instead of refusing to publish
+        :return: number of new page tasks
+        """
+        logger = logging.getLogger('root')
+        crawl = self.get_crawl()
+        if crawl is not None and crawl != self.empire_movies.now:
+            if not reset:
+                raise RuntimeError(f'The shared directory {self.directory} holds crawl {crawl}; collect it and '
+                                   f'reset the directory or use another one for a new crawl')
+            self.reset()
+        self.tasks.set_meta('crawl', self.empire_movies.now)
+        pages = self.empire_movies.get_pages(pages)
+        number_of_tasks = self.tasks.publish('page', [(f'page:{page}', page, page) for page in pages])
+        # Workers only stop once all pages are published
+        self.tasks.set_meta('closed', True)
+        logger.info(f'PublishedPages|{number_of_tasks}|{len(pages)} pages')
+        return number_of_tasks
+
+    def get_progress(self):
+        """
+        :return: dict with the counts of the tasks, the number of results and the statistics per worker
+        """
+        workers = []
+        for worker in self.results.get_workers():
+            worker.pop('profile')
+            worker['alive'] = time.time() - worker['heartbeat_at'] < self.tasks.visibility_timeout
+            workers.append(worker)
+        return {'tasks': self.tasks.get_counts(),
+                'results': len(self.results),
+                'errors': len(self.ledger),
+                'workers': workers}
+
+    def wait(self, poll=10):
+        """
+        Log the progress until all tasks are finished.
+        """
+        logger = logging.getLogger('root')
+        start = time.time()
+        while not self.tasks.is_finished():
+            progress = self.get_progress()
+            reviews = progress['tasks'].get('review', dict())
+            pages = progress['tasks'].get('page', dict())
+            alive = sum(worker['alive'] for worker in progress['workers'])
+            elapsed = max(time.time() - start, 1e-9)
+            logger.info(f'Progress|pages {pages.get("done", 0)}/{sum(pages.values())}|'
+                        f'reviews {reviews.get("done", 0)}/{sum(reviews.values())}, {alive} workers, '
+                        f'{progress["results"] / elapsed:.1f} reviews/s')
+            time.sleep(poll)
+
+    def collect_images(self):
+        """
+        Copy the images, which the workers have shared, to the image directories of this node.
+        :return: number of copied images
+        """
+        number_of_images = 0
+        images_directory = os.path.join(self.directory, 'images')
+        if not os.path.exists(images_directory):
+            return 0
+        for directory in os.listdir(images_directory):
+            for name in os.listdir(os.path.join(images_directory, directory)):
+                file = os.path.join(directory, name)
+                if name.endswith('.part') or ImageDownloader.exists(file):
+                    continue
+                copy_file(os.path.join(images_directory, directory, name), file)
+                number_of_images += 1
+        return number_of_images
+
+    def collect(self):
+        """
+        Copy the results to the checkpoint, the search index and the store of the run and merge the profiles of the
+        workers. The images are copied from the shared directory, so their paths are kept in the store.
+        :return: number of movies
+        """
+        logger = logging.getLogger('root')
+        crawl = self.get_crawl()
+        if crawl != self.empire_movies.now:
+            raise RuntimeError(f'The shared directory {self.directory} holds crawl {crawl}, not '
+                               f'{self.empire_movies.now}')
+        number_of_movies = 0
+        self.empire_movies.checkpoint.open()
+        try:
+            for movies in self.results.iter_movies():
+                self.empire_movies.checkpoint.append(movies)
+                self.empire_movies.search_index.add_movies(movies, run=self.empire_movies.now)
+                number_of_movies += len(movies)
+        finally:
+            self.empire_movies.checkpoint.close()
+            self.empire_movies.search_index.commit()
+        for worker in self.results.get_workers():
+            if worker['profile'] is not None:
+                get_profiler().merge(worker['profile'])
+        logger.info(f'CollectedImages|{self.collect_images()}|')
+        self.empire_movies.process_images_in_pool()
+        self.empire_movies.save_to_store()
+        self.empire_movies.save_profile()
+        logger.info(f'Collected|{number_of_movies}|{len(self.results.get_workers())} workers')
+        return number_of_movies
+
+
+class EmpireWorker(object):
+    """
+    Worker of a distributed crawl, which runs on any node with access to the shared directory. Its threads lease
+    tasks: a page task turns into review tasks, a review task into a result. All proxies, the cache and the fetch
+    engine are those of the node. The images of a task are copied to the shared directory before the task is
+    completed, so the coordinator finds them all once the crawl is finished.
+    """
+
+    def __init__(self, empire_movies, directory='shared', number_of_threads=10, poll=2, name=None):
+        self.empire_movies = empire_movies
+        self.directory = directory
+        self.number_of_threads = number_of_threads
+        self.poll = poll
+        self.name = name if name is not None else f'{socket.gethostname()}-{os.getpid()}'
+        tasks_file, results_file, errors_file = get_shared_files(directory)
+        self.tasks = TaskQueue(tasks_file)
+        self.results = ResultStore(results_file)
+        # Failures of all nodes end up in the shared error ledger
+        self.empire_movies.ledger = ErrorLedger(errors_file)
+
+    def share_images(self, files):
+        """
+        Wait for the downloads of the images and copy them to the shared directory.
+        :param files: paths of images on this node
+        """
+        files = [file for file in files if file is not None]
+        get_image_downloader().wait(files)
+        for file in files:
+            shared_file = get_shared_image_file(self.directory, file)
+            if ImageDownloader.exists(file) and not os.path.exists(shared_file):
+                copy_file(file, shared_file)
+
+    def process_page(self, page, logger):
+        infos = self.empire_movies.get_infos_for_page(page, logger=logger)
+        if infos is None:
+            return 0
+        self.share_images([(info[info_id]['InfoThumbnail'] or {}).get('File') for info_id, info in infos.items()])
+        tasks = []
+        for info_id, info in infos.items():
+            review_url = info[info_id]['InfoReviewUrl']
+            key = f'review:{normalize_url(review_url) if review_url is not None else info_id}'
+            tasks.append((key, self.empire_movies.frontier.get_priority(info), info))
+        return self.tasks.publish('review', tasks)
+
+    def process_review(self, info, logger):
+        movie, _ = self.empire_movies.get_movie_for_info(info, logger)
+        # The thumbnail has been shared by the page task
+        self.share_images([(value.get('Picture') or {}).get('File') for value in movie.values()])
+        self.results.put(movie, self.name)
+
+    def consume(self):
+        while True:
+            task = self.tasks.lease(self.name)
+            if task is None:
+                if self.tasks.is_finished():
+                    return
+                time.sleep(self.poll)
+                continue
+            logger = logging.getLogger(f'{self.name}-{threading.current_thread().name}')
+            # noinspection PyBroadException
+            try:
+                if task['kind'] == 'page':
+                    self.process_page(task['payload'], logger)
+                    self.results.report(self.name, pages=1)
+                else:
+                    self.process_review(task['payload'], logger)
+                    self.results.report(self.name, reviews=1)
+                self.tasks.complete(task['id'])
+            except Exception as e:
+                logger.error(f'TaskFailed|{task["id"]}|{str(e)}')
+                self.tasks.fail(task['id'], task['attempts'])
+                self.results.report(self.name, failures=1)
+
+    def run(self):
+        logger = logging.getLogger('root')
+        logger.info(f'StartWorker|{self.name}|{self.number_of_threads} threads')
+        self.results.register(self.name)
+        threads = [threading.Thread(target=self.consume, name=f'worker{i}') for i in range(self.number_of_threads)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        get_image_downloader().wait()
+        self.results.report(self.name, profile=get_profiler().drain())
+        logger.info(f'StopWorker|{self.name}|')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distributed crawl with a shared task queue')
+    parser.add_argument('role', choices=['coordinator', 'worker'])
+    parser.add_argument('--directory', default='shared', help='shared directory with the task queue and results')
+    parser.add_argument('--pages', type=int, default=None, help='number of pages (default: all pages)')
+    parser.add_argument('--threads', type=int, default=10)
+    parser.add_argument('--no-proxies', action='store_true')
+    parser.add_argument('--reset', action='store_true',
+                        help='coordinator: remove the previous crawl in the shared directory')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s|%(levelname)s|%(message)s')
+    empire_movies = EmpireMovies(use_proxies=not args.no_proxies, max_concurrency=args.threads)
+    if args.role == 'coordinator':
+        coordinator = EmpireCoordinator(empire_movies, args.directory)
+        coordinator.publish(None if args.pages is None else range(1, args.pages + 1), reset=args.reset)
+        coordinator.wait()
+        coordinator.collect()
+    else:
+        EmpireWorker(empire_movies, args.directory, number_of_threads=args.threads).run()
+
+
+if __name__ == '__main__':
+    main()
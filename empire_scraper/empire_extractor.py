@@ -0,0 +1,104 @@
+import threading
+
+from bs4.dammit import EncodingDetector
+from lxml import etree, html as lxml_html
+
+
+def _class_matches(expression):
+    # Same semantics as BeautifulSoup's class_: one of the classes or the complete (normalized) class attribute
+    return f'(contains(concat(" ", normalize-space(@class), " "), " {expression} ") ' \
+           f'or normalize-space(@class) = "{expression}")'
+
+
+class ReviewExtractor(object):
+    """
+    Single-pass extraction of all fields of a review page.
+
+    Instead of one BeautifulSoup find per field over the complete tree, the page is parsed by lxml and a single
+    compiled XPath union collects all relevant elements in document order. Only the small subtrees of those elements
+    are inspected afterwards.
+    """
+
+    xpath = etree.XPath(' | '.join([
+        f'//div[{_class_matches("author")}]',
+        '//time',
+        f'//ul[{_class_matches("list__keyline delta txt--mid-grey")}]',
+        f'//span[{_class_matches("stars--on")}]',
+        f'//h2[{_class_matches("gamma gamma--tall txt--black")}]',
+        f'//div[{_class_matches("article__text")}]',
+        f'//div[{_class_matches("imageWrapper imageWrapper--kenburns")}]',
+    ]))
+
+    def __init__(self):
+        # lxml parsers must not be shared by threads, so every thread has its own parser per encoding
+        self.local = threading.local()
+
+    def get_parser(self, encoding):
+        parsers = self.local.__dict__.setdefault('parsers', dict())
+        if encoding not in parsers:
+            parsers[encoding] = lxml_html.HTMLParser(encoding=encoding)
+        return parsers[encoding]
+
+    @staticmethod
+    def detect_encoding(html):
+        """
+        Same choice as BeautifulSoup: the declared encoding (<meta charset>) or else the guess of the character
+        detection, then UTF-8.
+        :return: content without a byte order mark and its encoding
+        """
+        if isinstance(html, str):
+            return html, None
+        detector = EncodingDetector(html, is_html=True)
+        return detector.markup, next(iter(detector.encodings), None)
+
+    @staticmethod
+    def __get_classes(element):
+        return ' '.join(element.get('class', '').split())
+
+    def extract(self, html):
+        """
+        :param html: content of the review page (bytes)
+        :return: dict with the raw fields of the review
+        """
+        html, encoding = self.detect_encoding(html)
+        root = lxml_html.document_fromstring(html, parser=self.get_parser(encoding))
+        fields = {
+            'Author': None,
+            'DatePublished': None,
+            'LastUpdate': None,
+            'Info': None,
+            'Rating': None,
+            'Introduction': None,
+            'Paragraphs': None,
+            'PictureSource': None,
+        }
+        picture_wrapper_found = False
+        for element in self.xpath(root):
+            tag, classes = element.tag, self.__get_classes(element)
+            if tag == 'time':
+                if fields['DatePublished'] is None and 'datePublished' in classes.split():
+                    fields['DatePublished'] = element.get('datetime', '').strip()[:10]
+                if element.find('.//strong') is not None:
+                    fields['LastUpdate'] = element.get('datetime', '').strip()[:10]
+            elif tag == 'div' and 'author' in classes.split():
+                if fields['Author'] is None:
+                    fields['Author'] = element.text_content().strip()
+            elif tag == 'ul':
+                if fields['Info'] is None:
+                    fields['Info'] = '|'.join(element.itertext()).split('|')
+            elif tag == 'span':
+                if fields['Rating'] is None:
+                    fields['Rating'] = len(element.text_content().strip())
+            elif tag == 'h2':
+                if fields['Introduction'] is None:
+                    fields['Introduction'] = element.text_content().strip()
+            elif tag == 'div' and 'article__text' in classes.split():
+                if fields['Paragraphs'] is None:
+                    fields['Paragraphs'] = [p.text_content().strip() for p in element.iter('p')]
+            elif tag == 'div':
+                if not picture_wrapper_found:
+                    picture_wrapper_found = True
+                    img = element.find('.//img')
+                    if img is not None:
+                        fields['PictureSource'] = img.get('src')
+        return fields
@@ -0,0 +1,410 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from empire_scraper.empire_cache import EmpireCache
+from empire_scraper.empire_profiler import get_profiler
+from empire_scraper.empire_proxies import ProxyScheduler
+from empire_scraper.empire_ratelimit import AdaptiveLimiter, RateLimiter, get_backoff, parse_retry_after
+from empire_scraper.empire_sessions import SessionPool
+
+
+class EmpireFetcher(object):
+    """
+    Asyncio based fetch engine for listing pages, review pages and images.
+
+    The event loop runs in a background thread, so the (synchronous) scraper code can hand over any number of
+    URLs and wait for the results. The blocking requests calls run in a thread pool, which is bounded by a
+    global concurrency limit and a per-host concurrency limit.
+    """
+
+    def __init__(self, logger=None, proxies=None, max_concurrency=100, max_per_host=10, timeout=5,
+                 max_number_of_attempts=5, pool_connections=10, pool_maxsize=None, cache=None, rate=None,
+                 rate_per_host=None, burst=None, deadline=60, backoff=0.5, max_backoff=30, max_downloads=8,
+                 transport=None, recorder=None, metrics=None, adaptive=False, min_per_host=1):
+        self.logger = logger if logger is not None else logging.getLogger('root')
+        self.proxies = proxies
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        # Adaptive: the concurrency per host is an AIMD limit between min_per_host and max_per_host, which follows
+        # the failures and latencies of the host
+        self.adaptive = adaptive
+        self.min_per_host = min_per_host
+        # Image downloads have their own (smaller) pool, so they never take the slots of the pages
+        self.max_downloads = max_downloads
+        self.timeout = timeout
+        self.max_number_of_attempts = max_number_of_attempts
+        # Politeness: token buckets (requests per second, None is unlimited) instead of fixed sleeps, jittered
+        # exponential backoff after failures and a time budget in seconds per fetch
+        self.rate = rate
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.rate_limiter = None
+        self.deadline = deadline
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # Keep-alive sessions per (proxy, host); keep at least one connection per concurrent request to a host
+        self.sessions = SessionPool(pool_connections=pool_connections,
+                                    pool_maxsize=max_per_host if pool_maxsize is None else pool_maxsize,
+                                    transport=transport)
+        # Optional FixtureArchive, in which all responses from the network are recorded
+        self.recorder = recorder
+        # Optional EmpireCache for conditional requests and offline re-parsing
+        self.cache = cache
+        # Optional CrawlMetrics, which are shared with the other processes
+        self.metrics = metrics
+        self.pid = os.getpid()
+        self.loop = None
+        self.thread = None
+        self.executor = None
+        self.download_executor = None
+        self.semaphore = None
+        self.download_semaphore = None
+        self.host_semaphores = dict()
+        self.lock = threading.Lock()
+        # Details of the failed fetches per URL, which are picked up by the caller for the error ledger
+        self.failures = dict()
+
+    def start(self):
+        """
+        Start the event loop thread (only once).
+        """
+        with self.lock:
+            if self.loop is not None:
+                return
+            self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='fetch')
+            self.download_executor = ThreadPoolExecutor(max_workers=self.max_downloads, thread_name_prefix='download')
+            self.loop = asyncio.new_event_loop()
+            self.loop.set_default_executor(self.executor)
+            self.thread = threading.Thread(target=self.loop.run_forever, name='fetcher', daemon=True)
+            self.thread.start()
+            asyncio.run_coroutine_threadsafe(self.__create_semaphore(), self.loop).result()
+
+    def close(self):
+        with self.lock:
+            if self.loop is None:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.executor.shutdown(wait=False)
+            self.download_executor.shutdown(wait=False)
+            self.sessions.close()
+            for host_semaphore in self.host_semaphores.values():
+                if isinstance(host_semaphore, AdaptiveLimiter):
+                    self.__slots_changed(int(host_semaphore.limit), 0)
+            if self.cache is not None:
+                self.cache.close()
+            self.loop, self.thread, self.executor, self.semaphore = None, None, None, None
+            self.download_executor, self.download_semaphore, self.rate_limiter = None, None, None
+            self.host_semaphores = dict()
+
+    async def __create_semaphore(self):
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.download_semaphore = asyncio.Semaphore(self.max_downloads)
+        self.rate_limiter = RateLimiter(self.rate, self.rate_per_host, self.burst)
+
+    def __get_host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.host_semaphores:
+            if self.adaptive:
+                self.host_semaphores[host] = AdaptiveLimiter(self.min_per_host, self.max_per_host,
+                                                             on_change=self.__slots_changed)
+            else:
+                self.host_semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self.host_semaphores[host]
+
+    def __slots_changed(self, old, new):
+        if self.metrics is not None:
+            self.metrics.inc('fetch_slots', new - old)
+            if new < old:
+                self.metrics.inc('slot_decreases')
+
+    @staticmethod
+    def __report_host(host_semaphore, url, start, status, latency=None):
+        # 429, 5xx and exceptions are signs of overload; only 2xx responses count as successes and their latency is
+        # only compared within the URL class, as a 404 or a listing page says nothing about the latency of a review
+        if not isinstance(host_semaphore, AdaptiveLimiter):
+            return
+        if status is None or status == 429 or status >= 500:
+            host_semaphore.report(start, False)
+        elif 200 <= status < 300:
+            host_semaphore.report(start, True, latency, EmpireCache.get_url_class(url))
+
+    def __request(self, url, timeout, proxy, headers):
+        url_class = EmpireCache.get_url_class(url)
+        profiler = get_profiler()
+        with profiler.stage(f'download.{url_class}'):
+            result = self.sessions.get(url, timeout=timeout, proxy=proxy, headers=headers)
+        profiler.record(f'ttfb.{url_class}', result.elapsed.total_seconds())
+        profiler.record(f'bytes.{url_class}', len(result.content))
+        if self.recorder is not None and result.status_code == 200:
+            self.recorder.save(url, result.status_code, result.headers, result.content)
+        return result
+
+    @staticmethod
+    def get_expected_size(headers):
+        """
+        :return: size of the body according to Content-Length or None if unknown; the size of a compressed body is
+            not the size of the file
+        """
+        if headers.get('Content-Encoding', 'identity') != 'identity':
+            return None
+        try:
+            return int(headers['Content-Length'])
+        except (KeyError, ValueError):
+            return None
+
+    def __download(self, url, timeout, proxy, headers, out_file):
+        """
+        Stream the body straight to disk. The file only gets its name once it is complete, i.e. once it has the size
+        of Content-Length; a truncated body is an error, so it is retried.
+        """
+        profiler = get_profiler()
+        with profiler.stage('download.image'):
+            result = self.sessions.get(url, timeout=timeout, proxy=proxy, headers=headers, stream=True)
+            try:
+                if result.status_code == 200:
+                    temp_file = f'{out_file}.{os.getpid()}.{threading.get_ident()}.part'
+                    size = 0
+                    try:
+                        with profiler.stage('image_write.stream'):
+                            with open(temp_file, 'wb') as f:
+                                for chunk in result.iter_content(chunk_size=64 * 1024):
+                                    f.write(chunk)
+                                    size += len(chunk)
+                        expected_size = self.get_expected_size(result.headers)
+                        if expected_size is not None and size != expected_size:
+                            raise RuntimeError(f'Incomplete download of {size} of {expected_size} bytes')
+                        os.replace(temp_file, out_file)
+                        if self.recorder is not None:
+                            with open(out_file, 'rb') as f:
+                                self.recorder.save(url, result.status_code, result.headers, f.read())
+                    finally:
+                        if os.path.exists(temp_file):
+                            os.remove(temp_file)
+                    profiler.record('bytes.image', size)
+            finally:
+                result.close()
+        return result
+
+    @staticmethod
+    def __choose_proxy(proxies):
+        """
+        :param proxies: ProxyScheduler or list of proxies
+        :return: index (only for a ProxyScheduler) and proxy
+        """
+        if isinstance(proxies, ProxyScheduler):
+            return proxies.choose()
+        return None, random.choice(proxies) if proxies else None
+
+    @staticmethod
+    def __report_proxy(logger, proxies, index, success, latency=None):
+        if isinstance(proxies, ProxyScheduler) and index is not None:
+            quarantine = proxies.report(index, success, latency)
+            if quarantine is not None:
+                logger.info(f'ProxyQuarantined|{list(proxies.proxies[index].values())[0]}|{quarantine:.0f}s')
+
+    def __count(self, name, value=1):
+        if self.metrics is not None:
+            self.metrics.inc(name, value)
+
+    def __count_attempt(self, number_of_attempts, proxy, success, latency):
+        if self.metrics is None:
+            return
+        self.metrics.inc('requests')
+        self.metrics.inc('request_seconds', latency)
+        if number_of_attempts > 1:
+            self.metrics.inc('retries')
+        if not success:
+            self.metrics.inc('request_errors')
+        if proxy is not None:
+            self.metrics.inc('proxy_requests')
+            if not success:
+                self.metrics.inc('proxy_errors')
+
+    def __record_failure(self, url, status, number_of_attempts, error_class):
+        self.__count('failures')
+        with self.lock:
+            self.failures[url] = {'status': status, 'attempts': number_of_attempts, 'error_class': error_class}
+
+    def pop_failure(self, url):
+        """
+        :return: dict with the status, the number of attempts and the error class of the last failed fetch of a URL
+        or None
+        """
+        with self.lock:
+            return self.failures.pop(url, None)
+
+    async def fetch(self, url, logger=None, max_number_of_attempts=None, timeout=None, proxies=None, out_file=None):
+        """
+        Fetch a URL with retries.
+        :param url: URL to fetch
+        :param logger: logger of the caller (defaults to the logger of the fetcher)
+        :param max_number_of_attempts: maximum number of attempts (defaults to the setting of the fetcher)
+        :param timeout: timeout per attempt in seconds (defaults to the setting of the fetcher)
+        :param proxies: ProxyScheduler or list of proxies (defaults to the proxies of the fetcher, an empty list
+        disables them)
+        :param out_file: stream the body to this file instead of returning it (used for images)
+        :return: content of the response (bytes), out_file or -1 if the request failed
+        """
+        logger = logger if logger is not None else self.logger
+        max_number_of_attempts = max_number_of_attempts or self.max_number_of_attempts
+        timeout = timeout or self.timeout
+        proxies = self.proxies if proxies is None else proxies
+
+        # Fresh cache entries (or any entry in offline mode) do not need a request; images are linked from the cache
+        entry, headers = None, None
+        if self.cache is not None:
+            entry = await self.loop.run_in_executor(None, self.cache.lookup, url)
+            if entry is not None and (entry['fresh'] or self.cache.offline):
+                content = await self.loop.run_in_executor(None, self.cache.load, url, entry, out_file)
+                if content is not None:
+                    self.__count('cache_hits')
+                    return content
+                entry = None
+            if self.cache.offline:
+                logger.error(f'CacheMiss|#0|{url}')
+                self.__record_failure(url, None, 0, 'CacheMiss')
+                return -1
+            headers = self.cache.get_conditional_headers(entry)
+
+        number_of_attempts = 0
+        status, error_class = None, None
+        deadline = None if self.deadline is None else time.monotonic() + self.deadline
+        while number_of_attempts < max_number_of_attempts:
+            number_of_attempts += 1
+            await self.rate_limiter.acquire(url)
+            attempt_timeout = timeout if deadline is None else max(min(timeout, deadline - time.monotonic()), 0.1)
+            index, proxy = self.__choose_proxy(proxies)
+            retry_after = None
+            # noinspection PyBroadException
+            try:
+                # The slots are only held while the request is in flight, not while waiting
+                semaphore = self.semaphore if out_file is None else self.download_semaphore
+                host_semaphore = self.__get_host_semaphore(url)
+                async with semaphore, host_semaphore:
+                    start = time.perf_counter()
+                    try:
+                        if out_file is None:
+                            result = await self.loop.run_in_executor(None, self.__request, url, attempt_timeout,
+                                                                     proxy, headers)
+                        else:
+                            result = await self.loop.run_in_executor(self.download_executor, self.__download, url,
+                                                                     attempt_timeout, proxy, headers, out_file)
+                    except Exception:
+                        self.__report_proxy(logger, proxies, index, False)
+                        self.__count_attempt(number_of_attempts, proxy, False, time.perf_counter() - start)
+                        self.__report_host(host_semaphore, url, start, None)
+                        raise
+                # The proxy did its job if the server answered
+                latency = time.perf_counter() - start
+                self.__report_host(host_semaphore, url, start, result.status_code, latency)
+                self.__report_proxy(logger, proxies, index, result.status_code in [200, 304, 404], latency)
+                self.__count_attempt(number_of_attempts, proxy, result.status_code in [200, 304, 404], latency)
+                status, error_class = result.status_code, 'HTTPError'
+
+                # Inspect result
+                if result.status_code == 200:
+                    if number_of_attempts > 1:
+                        logger.info(f'SuccessfulAttempt|#{number_of_attempts}|{url}')
+                    if out_file is not None:
+                        if self.cache is not None:
+                            await self.loop.run_in_executor(None, self.cache.store_file, url, out_file,
+                                                            result.headers)
+                        return out_file
+                    if self.cache is not None:
+                        await self.loop.run_in_executor(None, self.cache.store, url, result.content, result.headers)
+                    return result.content
+                elif result.status_code == 304 and entry is not None:
+                    content = await self.loop.run_in_executor(None, self.cache.revalidate, url, entry, out_file)
+                    if content is not None:
+                        return content
+                    # The body has disappeared from the cache, so request it unconditionally
+                    entry, headers = None, None
+                    continue
+                elif result.status_code == 404:
+                    logger.error(f'404|#{number_of_attempts}|{url}')
+                    self.__record_failure(url, status, number_of_attempts, error_class)
+                    return -1
+                else:
+                    logger.info(f'StatusCode:{result.status_code}|#{number_of_attempts}|{url}')
+                    if result.status_code == 429 or result.status_code >= 500:
+                        retry_after = parse_retry_after(result.headers.get('Retry-After'))
+            except Exception as e:
+                logger.info(f'{str(e)}|#{number_of_attempts}|{url}')
+                status, error_class = None, type(e).__name__
+            logger.info(f'UnSuccessfulAttempt|#{number_of_attempts}|{url}')
+            if number_of_attempts == max_number_of_attempts:
+                break
+            wait = get_backoff(number_of_attempts, self.backoff, self.max_backoff)
+            if retry_after is not None:
+                wait = max(wait, retry_after)
+            if deadline is not None and time.monotonic() + wait >= deadline:
+                logger.error(f'DeadlineExceeded|#{number_of_attempts}|{url}')
+                self.__record_failure(url, status, number_of_attempts, 'DeadlineExceeded')
+                return -1
+            await asyncio.sleep(wait)
+        logger.error(f'UnSuccessfulAttempt|#{number_of_attempts}|{url}')
+        self.__record_failure(url, status, number_of_attempts, error_class)
+        return -1
+
+    async def __fetch_many(self, urls, **kwargs):
+        return await asyncio.gather(*[self.fetch(url, **kwargs) for url in urls])
+
+    def submit(self, url, **kwargs):
+        """
+        Schedule a fetch without waiting for it.
+        :return: concurrent.futures.Future with the result of fetch
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self.fetch(url, **kwargs), self.loop)
+
+    def get(self, url, **kwargs):
+        """
+        Blocking version of fetch.
+        """
+        return self.submit(url, **kwargs).result()
+
+    def get_many(self, urls, **kwargs):
+        """
+        Fetch all URLs concurrently and wait for all of them.
+        :return: dict with the content (or -1) per unique URL
+        """
+        self.start()
+        urls = list(dict.fromkeys(urls))
+        contents = asyncio.run_coroutine_threadsafe(self.__fetch_many(urls, **kwargs), self.loop).result()
+        return dict(zip(urls, contents))
+
+    def __getstate__(self):
+        # Only the settings travel to other processes; the loop is restarted on first use
+        state = self.__dict__.copy()
+        for key in ['loop', 'thread', 'executor', 'download_executor', 'semaphore', 'download_semaphore',
+                    'rate_limiter', 'lock']:
+            state[key] = None
+        state['host_semaphores'] = dict()
+        state['failures'] = dict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+
+_fetcher = None
+
+
+def get_fetcher(**kwargs):
+    """
+    Get the fetcher of the current process. The keyword arguments are only used when the fetcher is created.
+    """
+    global _fetcher
+    if _fetcher is None or _fetcher.pid != os.getpid():
+        _fetcher = EmpireFetcher(**kwargs)
+    return _fetcher
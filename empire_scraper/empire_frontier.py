@@ -0,0 +1,158 @@
+import json
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from empire_scraper.empire_database import SharedDatabase
+
+
+def normalize_url(url):
+    """
+    :return: URL without query and fragment, with a lowercase scheme and host and a trailing slash
+    """
+    parts = urlsplit(url.strip())
+    path = '/'.join(part for part in parts.path.split('/') if part != '')
+    path = f'/{path}/' if path != '' else '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, '', ''))
+
+
+class UrlFrontier(SharedDatabase):
+    """
+    Persistent crawl frontier of the review pages of a run.
+
+    Every review URL, normalized, is in the seen-set once, whatever listing page it was found on, so a review,
+    which shifts to the next page while the crawl is running, is not scraped twice. The listing workers add the
+    reviews as pending entries and the review workers are fed from the frontier: pending entries are handed out by
+    priority (the lower the listing page and the article, the newer the review) and are queued until their movie is
+    finished.
+    """
+
+    columns = ['url', 'info_id', 'priority', 'state', 'info', 'added_at']
+
+    schema = ['CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY, info_id TEXT, priority INTEGER, '
+              'state TEXT, info TEXT, added_at REAL)',
+              'CREATE INDEX IF NOT EXISTS frontier_state ON frontier (state, priority)']
+
+    @staticmethod
+    def get_priority(info):
+        movie = list(info.values())[0]
+        return (movie.get('InfoPage') or 0) * 1000 + (movie.get('InfoArticle') or 0)
+
+    def add_infos(self, infos):
+        """
+        Add the articles of a listing page to the seen-set.
+        :param infos: dict with per ID the info in the format of get_infos_for_page
+        :return: dict with the infos, which have not been seen before
+        """
+        new_infos = dict()
+        with self.lock:
+            connection = self.connect()
+            for info_id, info in infos.items():
+                review_url = info[info_id]['InfoReviewUrl']
+                if review_url is None:
+                    new_infos[info_id] = info
+                    continue
+                cursor = connection.execute(
+                    'INSERT OR IGNORE INTO frontier (url, info_id, priority, state, info, added_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (normalize_url(review_url), info_id, self.get_priority(info), 'pending', json.dumps(info),
+                     time.time()))
+                if cursor.rowcount == 1:
+                    new_infos[info_id] = info
+        return new_infos
+
+    def is_seen(self, url):
+        with self.lock:
+            row = self.connect().execute('SELECT 1 FROM frontier WHERE url = ?', (normalize_url(url),)).fetchone()
+        return row is not None
+
+    def mark_done(self, urls):
+        """
+        :param urls: review URLs of finished movies
+        """
+        with self.lock:
+            self.connect().executemany("UPDATE frontier SET state = 'done' WHERE url = ?",
+                                       [(normalize_url(url),) for url in urls if url is not None])
+
+    def requeue(self, urls):
+        """
+        Make finished entries pending again, e.g. for a retry.
+        """
+        with self.lock:
+            self.connect().executemany("UPDATE frontier SET state = 'pending' WHERE url = ?",
+                                       [(normalize_url(url),) for url in urls if url is not None])
+
+    def forget_pending(self):
+        """
+        Remove the pending and queued entries, e.g. of an interrupted run, so the listing pages find them again.
+        """
+        with self.lock:
+            self.connect().execute("DELETE FROM frontier WHERE state IN ('pending', 'queued')")
+
+    def claim_pending(self, limit):
+        """
+        Hand out the pending entries with the highest priority; they are queued, so they are only handed out once.
+        :param limit: maximum number of entries
+        :return: list with the infos, the highest priority first
+        """
+        with self.lock:
+            connection = self.connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                rows = connection.execute("SELECT url, info FROM frontier WHERE state = 'pending' ORDER BY priority "
+                                          "LIMIT ?", (limit,)).fetchall()
+                connection.executemany("UPDATE frontier SET state = 'queued' WHERE url = ?",
+                                       [(url,) for url, _ in rows])
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+        return [json.loads(info) for _, info in rows]
+
+    def get_pending(self, urls=None, limit=None):
+        """
+        :param urls: only these review URLs (optional)
+        :param limit: maximum number of entries (optional)
+        :return: list with the infos of the pending entries, the highest priority first
+        """
+        with self.lock:
+            rows = self.connect().execute("SELECT url, info FROM frontier WHERE state = 'pending' "
+                                          "ORDER BY priority").fetchall()
+        if urls is not None:
+            urls = {normalize_url(url) for url in urls}
+            rows = [row for row in rows if row[0] in urls]
+        if limit is not None:
+            rows = rows[:limit]
+        return [json.loads(info) for _, info in rows]
+
+    def get_counts(self):
+        """
+        :return: dict with the number of entries per state
+        """
+        with self.lock:
+            rows = self.connect().execute('SELECT state, COUNT(*) FROM frontier GROUP BY state').fetchall()
+        return dict(rows)
+
+
+def find_last_page(probe, first_page=1, max_page=10000):
+    """
+    Find the last listing page with articles by doubling the page until probe fails and then searching the gap
+    with binary search, which takes about 2 * log2(last page) probes.
+    :param probe: function, which returns whether a page has articles
+    :param first_page: page, which is expected to exist
+    :param max_page: upper bound
+    :return: number of the last page or 0 if first_page has no articles
+    """
+    if not probe(first_page):
+        return 0
+    low, high = first_page, first_page * 2
+    while high <= max_page and probe(high):
+        low, high = high, high * 2
+    high = min(high, max_page + 1)
+    # low has articles and high has not (or is beyond max_page)
+    while high - low > 1:
+        middle = (low + high) // 2
+        if probe(middle):
+            low = middle
+        else:
+            high = middle
+    return low
@@ -1,55 +1,45 @@
-import requests
 import logging
 import json
-import time
+import os
+import queue as queue_module
 import random
-import pandas as pd
+import threading
+import time
+from functools import lru_cache
 
 from logging.config import dictConfig
-from logging.handlers import QueueListener
-import yaml
 
+from empire_scraper.empire_fetcher import get_fetcher
+from empire_scraper.empire_profiler import get_profiler
 
-def get_proxies(file='proxies.csv'):
+
+@lru_cache(maxsize=8)
+def _read_proxies(file, modified):
+    import pandas as pd
     df = pd.read_csv(file, sep=';')
-    proxies = [{'http': f'http://{ip}'} for ip in df['ip']]
-    return proxies
+    proxies = []
+    for ip, port in zip(df['ip'], df['port']):
+        proxy = f'http://{ip}:{port}'
+        proxies.append({'http': proxy, 'https': proxy})
+    return tuple(proxies)
+
+
+def get_proxies(file='proxies.csv'):
+    """
+    The file is only read again once it has been modified.
+    :return: list with the proxies in the format of requests
+    """
+    return [dict(proxy) for proxy in _read_proxies(file, os.path.getmtime(file))]
 
 
 def requests_get(logger, url, max_number_of_attempts=5, timeout=5, proxies=None):
-    number_of_attempts = 0
-    time.sleep(random.randint(1, 3))
-    while number_of_attempts < max_number_of_attempts:
-        number_of_attempts += 1
-        # noinspection PyBroadException
-        try:
-            # Get result
-            if proxies is None:
-                result = requests.get(url, timeout=timeout)
-            else:
-                random_proxy = random.choice(proxies)
-                result = requests.get(url, timeout=timeout, proxies=random_proxy)
-
-            # Inspect result
-            if result.status_code == 200:
-                if number_of_attempts > 1:
-                    logger.info(f'SuccessfulAttempt|#{number_of_attempts}|{url}')
-                return result.content
-            elif result.status_code == 404:
-                time.sleep(5)
-                logger.error(f'404|#{number_of_attempts}|{url}')
-                return -1
-            else:
-                time.sleep(5)
-                logger.info(f'StatusCode:{result.status_code}|#{number_of_attempts}|{url}')
-        except Exception as e:
-            logger.info(f'{str(e)}|#{number_of_attempts}|{url}')
-            time.sleep(5)
-        logger.info(f'UnSuccessfulAttempt|#{number_of_attempts}|{url}')
-        time.sleep(5)
-    if number_of_attempts == max_number_of_attempts:
-        logger.error(f'UnSuccessfulAttempt|#{number_of_attempts}|{url}')
-    return -1
+    """
+    Blocking fetch through the fetch engine of the current process.
+    :return: content of the response (bytes) or -1 if the request failed
+    """
+    proxies = [] if proxies is None else proxies
+    return get_fetcher().get(url, logger=logger, max_number_of_attempts=max_number_of_attempts, timeout=timeout,
+                             proxies=proxies)
 
 
 def print_movies(movies):
@@ -66,55 +56,134 @@ def print_movies(movies):
     print(json.dumps(movies2, sort_keys=True, indent=4))
 
 
-class MyHandler(object):
+class BatchingQueueHandler(logging.Handler):
+    """
+    Buffers the log records of a worker process and sends them in batches over a plain multiprocessing queue, so a
+    log line costs a list append instead of an IPC round trip. The buffer is sent when it is full, every
+    flush_interval seconds and when the worker flushes it on exit.
+    """
+
+    def __init__(self, queue, batch_size=200, flush_interval=0.5):
+        super().__init__()
+        self.queue = queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.buffer_lock = threading.Lock()
+        # Time spent in emit since the last flush, which shows up as logging.emit in the profile
+        self.emit_time = 0.0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.__flush_periodically, name='log_flusher', daemon=True)
+        self.thread.start()
+
+    def __flush_periodically(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
 
     @staticmethod
-    def handle(record):
-        logger = logging.getLogger(record.name)
-        logger.handle(record)
+    def prepare(record):
+        # Like QueueHandler.prepare, only the formatted message travels, not the arguments. This is the only handler
+        # of a worker, so the record is changed in place instead of being copied.
+        message = record.getMessage()
+        if record.exc_info:
+            message = f'{message}\n{logging.Formatter().formatException(record.exc_info)}'
+        record.msg, record.args, record.exc_info, record.exc_text = message, None, None, None
+        return record
+
+    def emit(self, record):
+        start = time.perf_counter()
+        # noinspection PyBroadException
+        try:
+            record = self.prepare(record)
+            with self.buffer_lock:
+                self.buffer.append(record)
+                full = len(self.buffer) >= self.batch_size
+            if full:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+        self.emit_time += time.perf_counter() - start
+
+    def flush(self):
+        with self.buffer_lock:
+            batch, self.buffer = self.buffer, []
+            emit_time, self.emit_time = self.emit_time, 0.0
+        if len(batch) == 0:
+            return
+        start = time.perf_counter()
+        self.queue.put(batch)
+        profiler = get_profiler()
+        profiler.record('logging.put', time.perf_counter() - start)
+        profiler.record('logging.emit', emit_time)
+
+    def close(self):
+        self.stop_event.set()
+        self.flush()
+        super().close()
+
+
+_worker_handler = None
+
+
+def configure_worker_logging(queue):
+    """
+    Send all log records of a worker process to the listener process. Logging is configured once per process;
+    later calls with the same queue are no-ops.
+    """
+    global _worker_handler
+    if _worker_handler is not None and _worker_handler.queue is queue and _worker_handler.pid == os.getpid():
+        return
+    _worker_handler = BatchingQueueHandler(queue)
+    _worker_handler.pid = os.getpid()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_worker_handler)
+    root.setLevel(logging.INFO)
+    # Same as disable_existing_loggers, but the loggers of the workers propagate to the root logger
+    for logger in logging.Logger.manager.loggerDict.values():
+        if isinstance(logger, logging.Logger):
+            logger.handlers = []
+            logger.propagate = True
+
+
+def flush_worker_logging():
+    """
+    Send the buffered log records; worker processes do not run the logging shutdown hooks on exit.
+    """
+    if _worker_handler is not None and _worker_handler.pid == os.getpid():
+        _worker_handler.flush()
 
 
 def listener_process(queue, stop_event):
-    # config_listener = {
-    #     'version': 1,
-    #     'disable_existing_loggers': True,
-    #     'formatters': {
-    #         'detailed': {
-    #             'class': 'logging.Formatter',
-    #             'format': '%(asctime)-20s|%(filename)-20s|%(funcName)-40s|%(lineno)-4s|%(levelname)-7s|%(message)s',
-    #             'datefmt': '%Y-%m-%d %H:%M:%S',
-    #         },
-    #     },
-    #     'handlers': {
-    #         'console': {
-    #             'class': 'logging.StreamHandler',
-    #             'level': 'INFO',
-    #             'formatter': 'detailed',
-    #             'stream': 'ext://sys.stdout',
-    #         },
-    #         'file': {
-    #             'class': 'logging.FileHandler',
-    #             'filename': 'empire_movies.log',
-    #             'mode': 'w',
-    #             'formatter': 'detailed',
-    #         },
-    #     },
-    #     'loggers': {
-    #         'foo': {
-    #             'handlers': ['file']
-    #         }
-    #     },
-    #     'root': {
-    #         'level': 'INFO',
-    #         'handlers': ['console', 'file']
-    #     },
+    """
+    Write the batches of log records of the workers until stop_event is set and the queue is empty. Records are
+    formatted once per handler and every stream handler gets a single write and flush per batch.
+    """
+    import yaml
     with open('listener.yaml', 'r') as f:
-        config_listener = yaml.load(f.read())
+        config_listener = yaml.safe_load(f.read())
     dictConfig(config_listener)
-    listener = QueueListener(queue, MyHandler())
-    listener.start()
-    stop_event.wait()
-    listener.stop()
+    handlers = logging.getLogger().handlers
+    while True:
+        try:
+            batch = queue.get(timeout=0.2)
+        except queue_module.Empty:
+            if stop_event.is_set():
+                break
+            continue
+        for handler in handlers:
+            records = [record for record in batch if record.levelno >= handler.level]
+            if isinstance(handler, logging.StreamHandler):
+                handler.acquire()
+                try:
+                    handler.stream.write(''.join(handler.format(record) + handler.terminator for record in records))
+                    handler.stream.flush()
+                finally:
+                    handler.release()
+            else:
+                [handler.handle(record) for record in records]
+    logging.shutdown()
 
 
 if __name__ == '__main__':
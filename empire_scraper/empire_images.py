@@ -0,0 +1,85 @@
+import os
+import threading
+from concurrent.futures import wait
+
+from empire_scraper.empire_fetcher import get_fetcher
+
+
+class ImageDownloader(object):
+    """
+    Hands images off to the download pool of the fetch engine, so image I/O never blocks the scraping of pages and
+    reviews. Images that are on disk already (a file only gets its final name once it is complete and it has the
+    size of its body in the response cache) and images that are being downloaded by another thread are skipped.
+    """
+
+    def __init__(self, fetcher=None):
+        self.fetcher = fetcher if fetcher is not None else get_fetcher()
+        self.pending = dict()
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.number_of_skipped = 0
+
+    @staticmethod
+    def get_file(src, directory):
+        return os.path.join(directory, src.split('/')[-1])
+
+    @staticmethod
+    def exists(out_file, size=None):
+        """
+        :param size: expected size of the image, e.g. of its body in the response cache (optional)
+        """
+        if not os.path.exists(out_file):
+            return False
+        return os.path.getsize(out_file) > 0 and (size is None or os.path.getsize(out_file) == size)
+
+    def download(self, src, directory, logger=None):
+        """
+        Schedule the download of an image.
+        :param src: URL of the image
+        :param directory: directory of the image, e.g. thumbnails or pictures
+        :param logger: logger of the caller
+        :return: path of the image and the future of the download (None if there is nothing to download)
+        """
+        out_file = self.get_file(src, directory)
+        # A file of another size than the cached body is a leftover of an interrupted download, so it is replaced
+        size = None if self.fetcher.cache is None else self.fetcher.cache.get_object_size(src)
+        with self.lock:
+            if out_file in self.pending:
+                return out_file, self.pending[out_file]
+            if self.exists(out_file, size):
+                self.number_of_skipped += 1
+                return out_file, None
+            future = self.fetcher.submit(src, logger=logger, proxies=[], out_file=out_file)
+            self.pending[out_file] = future
+        future.add_done_callback(lambda _: self.__done(out_file, src, logger))
+        return out_file, future
+
+    def __done(self, out_file, src, logger):
+        with self.lock:
+            future = self.pending.pop(out_file, None)
+        # Failed images are only logged, not kept in the error ledger
+        self.fetcher.pop_failure(src)
+        if future is not None and logger is not None and future.result() == -1:
+            logger.error(f'ImageDownloadFailed|{out_file}|{src}')
+
+    def wait(self, files=None):
+        """
+        Wait for all pending downloads of this process.
+        :param files: only wait for the downloads of these paths (optional)
+        """
+        with self.lock:
+            futures = [future for out_file, future in self.pending.items() if files is None or out_file in files]
+        wait(futures)
+
+
+_downloader = None
+
+
+def get_image_downloader(fetcher=None):
+    """
+    Get the image downloader of the current process.
+    """
+    global _downloader
+    if _downloader is None or _downloader.pid != os.getpid():
+        _downloader = ImageDownloader(fetcher)
+    return _downloader
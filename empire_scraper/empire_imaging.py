@@ -0,0 +1,246 @@
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from empire_scraper.empire_database import SharedDatabase
+
+# Longest side of the resized variants in pixels
+VARIANT_SIZES = [160, 480]
+HASH_SIZE = 8
+
+
+def get_variant_format():
+    """
+    :return: PIL format and extension of the variants; WebP if PIL supports it, otherwise JPEG
+    """
+    from PIL import features
+    return ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+
+
+def get_dhash(image):
+    """
+    Difference hash: the image is reduced to 9x8 gray pixels and every bit tells whether a pixel is brighter than
+    its right neighbour, so resized or recompressed copies of the same artwork get (nearly) the same hash.
+    :param image: PIL image
+    :return: 64-bit hash as 16 hexadecimal characters
+    """
+    from PIL import Image
+    pixels = np.asarray(image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS), dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return np.packbits(bits).tobytes().hex()
+
+
+def process_image(arguments):
+    """
+    Worker function of the process pool: measure an image, hash it and write the resized variants.
+    :param arguments: path of the image, its size and modification time, output directory and sizes of the variants
+    :return: dict with the row of the image in the ImageCatalog
+    """
+    from PIL import Image
+    file, size, mtime, output_directory, sizes = arguments
+    row = {'file': file, 'size': size, 'mtime': mtime, 'width': None, 'height': None, 'format': None,
+           'dhash': None, 'variants': None, 'error': None}
+    try:
+        with Image.open(file) as image:
+            image.load()
+            row['width'], row['height'], row['format'] = image.width, image.height, image.format
+            row['dhash'] = get_dhash(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+            variant_format, extension = get_variant_format()
+            if variant_format == 'JPEG' and image.mode == 'RGBA':
+                image = image.convert('RGB')
+            variants = dict()
+            name = os.path.splitext(os.path.basename(file))[0]
+            directory = os.path.basename(os.path.dirname(file))
+            for variant_size in sizes:
+                variant = image.copy()
+                # Keeps the aspect ratio and never enlarges
+                variant.thumbnail((variant_size, variant_size), Image.LANCZOS)
+                variant_file = os.path.join(output_directory, str(variant_size), directory, f'{name}.{extension}')
+                os.makedirs(os.path.dirname(variant_file), exist_ok=True)
+                temp_file = f'{variant_file}.{os.getpid()}.part'
+                variant.save(temp_file, format=variant_format, quality=80)
+                os.replace(temp_file, variant_file)
+                variants[str(variant_size)] = {'File': variant_file, 'Width': variant.width,
+                                               'Height': variant.height, 'Bytes': os.path.getsize(variant_file)}
+            row['variants'] = json.dumps(variants)
+    except Exception as e:
+        row['error'] = f'{e.__class__.__name__}: {e}'
+    return row
+
+
+def hamming_distances(hashes, index):
+    """
+    :param hashes: uint64 array with hashes
+    :return: number of different bits between hash index and all hashes
+    """
+    xor = np.bitwise_xor(hashes, hashes[index])
+    return np.unpackbits(xor.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+
+class ImageCatalog(SharedDatabase):
+    """
+    Catalog of the post-processed images with their dimensions, byte size, perceptual hash and resized variants.
+
+    An image is identified by its path and is only processed again when its size or modification time changes, so a
+    rerun only processes the new images.
+    """
+
+    columns = ['file', 'size', 'mtime', 'width', 'height', 'format', 'dhash', 'variants', 'error', 'processed_at']
+
+    schema = ['CREATE TABLE IF NOT EXISTS images (file TEXT PRIMARY KEY, size INTEGER, mtime REAL, width INTEGER, '
+              'height INTEGER, format TEXT, dhash TEXT, variants TEXT, error TEXT, processed_at REAL)',
+              'CREATE INDEX IF NOT EXISTS images_dhash ON images (dhash)']
+
+    def get_processed(self):
+        """
+        :return: dict with per file the size and modification time at which it was processed
+        """
+        with self.lock:
+            rows = self.connect().execute('SELECT file, size, mtime FROM images').fetchall()
+        return {file: (size, mtime) for file, size, mtime in rows}
+
+    def put(self, rows):
+        """
+        :param rows: list of dicts with the columns of process_image
+        """
+        now = time.time()
+        with self.lock:
+            connection = self.connect()
+            connection.execute('BEGIN')
+            connection.executemany(f'INSERT OR REPLACE INTO images ({", ".join(self.columns)}) '
+                                   f'VALUES ({", ".join("?" * len(self.columns))})',
+                                   [tuple(row.get(column) for column in self.columns[:-1]) + (now,) for row in rows])
+            connection.execute('COMMIT')
+
+    def get(self, files):
+        """
+        :param files: paths of images
+        :return: dict with per processed file a dict with its columns
+        """
+        files = [file for file in files if file is not None]
+        result = dict()
+        with self.lock:
+            connection = self.connect()
+            # SQLite limits the number of parameters of a query
+            for i in range(0, len(files), 500):
+                chunk = files[i:i + 500]
+                rows = connection.execute(f'SELECT {", ".join(self.columns)} FROM images '
+                                          f'WHERE file IN ({", ".join("?" * len(chunk))})', chunk).fetchall()
+                for row in rows:
+                    result[row[0]] = dict(zip(self.columns, row))
+        return result
+
+    def find_duplicates(self, max_distance=4):
+        """
+        Group the images, of which the perceptual hashes differ in at most max_distance bits.
+        :return: list with groups (lists of files) of at least two images
+        """
+        with self.lock:
+            rows = self.connect().execute('SELECT file, dhash FROM images WHERE dhash IS NOT NULL '
+                                          'ORDER BY file').fetchall()
+        files = [file for file, _ in rows]
+        hashes = np.array([int(dhash, 16) for _, dhash in rows], dtype=np.uint64)
+        group_of = -np.ones(len(files), dtype=np.int64)
+        groups = []
+        for i in range(len(files)):
+            if group_of[i] >= 0:
+                continue
+            members = np.flatnonzero((hamming_distances(hashes, i) <= max_distance) & (group_of < 0))
+            if len(members) > 1:
+                group_of[members] = len(groups)
+                groups.append([files[member] for member in members])
+        return groups
+
+    def get_counts(self):
+        """
+        :return: dict with the number of processed images, failed images and bytes of the originals
+        """
+        with self.lock:
+            row = self.connect().execute('SELECT COUNT(*), SUM(error IS NOT NULL), SUM(size) FROM images').fetchone()
+        return {'images': row[0], 'failed': row[1] or 0, 'bytes': row[2] or 0}
+
+
+class ImageProcessor(object):
+    """
+    Post-processing of the downloaded images in a process pool: every image, which is new or changed since the
+    previous run, gets resized variants in a compact format and its dimensions, byte size and perceptual hash are
+    recorded in the ImageCatalog, from which they are added to the movies in the store.
+    """
+
+    # Keys of the image dicts of a movie, which are filled from the catalog
+    keys = ['Width', 'Height', 'Bytes', 'Hash']
+
+    def __init__(self, catalog, directories=('thumbnails', 'pictures'), output_directory='variants',
+                 sizes=VARIANT_SIZES, number_of_processes=1, chunksize=16):
+        self.catalog = catalog
+        self.directories = list(directories)
+        self.output_directory = output_directory
+        self.sizes = list(sizes)
+        self.number_of_processes = number_of_processes
+        self.chunksize = chunksize
+
+    def get_pending(self):
+        """
+        :return: list with the arguments of process_image for the images, which have not been processed yet
+        """
+        processed = self.catalog.get_processed()
+        pending = []
+        for directory in self.directories:
+            if not os.path.exists(directory):
+                continue
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Images, which are being downloaded, only get their final name once they are complete
+                    if not entry.is_file() or entry.name.endswith('.part'):
+                        continue
+                    stat = entry.stat()
+                    file = os.path.join(directory, entry.name)
+                    if processed.get(file) != (stat.st_size, stat.st_mtime):
+                        pending.append((file, stat.st_size, stat.st_mtime, self.output_directory, self.sizes))
+        return pending
+
+    def run(self, logger=None):
+        """
+        :return: number of processed images
+        """
+        pending = self.get_pending()
+        if logger is not None:
+            logger.info(f'ProcessImages|{len(pending)}|{self.number_of_processes} processes')
+        if len(pending) == 0:
+            return 0
+        rows = []
+        if self.number_of_processes > 1:
+            with multiprocessing.Pool(self.number_of_processes) as pool:
+                for row in pool.imap_unordered(process_image, pending, chunksize=self.chunksize):
+                    rows.append(row)
+                    if len(rows) >= 500:
+                        self.catalog.put(rows)
+                        rows = []
+        else:
+            for arguments in pending:
+                rows.append(process_image(arguments))
+        self.catalog.put(rows)
+        if logger is not None:
+            logger.info(f'ProcessedImages|{len(pending)}|{self.catalog.get_counts()}')
+        return len(pending)
+
+    def annotate(self, movies):
+        """
+        Add the dimensions, byte size and hash of the thumbnail and the picture to the movies.
+        :param movies: dict with per ID a movie
+        """
+        images = [movie.get(key) for movie in movies.values() for key in ['InfoThumbnail', 'Picture']]
+        rows = self.catalog.get([image['File'] for image in images if image is not None])
+        for image in images:
+            if image is None:
+                continue
+            row = rows.get(image['File'])
+            if row is None or row['error'] is not None:
+                continue
+            image['Width'], image['Height'], image['Bytes'], image['Hash'] = \
+                row['width'], row['height'], row['size'], row['dhash']
@@ -0,0 +1,117 @@
+import time
+from urllib.parse import urlsplit
+
+from empire_scraper.empire_database import SharedDatabase
+
+
+class ErrorLedger(SharedDatabase):
+    """
+    Structured record of the failed listing pages and reviews of a run.
+
+    Every failure is a row in an SQLite table keyed by ID, with the URL, the last HTTP status, the number of
+    attempts, the error class and whether a retry makes sense. Workers of all processes write to the same ledger; a
+    retry pass only has to query the retryable rows instead of parsing the log file.
+    """
+
+    columns = ['id', 'kind', 'url', 'status', 'attempts', 'error_class', 'retryable', 'round', 'recorded_at']
+
+    schema = ['CREATE TABLE IF NOT EXISTS errors (id TEXT PRIMARY KEY, kind TEXT, url TEXT, status INTEGER, '
+              'attempts INTEGER, error_class TEXT, retryable INTEGER, round INTEGER, recorded_at REAL)',
+              'CREATE INDEX IF NOT EXISTS errors_retryable ON errors (retryable, kind)']
+
+    def __init__(self, file):
+        """
+        :param file: path of the SQLite database
+        """
+        super().__init__(file)
+        self.round = 0
+
+    @staticmethod
+    def is_retryable(url, status=None, error_class=None):
+        """
+        Classify a failure: missing pages, other client errors and URLs, which are no reviews, are permanent.
+        """
+        if error_class in ['CacheMiss', 'NoReview']:
+            return False
+        if status is not None and 400 <= status < 500 and status not in [408, 429]:
+            return False
+        if url is not None:
+            # Lists (e.g. /movies/55-best-...) and pages below a review are no reviews
+            path = urlsplit(url).path.strip('/').split('/')
+            if len(path) > 3 or (len(path) > 1 and path[1].startswith('55')):
+                return False
+        return True
+
+    def record(self, info_id, url, kind='review', status=None, attempts=1, error_class=None, retryable=None):
+        """
+        Record a failure; the attempts of an earlier failure of the same ID are added up.
+        """
+        if retryable is None:
+            retryable = self.is_retryable(url, status, error_class)
+        with self.lock:
+            self.connect().execute(
+                'INSERT INTO errors (id, kind, url, status, attempts, error_class, retryable, round, recorded_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET url = excluded.url, '
+                'status = excluded.status, attempts = attempts + excluded.attempts, '
+                'error_class = excluded.error_class, retryable = excluded.retryable, round = excluded.round, '
+                'recorded_at = excluded.recorded_at',
+                (info_id, kind, url, status, attempts, error_class, int(retryable), self.round, time.time()))
+
+    def start_round(self):
+        """
+        Start a retry round. The rounds are counted in the ledger, so a retry in a later process (e.g. after a resume)
+        continues after the highest round so far instead of starting at 0 again.
+        :return: number of the new round
+        """
+        with self.lock:
+            last_round = self.connect().execute('SELECT COALESCE(MAX(round), 0) FROM errors').fetchone()[0]
+        self.round = max(self.round, last_round) + 1
+        return self.round
+
+    def resolve(self, ids):
+        """
+        Remove the failures of IDs, which have been scraped successfully.
+        """
+        with self.lock:
+            self.connect().executemany('DELETE FROM errors WHERE id = ?', [(info_id,) for info_id in ids])
+
+    def clear(self):
+        """
+        Remove all failures, e.g. of a previous crawl in a shared ledger.
+        """
+        with self.lock:
+            self.connect().execute('DELETE FROM errors')
+
+    def get(self, info_id):
+        """
+        :return: dict with the failure of an ID or None
+        """
+        with self.lock:
+            row = self.connect().execute(f'SELECT {", ".join(self.columns)} FROM errors WHERE id = ?',
+                                         (info_id,)).fetchone()
+        return None if row is None else dict(zip(self.columns, row))
+
+    def get_errors(self, kind=None, retryable=None):
+        """
+        :return: list with a dict per failure
+        """
+        conditions, parameters = [], []
+        if kind is not None:
+            conditions.append('kind = ?')
+            parameters.append(kind)
+        if retryable is not None:
+            conditions.append('retryable = ?')
+            parameters.append(int(retryable))
+        query = f'SELECT {", ".join(self.columns)} FROM errors'
+        if len(conditions) > 0:
+            query += f' WHERE {" AND ".join(conditions)}'
+        with self.lock:
+            rows = self.connect().execute(query + ' ORDER BY id', parameters).fetchall()
+        return [dict(zip(self.columns, row)) for row in rows]
+
+    def get_retryable(self, kind='review'):
+        return self.get_errors(kind, retryable=True)
+
+    def __len__(self):
+        with self.lock:
+            return self.connect().execute('SELECT COUNT(*) FROM errors').fetchone()[0]
@@ -0,0 +1,203 @@
+import multiprocessing
+import sys
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.context import get_spawning_popen
+
+
+class CrawlMetrics(object):
+    """
+    Counters of a crawl, which are updated by all worker processes.
+
+    The counters live in shared memory (like the state of the ProxyScheduler), so they are aggregated without any
+    messages: the fetcher counts the requests, retries and errors of every attempt, the listing workers count the
+    reviews they find and the main process counts the finished pages and reviews.
+    """
+
+    # Name, Prometheus type and help text of every metric
+    metrics = [
+        ('pages_planned', 'gauge', 'Listing pages of the crawl.'),
+        ('pages_done', 'counter', 'Finished listing pages.'),
+        ('reviews_found', 'counter', 'New reviews found on the listing pages.'),
+        ('reviews_done', 'counter', 'Finished reviews.'),
+        ('requests', 'counter', 'HTTP requests, including retries.'),
+        ('request_errors', 'counter', 'Requests, which failed or got another status than 200, 304 or 404.'),
+        ('request_seconds', 'counter', 'Total time of the requests in seconds.'),
+        ('retries', 'counter', 'Requests, which were a retry.'),
+        ('proxy_requests', 'counter', 'Requests through a proxy.'),
+        ('proxy_errors', 'counter', 'Requests through a proxy, which failed.'),
+        ('cache_hits', 'counter', 'Fetches, which were answered from the cache.'),
+        ('failures', 'counter', 'Fetches, which failed after all attempts.'),
+        ('fetch_slots', 'gauge', 'Concurrent requests per host, which the adaptive limits of all processes allow.'),
+        ('slot_decreases', 'counter', 'Decreases of the adaptive limits.'),
+    ]
+
+    names = [name for name, _, _ in metrics]
+
+    def __init__(self):
+        self.state = multiprocessing.Array('d', len(self.names))
+        self.lock = self.state.get_lock()
+        self.start_time = time.time()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if get_spawning_popen() is None:
+            # Pickled outside of the creation of a process (e.g. in save_to_pickle): keep a snapshot of the counters
+            state['state'] = list(self.state)
+            state['lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.lock is None:
+            self.lock = threading.Lock()
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.state[self.names.index(name)] += value
+
+    def set(self, name, value):
+        with self.lock:
+            self.state[self.names.index(name)] = value
+
+    def get_values(self):
+        """
+        :return: dict with the value of every metric
+        """
+        with self.lock:
+            values = list(self.state)
+        return dict(zip(self.names, values))
+
+    def to_prometheus(self):
+        """
+        :return: the metrics in the Prometheus text format
+        """
+        values = self.get_values()
+        lines = []
+        for name, metric_type, help_text in self.metrics + [('uptime_seconds', 'gauge', 'Seconds since the start.')]:
+            full_name = f'empire_{name}_total' if metric_type == 'counter' else f'empire_{name}'
+            value = time.time() - self.start_time if name == 'uptime_seconds' else values[name]
+            lines += [f'# HELP {full_name} {help_text}', f'# TYPE {full_name} {metric_type}',
+                      f'{full_name} {value:g}']
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer(object):
+    """
+    Serves the CrawlMetrics on http://host:port/metrics in the Prometheus text format from a thread of the main
+    process.
+    """
+
+    def __init__(self, metrics, port=8000, host='127.0.0.1'):
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ['/', '/metrics']:
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                # Scrapes are not logged
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        # Port 0 picks a free port
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server, self.thread = None, None
+
+
+class ProgressDisplay(object):
+    """
+    Compact progress line with the finished pages and reviews, the request rate, the retry and proxy error rates and
+    the ETA. On a terminal the line is rewritten every interval seconds, otherwise a line is written every
+    10 intervals.
+    """
+
+    def __init__(self, metrics, interval=1.0, stream=None):
+        self.metrics = metrics
+        self.interval = interval
+        self.stream = stream if stream is not None else sys.stderr
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.previous = (time.monotonic(), metrics.get_values())
+
+    def start(self):
+        self.previous = (time.monotonic(), self.metrics.get_values())
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.__run, name='progress', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+            self.stream.write(self.get_line() + '\n')
+            self.stream.flush()
+
+    def __run(self):
+        is_terminal = self.stream.isatty()
+        ticks = 0
+        while not self.stop_event.wait(self.interval):
+            ticks += 1
+            if is_terminal:
+                self.stream.write('\r' + self.get_line() + '\033[K')
+            elif ticks % 10 == 0:
+                self.stream.write(self.get_line() + '\n')
+            self.stream.flush()
+
+    def get_line(self):
+        """
+        :return: progress line; the rates are over the last interval
+        """
+        now, values = time.monotonic(), self.metrics.get_values()
+        previous_time, previous_values = self.previous
+        self.previous = (now, values)
+        elapsed = max(now - previous_time, 1e-6)
+
+        def get_rate(name):
+            return (values[name] - previous_values[name]) / elapsed
+
+        def get_ratio(numerator, denominator):
+            return 100 * values[numerator] / values[denominator] if values[denominator] > 0 else 0
+
+        # Estimated number of reviews: the reviews per finished page times the number of pages
+        pages_planned, pages_done = values['pages_planned'], values['pages_done']
+        reviews_total = values['reviews_found']
+        if 0 < pages_done < pages_planned:
+            reviews_total = values['reviews_found'] / pages_done * pages_planned
+        review_rate = values['reviews_done'] / max(time.time() - self.metrics.start_time, 1e-6)
+        eta = '-'
+        if review_rate > 0 and reviews_total >= values['reviews_done']:
+            eta = str(timedelta(seconds=int((reviews_total - values['reviews_done']) / review_rate)))
+        return (f'pages {pages_done:.0f}/{pages_planned:.0f} | reviews {values["reviews_done"]:.0f}/'
+                f'{reviews_total:.0f} | {get_rate("requests"):.1f} req/s | {get_rate("reviews_done"):.1f} reviews/s | '
+                f'retries {get_ratio("retries", "requests"):.1f}% | '
+                f'errors {get_ratio("request_errors", "requests"):.1f}% | '
+                f'proxy errors {get_ratio("proxy_errors", "proxy_requests"):.1f}% | '
+                f'slots {values["fetch_slots"]:.0f} | ETA {eta}')
@@ -1,16 +1,20 @@
 from bs4 import BeautifulSoup
-import numpy as np
-# from PIL import Image
-import requests
-# from io import BytesIO
-from empire_scraper.empire_helpers import requests_get, get_proxies
-from datetime import datetime
-import os
+from empire_scraper.empire_helpers import get_proxies
+from empire_scraper.empire_fetcher import get_fetcher
+from empire_scraper.empire_extractor import ReviewExtractor
+from empire_scraper.empire_profiler import get_profiler
+from empire_scraper.empire_images import get_image_downloader
 
 
 class EmpireMovie(object):
-    def __init__(self, logger, info=None, process_images=True, use_proxies=True):
+    extractor = ReviewExtractor()
+    info_keys = {'Release date': 'ReleaseDate', 'Running time': 'RunningTime'}
+
+    def __init__(self, logger, info=None, process_images=True, use_proxies=True, fetcher=None, single_pass=True,
+                 proxies=None, ledger=None):
         self.logger = logger
+        # Optional ErrorLedger, in which a failed review is recorded
+        self.ledger = ledger
         self.info = info
         self.info_id = None
         self.info_movie = None
@@ -22,8 +26,16 @@ class EmpireMovie(object):
         self.title = None
         self.parser = "lxml"
         self.soup = None
-        if use_proxies:
+        # Use the single-pass ReviewExtractor instead of the BeautifulSoup based get_review_* methods
+        self.single_pass = single_pass
+        self.proxies = []
+        if proxies is not None:
+            # ProxyScheduler (or list) shared with the other reviews
+            self.proxies = proxies
+        elif use_proxies:
             self.proxies = get_proxies(file='proxies.csv')
+        self.fetcher = fetcher if fetcher is not None else get_fetcher()
+        self.downloads = []
 
     def process_relevant_info(self):
         if self.info is not None:
@@ -35,13 +47,21 @@ class EmpireMovie(object):
             self.movie[self.info_id] = dict()
             self.movie[self.info_id].update(self.info[self.info_id])
 
-    def get_soup(self):
-        html = requests_get(self.logger, self.review_url, max_number_of_attempts=5, timeout=5, proxies=self.proxies)
+    def get_html(self, html=None):
+        if html is None:
+            html = self.fetcher.get(self.review_url, logger=self.logger, max_number_of_attempts=5, timeout=5,
+                                    proxies=self.proxies)
         if html == -1:
             self.logger.error(f'RequestsGetFailed|{self.info_id}|{self.review_url}')
-            self.soup = None
-        else:
-            self.soup = BeautifulSoup(html, self.parser)
+            failure = self.fetcher.pop_failure(self.review_url)
+            if self.ledger is not None:
+                self.ledger.record(self.info_id, self.review_url, **(failure or {}))
+            return None
+        return html
+
+    def get_soup(self, html=None):
+        html = self.get_html(html)
+        self.soup = None if html is None else BeautifulSoup(html, self.parser)
 
     def get_review_author(self):
         movie = self.movie[self.info_id]
@@ -80,26 +100,16 @@ class EmpireMovie(object):
             self.logger.info(f'NoInfoLeft|{self.info_id}|{self.review_url}')
             return None
 
-        result = result.get_text('|').split('|')
-        dim = int(len(result) / 2)
-        result = np.reshape(result, (dim, 2))
+        self.set_review_info(result.get_text('|').split('|'))
+        return 1
 
+    def set_review_info(self, result):
+        # The entries alternate between keys and values; the raw values are parsed by the normalization stage of
+        # the store (empire_normalize), so an unexpected format never fails the review
         movie = self.movie[self.info_id]
-        for res in result:
-            key, value = res[0].strip(), res[1].strip()
-            if key == 'Release date':
-                key = 'ReleaseDate'
-                movie[key] = datetime.strptime(value, '%d %b %Y').strftime('%Y-%m-%d')
-            elif key == 'Running time':
-                key = 'RunningTime'
-                res = ''.join([s for s in value if s.isdigit()])
-                movie[key] = None
-                if len(res) > 0:
-                    movie[key] = int(res)
-            else:
-                movie[key] = value
-
-        return 1
+        for key, value in zip(result[0::2], result[1::2]):
+            key, value = key.strip(), value.strip()
+            movie[self.info_keys.get(key, key)] = value
 
     def get_review_rating(self):
         movie = self.movie[self.info_id]
@@ -134,31 +144,75 @@ class EmpireMovie(object):
             if result is not None:
                 result = result.find('img')
                 if result is not None:
-                    src = result['src']
-                    movie['Picture']['Source'] = src
-                    if src.find('no-photo') == -1:
-                        response = requests.get(src)
-                        if response.status_code == 200:
-                            # movie['Picture']['File'] = Image.open(BytesIO(response.content))
-                            out_file = os.path.join('pictures', src.split('/')[-1])
-                            with open(out_file, 'wb') as f:
-                                f.write(response.content)
-
-    def get_review(self):
+                    self.set_review_picture(result['src'])
+
+    def set_review_picture(self, src):
+        movie = self.movie[self.info_id]
+        movie['Picture']['Source'] = src
+        if src.find('no-photo') == -1:
+            # The download runs in the download pool; only the path of the image is kept
+            out_file, download = get_image_downloader(self.fetcher).download(src, 'pictures', self.logger)
+            movie['Picture']['File'] = out_file
+            if download is not None:
+                self.downloads.append(download)
+
+    def get_review_single_pass(self, html):
+        """
+        Fill the movie with all fields of the review page, which are collected in a single pass by the extractor.
+        The result is the same as that of the get_review_* methods.
+        """
+        with get_profiler().stage('review.extract'):
+            fields = self.extractor.extract(html)
+        if fields['Info'] is None:
+            self.logger.info(f'NoInfoLeft|{self.info_id}|{self.review_url}')
+            return
+        self.set_review_info(fields['Info'])
+
+        movie = self.movie[self.info_id]
+        movie['Rating'] = fields['Rating']
+        movie['Author'] = fields['Author']
+        movie['DatePublished'] = fields['DatePublished']
+        movie['LastUpdate'] = fields['LastUpdate']
+        movie['Introduction'] = fields['Introduction']
+        movie['Review'] = None
+        if fields['Paragraphs']:
+            movie['Review'] = '\n'.join(fields['Paragraphs'])
+        movie['Picture'] = dict()
+        movie['Picture']['Source'] = None
+        movie['Picture']['File'] = None
+        if self.process_images and fields['PictureSource'] is not None:
+            self.set_review_picture(fields['PictureSource'])
+
+    def get_review(self, html=None):
         self.logger.info(f'GetReview|{self.info_id}|{self.review_url}')
-        self.get_soup()
-        if self.soup is None:
+        profiler = get_profiler()
+        html = self.get_html(html)
+        if html is None:
             return
-        if self.get_review_title_and_other_info() is None:
+        if self.single_pass:
+            with profiler.stage('review.single_pass'):
+                self.get_review_single_pass(html)
             return
-        self.get_review_rating()
-        self.get_review_author()
-        self.get_review_date_published()
-        self.get_review_last_update()
-        self.get_review_introduction_text()
-        self.get_review_text()
-        self.get_review_picture()
-
-    def get_movie(self):
-        self.get_review()
+        with profiler.stage('review.soup'):
+            self.get_soup(html)
+        with profiler.stage('review.get_review_title_and_other_info'):
+            if self.get_review_title_and_other_info() is None:
+                return
+        for method in [self.get_review_rating,
+                       self.get_review_author,
+                       self.get_review_date_published,
+                       self.get_review_last_update,
+                       self.get_review_introduction_text,
+                       self.get_review_text,
+                       self.get_review_picture]:
+            with profiler.stage(f'review.{method.__name__}'):
+                method()
+
+    def get_movie(self, html=None):
+        """
+        Scrape the review of the movie.
+        :param html: content of the review page if it has been fetched already
+        :return: dict with the movie
+        """
+        self.get_review(html)
         return self.movie
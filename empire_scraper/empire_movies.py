@@ -1,40 +1,88 @@
 from bs4 import BeautifulSoup
-import pandas as pd
-from PIL import Image
-import requests
-from io import BytesIO
 import pickle
 from empire_scraper.empire_movie import EmpireMovie
 from empire_scraper.empire_helpers import get_proxies, print_movies
-from multiprocessing import Pool, Event
-from empire_scraper.empire_helpers import requests_get, listener_process
+from multiprocessing import Event
+from empire_scraper.empire_helpers import listener_process
+from empire_scraper.empire_pipeline import EmpirePipeline
+from empire_scraper.empire_fetcher import get_fetcher
+from empire_scraper.empire_cache import EmpireCache
+from empire_scraper.empire_profiler import get_profiler
+from empire_scraper.empire_images import get_image_downloader
+from empire_scraper.empire_storage import EmpireStore
+from empire_scraper.empire_checkpoint import EmpireCheckpoint, get_latest_checkpoint_file
+from empire_scraper.empire_ledger import ErrorLedger
+from empire_scraper.empire_frontier import UrlFrontier, find_last_page
+from empire_scraper.empire_replay import FixtureArchive
+from empire_scraper.empire_search import SearchIndex
+from empire_scraper.empire_imaging import ImageCatalog, ImageProcessor
+from empire_scraper.empire_metrics import CrawlMetrics, MetricsServer, ProgressDisplay
+from empire_scraper.empire_proxies import ProxyScheduler
 from datetime import datetime as dt
+import json
 import os
 from datetime import datetime
 
 import logging
 import multiprocessing
 
-from logging.config import dictConfig
-import yaml
+import sys
 import shutil
+import time
+import copy
+from contextlib import contextmanager
 
 
 class EmpireMovies(object):
-    def __init__(self, process_images=True, number_of_processors=1, use_proxies=True):
+    def __init__(self, process_images=True, number_of_processors=1, use_proxies=True, max_concurrency=100,
+                 max_per_host=10, pool_connections=10, pool_maxsize=None, number_of_listing_workers=1,
+                 number_of_review_threads=10, queue_size=100, use_cache=True, cache_only=False, cache_ttl=None,
+                 cache_max_size=2 * 1024 ** 3, rate=10, rate_per_host=5, deadline=60, export_excel=False,
+                 transport=None, record_fixtures=None, metrics_port=None, progress=False, adaptive=False,
+                 min_per_host=1):
         self.process_images = process_images
         self.movies = dict()
         self.parser = "lxml"
         self.df = None
         self.number_of_processors = number_of_processors
+        self.number_of_listing_workers = number_of_listing_workers
+        self.number_of_review_threads = number_of_review_threads
+        self.queue_size = queue_size
         self.proxies = None
         if use_proxies:
-            self.proxies = get_proxies(file='proxies.csv')
+            # The health of the proxies is shared by all workers
+            self.proxies = ProxyScheduler(get_proxies(file='proxies.csv'))
+        # Counters of all workers, which are served on metrics_port and shown in the progress display
+        self.metrics = CrawlMetrics()
+        self.metrics_port = metrics_port
+        self.progress = progress
+        # Settings of the fetch engine, which is created once in every (worker) process
+        self.cache = None
+        if use_cache or cache_only:
+            self.cache = EmpireCache(directory='cache', ttl=cache_ttl, max_size=cache_max_size, offline=cache_only)
+        # The rates (requests per second) are for the whole crawl, so they are divided over the worker processes
+        number_of_workers = number_of_processors + number_of_listing_workers
+        self.fetcher_settings = {'max_concurrency': max_concurrency, 'max_per_host': max_per_host,
+                                 'pool_connections': pool_connections, 'pool_maxsize': pool_maxsize,
+                                 'cache': self.cache,
+                                 'rate': None if rate is None else rate / number_of_workers,
+                                 'rate_per_host': None if rate_per_host is None else rate_per_host / number_of_workers,
+                                 'deadline': deadline,
+                                 # Offline benchmarks: record the responses in a FixtureArchive or replay them
+                                 'transport': transport,
+                                 'recorder': None if record_fixtures is None else FixtureArchive(record_fixtures),
+                                 'metrics': self.metrics,
+                                 # AIMD limit per host between min_per_host and max_per_host instead of a fixed one
+                                 'adaptive': adaptive,
+                                 'min_per_host': min_per_host}
         self.pages = None
         self.log_file = 'empire_movies.log'
         self.pickle_file = None
+        # Columnar result storage with a partition per run; Excel is an optional export
+        self.store = EmpireStore(os.path.join('results', 'store'))
+        self.export_excel = export_excel
         self.result_file = None
-        self.error_file = None
+        self.profile_file = None
         self.now = datetime.strftime(datetime.now(), "%Y%m%d-%H%M%S")
         if not os.path.exists('thumbnails'):
             os.makedirs('thumbnails')
@@ -42,6 +90,18 @@ class EmpireMovies(object):
             os.makedirs('pictures')
         if not os.path.exists(os.path.join('results', self.now)):
             os.makedirs(os.path.join('results', self.now))
+        # Every finished movie is appended to the checkpoint right away
+        self.checkpoint = EmpireCheckpoint(os.path.join('results', self.now, f'{self.now}_checkpoint.jsonl'))
+        # Failed pages and reviews are recorded by the workers in the error ledger
+        self.ledger = ErrorLedger(os.path.join('results', self.now, f'{self.now}_errors.sqlite'))
+        # Seen-set of the review URLs, from which the review workers are fed
+        self.frontier = UrlFrontier(os.path.join('results', self.now, f'{self.now}_frontier.sqlite'))
+        # Full-text index over the reviews of all runs, which is extended with every finished movie
+        self.search_index = SearchIndex(os.path.join('results', 'index'))
+        # Resized variants, dimensions and perceptual hashes of the images of all runs
+        self.image_processor = ImageProcessor(ImageCatalog(os.path.join('results', 'images.sqlite')),
+                                              number_of_processes=number_of_processors)
+        self.max_number_of_retries = 2
 
         self.number_of_pages = 0
         self.number_of_articles = 0
@@ -88,24 +148,26 @@ class EmpireMovies(object):
 
     @staticmethod
     def __get_thumbnail_from_article(article):
+        """
+        Find the source of the thumbnail of the movie. The image itself is downloaded by the image downloader.
+        :param article: article about the movie in BeautifulSoup format
+        :return: dict with the source of the thumbnail
+        """
         thumbnail = None
         result = article.find('img')
         if result is not None:
             thumbnail = dict()
-            thumbnail['Source'] = None
+            thumbnail['Source'] = result['src']
             thumbnail['File'] = None
-            src = result['src']
-            if src is not None:
-                thumbnail['Source'] = src
-                if src.find('no-photo') == -1:
-                    response = requests.get(src)
-                    if response.status_code == 200:
-                        thumbnail['File'] = Image.open(BytesIO(response.content))
-                        out_file = os.path.join('thumbnails', src.split('/')[-1])
-                        with open(out_file, 'wb') as f:
-                            f.write(response.content)
         return thumbnail
 
+    @staticmethod
+    def __get_thumbnail_download(info):
+        thumbnail = info['InfoThumbnail']
+        if thumbnail is None or thumbnail['Source'] is None or thumbnail['Source'].find('no-photo') != -1:
+            return None
+        return thumbnail['Source']
+
     def __get_info_from_article(self, article):
         info = dict()
         info['InfoMovie'], info['IsEssay'] = self.__get_title_from_article(article)
@@ -114,47 +176,52 @@ class EmpireMovies(object):
         info['InfoThumbnail'] = self.__get_thumbnail_from_article(article)
         return info
 
-    def get_movies_for_page(self, page, article_number=None, queue=None):
-
-        config_worker = {
-            'version': 1,
-            'disable_existing_loggers': True,
-            'handlers': {
-                'queue': {
-                    'class': 'logging.handlers.QueueHandler',
-                    'queue': queue,
-                },
-            },
-            'root': {
-                'level': 'INFO',
-                'handlers': ['queue']
-            },
-        }
-        dictConfig(config_worker)
-
-        local_logger = logging.getLogger(f'sub_logger{page}')
+    def get_infos_for_page(self, page, article_number=None, logger=None, known_review_urls=None, known_ids=None):
+        """
+        Get the info of all articles on a listing page, including the thumbnails.
+        :param page: number of the listing page
+        :param article_number: only get the info of this article (optional)
+        :param logger: logger of the worker
+        :param known_review_urls: set of review URLs, which are skipped (optional)
+        :param known_ids: set of IDs, which are skipped (optional)
+        :return: dict with per ID the info in the format expected by EmpireMovie (empty if the page does not exist
+            or only has skipped articles) or None if the page could not be fetched
+        """
+        logger = logger if logger is not None else logging.getLogger(f'sub_logger{page}')
 
         info_url = f"https://www.empireonline.com/movies/reviews/{page}/"
-        local_logger.info(f'GetReviewPage|{page}|{info_url}')
+        logger.info(f'GetReviewPage|{page}|{info_url}')
 
-        html = requests_get(local_logger, info_url, max_number_of_attempts=3, timeout=5, proxies=self.proxies)
+        fetcher = get_fetcher(**self.fetcher_settings)
+        proxies = [] if self.proxies is None else self.proxies
+        html = fetcher.get(info_url, logger=logger, max_number_of_attempts=3, timeout=5, proxies=proxies)
         if html == -1:
-            local_logger.error(f'RequestFailed|{page}|{info_url}')
+            failure = fetcher.pop_failure(info_url)
+            if failure is not None and failure['status'] == 404:
+                logger.info(f'NonexistentPage|{page}|{info_url}')
+                return dict()
+            logger.error(f'RequestFailed|{page}|{info_url}')
+            self.ledger.record(f'{page:03d}', info_url, kind='listing', **(failure or {}))
             return None
         else:
-            soup = BeautifulSoup(html, self.parser)
+            with get_profiler().stage('listing.soup'):
+                soup = BeautifulSoup(html, self.parser)
 
         # Each movie is represented by an article
         articles = soup.find_all("article")
         if len(articles) == 0:
-            local_logger.info(f'NonexistentPage|{page}|{info_url}')
-            return None
+            logger.info(f'NonexistentPage|{page}|{info_url}')
+            return dict()
 
         # Loop over all articles
-        movies = dict()
+        infos = dict()
+        profiler = get_profiler()
+        start = time.perf_counter()
         for i, article in enumerate(articles, 1):
             if article_number is None or i == article_number:
                 info_id = f'{page:03d}-{i:02d}'
+                if known_ids is not None and info_id in known_ids:
+                    continue
                 info = dict()
                 info[info_id] = dict()
                 # Process meta data
@@ -162,19 +229,85 @@ class EmpireMovies(object):
                 info[info_id]['InfoArticle'] = i
                 info[info_id]['InfoUrl'] = info_url
                 info[info_id].update(self.__get_info_from_article(article))
+                if known_review_urls is not None and info[info_id]['InfoReviewUrl'] in known_review_urls:
+                    continue
+                infos[info_id] = info
+        profiler.record('listing.articles', time.perf_counter() - start)
+
+        # Thumbnails are handed off to the download pool; only their paths are kept
+        if self.process_images:
+            downloader = get_image_downloader(fetcher)
+            for info_id, info in infos.items():
+                thumbnail_url = self.__get_thumbnail_download(info[info_id])
+                if thumbnail_url is not None:
+                    out_file, _ = downloader.download(thumbnail_url, 'thumbnails', logger)
+                    info[info_id]['InfoThumbnail']['File'] = out_file
+
+        return infos
+
+    def get_movie_for_info(self, info, logger, html=None):
+        """
+        Scrape the review of a single article.
+        :param info: info of the article as returned by get_infos_for_page
+        :param logger: logger of the worker
+        :param html: content of the review page if it has been fetched already
+        :return: dict with the movie and a list with the pending picture downloads
+        """
+        proxies = [] if self.proxies is None else self.proxies
+        E = EmpireMovie(logger, info, self.process_images, fetcher=get_fetcher(**self.fetcher_settings),
+                        proxies=proxies, ledger=self.ledger)
+        with get_profiler().stage('review.total'):
+            movie = E.get_movie(html)
+        return movie, E.downloads
+
+    def fetch_reviews(self, infos, logger):
+        """
+        Fetch the review pages of several articles at once on the event loop of the fetch engine, instead of one
+        blocking request per review.
+        :param infos: list with infos as returned by get_infos_for_page
+        :param logger: logger of the worker
+        :return: dict with the content (or -1) per review URL
+        """
+        review_urls = [value['InfoReviewUrl'] for info in infos for value in info.values()
+                       if value['InfoReviewUrl'] is not None]
+        fetcher = get_fetcher(**self.fetcher_settings)
+        proxies = [] if self.proxies is None else self.proxies
+        return fetcher.get_many(review_urls, logger=logger, max_number_of_attempts=5, timeout=5, proxies=proxies)
 
-                E = EmpireMovie(local_logger, info, self.process_images)
-                new_movie = E.get_movie()
-                movies.update(new_movie)
-
-        return movies
-
-    def get_movies_for_pages(self, pages=None, article_number=None):
-
+    def probe_page(self, page):
+        """
+        :return: whether a listing page has articles; a page, which does not exist (404), has none
+        """
+        info_url = f"https://www.empireonline.com/movies/reviews/{page}/"
+        fetcher = get_fetcher(**self.fetcher_settings)
+        proxies = [] if self.proxies is None else self.proxies
+        html = fetcher.get(info_url, max_number_of_attempts=5, timeout=5, proxies=proxies)
+        failure = fetcher.pop_failure(info_url)
+        if html == -1:
+            if failure is not None and failure['status'] == 404:
+                return False
+            # Counting a page, which could not be fetched, as the end would silently cut the crawl short
+            logging.getLogger('root').error(f'ProbeFailed|{page}|{info_url}')
+            raise RuntimeError(f'Listing page {page} could not be fetched after {(failure or {}).get("attempts")} '
+                               f'attempts, so the last page is unknown')
+        return BeautifulSoup(html, self.parser).find('article') is not None
+
+    def get_last_page(self):
+        """
+        Find the last listing page with binary search instead of probing every page past the end.
+        """
         logger = logging.getLogger('root')
-        logger.info(f'Start scraping||')
+        last_page = find_last_page(self.probe_page)
+        logger.info(f'LastPage|{last_page}|')
+        return last_page
 
-        # Organize the pages and article numbers as input list for pool.starmap
+    def get_pages(self, pages=None):
+        """
+        :param pages: page, iterable of pages or None for all pages
+        :return: list of pages
+        """
+        if pages is None:
+            pages = range(1, self.get_last_page() + 1)
         if isinstance(pages, int):
             pages = [pages]
         elif not isinstance(pages, list):
@@ -182,41 +315,166 @@ class EmpireMovies(object):
         else:
             pass
         self.pages = pages
+        return pages
 
-        # Start (multi-)processing all pages
-        start = dt.now()
-
-        #if len(pages) == 1 or self.number_of_processors == 1:
-        #    results = self.get_movies_for_page(pages[0], article_number)
-        #else:
-        # Start the listener process for multi-processing logging
-        manager = multiprocessing.Manager()
-        queue = manager.Queue()
-        stop_event = Event()
-        listener = multiprocessing.Process(target=listener_process,
-                                           name='listener',
-                                           args=(queue, stop_event))
-        listener.start()
+    def get_movies_for_pages(self, pages=None, article_number=None):
 
-        x = [(page, article_number, queue) for page in pages]
-        processes = self.number_of_processors
-        with Pool(processes=processes) as pool:
-            results = pool.starmap(self.get_movies_for_page, iterable=iter(x), chunksize=1)
+        logger = logging.getLogger('root')
+        logger.info(f'Start scraping||')
 
-        # Stop the listener
-        stop_event.set()
-        listener.join()
+        # Organize the pages
+        pages = self.get_pages(pages)
 
-        end = dt.now()
+        # Start (multi-)processing all pages
+        start = dt.now()
 
         movies = dict()
-        [movies.update(result) for result in results if result is not None]
+        try:
+            for movie in self.iter_movies_for_pages(pages, article_number):
+                movies.update(movie)
+                self.mark_done(movie)
+        finally:
+            self.search_index.commit()
+
+        end = dt.now()
 
         scraping_time = str(end - start).split('.')[0]
         logger.info(f'Scraping time for {len(pages)} pages: {scraping_time}||')
 
         return movies
 
+    def scrape_to_checkpoint(self, pages=None, article_number=None, skip_ids=None):
+        """
+        Same as get_movies_for_pages, but every movie is appended to the checkpoint as soon as it is finished instead
+        of being kept in memory.
+        :return: number of scraped movies
+        """
+        logger = logging.getLogger('root')
+        logger.info(f'Start scraping||{self.checkpoint.file}')
+
+        pages = self.get_pages(pages)
+
+        start = dt.now()
+        number_of_movies = 0
+        self.checkpoint.open()
+        try:
+            for movie in self.iter_movies_for_pages(pages, article_number, skip_ids=skip_ids):
+                self.checkpoint.append(movie)
+                self.mark_done(movie)
+                number_of_movies += 1
+        finally:
+            self.checkpoint.close()
+            self.search_index.commit()
+        end = dt.now()
+
+        scraping_time = str(end - start).split('.')[0]
+        logger.info(f'Scraping time for {len(pages)} pages: {scraping_time}||{number_of_movies} movies')
+        return number_of_movies
+
+    def mark_done(self, movie):
+        """
+        Mark the review URL as done in the frontier and add the movie to the search index.
+        :param movie: dict with a finished movie
+        """
+        self.frontier.mark_done([value.get('InfoReviewUrl') for value in movie.values()])
+        self.search_index.add_movies(movie, run=self.now)
+
+    def resume(self):
+        """
+        Continue the most recent run: its results directory and checkpoint are reused.
+        :return: set with the IDs, which have been scraped already
+        """
+        logger = logging.getLogger('root')
+        now, checkpoint_file = get_latest_checkpoint_file('results')
+        if now is None:
+            logger.info('NoCheckpoint||')
+            return set()
+        if now != self.now:
+            # The directory of this run has not been used yet
+            if len(os.listdir(os.path.join('results', self.now))) == 0:
+                os.rmdir(os.path.join('results', self.now))
+            self.now = now
+            self.checkpoint = EmpireCheckpoint(checkpoint_file)
+            self.ledger = ErrorLedger(os.path.join('results', now, f'{now}_errors.sqlite'))
+            self.frontier = UrlFrontier(os.path.join('results', now, f'{now}_frontier.sqlite'))
+        # Reviews, which were in flight, are found again by the listing pages
+        self.frontier.forget_pending()
+        skip_ids = self.checkpoint.get_ids()
+        logger.info(f'Resume|{now}|{len(skip_ids)} movies')
+        return skip_ids
+
+    def get_worker_copy(self):
+        """
+        Lightweight copy for the worker processes, which is sent once per process: only the settings and the shared
+        state (proxies, cache, checkpoint, ledger) are kept, not the movies or the DataFrame of the main process.
+        """
+        worker_copy = copy.copy(self)
+        worker_copy.movies = dict()
+        worker_copy.df = None
+        worker_copy.pages = None
+        # The search index is only written by the main process
+        worker_copy.search_index = None
+        return worker_copy
+
+    @contextmanager
+    def logging_listener(self):
+        """
+        Run the listener process for multi-processing logging; the workers send their records in batches over a
+        plain queue.
+        :return: context manager, which yields the queue of the listener
+        """
+        queue = multiprocessing.Queue()
+        stop_event = Event()
+        listener = multiprocessing.Process(target=listener_process,
+                                           name='listener',
+                                           args=(queue, stop_event))
+        listener.start()
+        try:
+            yield queue
+        finally:
+            # Stop the listener
+            stop_event.set()
+            listener.join()
+
+    @contextmanager
+    def monitor(self):
+        """
+        Serve the metrics and show the progress display (if enabled) while scraping.
+        """
+        server = None if self.metrics_port is None else MetricsServer(self.metrics, self.metrics_port)
+        display = ProgressDisplay(self.metrics) if self.progress else None
+        if server is not None:
+            server.start()
+            logging.getLogger('root').info(f'MetricsServer||http://{server.host}:{server.port}/metrics')
+        if display is not None:
+            display.start()
+        try:
+            yield
+        finally:
+            if display is not None:
+                display.stop()
+            if server is not None:
+                server.stop()
+
+    def iter_movies_for_pages(self, pages, article_number=None, infos=None, skip_ids=None):
+        """
+        Scrape the pages with a two-stage pipeline: listing workers add the article infos to the frontier, from
+        which they are fed by priority through a bounded queue to the review workers, which turn them into movies.
+        :param infos: article infos, which are scraped instead of the pages (optional)
+        :param skip_ids: set of IDs, which are not scraped (optional)
+        :return: generator, which yields a dict with a single movie as soon as it is finished
+        """
+        self.metrics.inc('pages_planned', len(pages))
+        if infos is not None:
+            self.metrics.inc('reviews_found', len(infos))
+        with self.logging_listener() as queue, self.monitor():
+            pipeline = EmpirePipeline(self.get_worker_copy(),
+                                      number_of_listing_workers=self.number_of_listing_workers,
+                                      number_of_review_workers=self.number_of_processors,
+                                      number_of_review_threads=self.number_of_review_threads,
+                                      queue_size=self.queue_size)
+            yield from pipeline.run(pages, article_number, queue, infos, skip_ids)
+
     def save_to_pickle(self):
         logger = logging.getLogger('root')
         logger.info('Pickling movies||')
@@ -224,14 +482,65 @@ class EmpireMovies(object):
         with open(self.pickle_file, 'wb') as f:
             pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
 
+    def save_to_store(self):
+        """
+        Copy the checkpoint to the store in batches, so the movies never have to be in memory all at once.
+        """
+        logger = logging.getLogger('root')
+        logger.info('Saving movies in store||')
+        # The checkpoint holds all movies of the run, also those of an earlier attempt, so it replaces the partition
+        self.store.clear_run(self.now)
+        self.store.open_run(self.now)
+        for movies in self.checkpoint.iter_movies(batch_size=self.store.batch_size):
+            self.check_image_files(movies)
+            self.image_processor.annotate(movies)
+            self.store.append(movies)
+        self.store.close()
+        self.report_parse_failures()
+
+    def report_parse_failures(self):
+        """
+        Log the values, which the store could not normalize, per column and save them all in a JSON file.
+        """
+        logger = logging.getLogger('root')
+        failures = self.store.pop_failures()
+        for name, column_failures in failures.items():
+            examples = ', '.join(f'{info_id}: {value!r}' for info_id, value in column_failures[:5])
+            logger.warning(f'ParseFailures|{name}|{len(column_failures)} values, e.g. {examples}')
+        if len(failures) > 0:
+            with open(os.path.join('results', self.now, f'{self.now}_parse_failures.json'), 'w') as f:
+                json.dump(failures, f, indent=4)
+
     def save_to_excel(self):
+        """
+        Optional export of the movies without the review texts.
+        """
         logger = logging.getLogger('root')
         logger.info('Saving movies in Excel||')
         self.result_file = os.path.join('results', self.now, f'{self.now}_empire_movies.xlsx')
-        labels = list({'InfoThumbnail', 'Picture', 'Introduction', 'Review'} & set(self.df.columns))
-        self.df.drop(labels=labels, axis=1, inplace=True)
+        columns = [name for name in self.store.load_table(self.now).column_names
+                   if name not in {'ID', 'Introduction', 'Review'}]
+        df = self.store.load(run=self.now, columns=columns)
         with open(self.result_file, 'wb') as f:
-            self.df.to_excel(f, index=True)
+            df.to_excel(f, index=True)
+
+    def save_profile(self):
+        """
+        Save the timings of all stages, aggregated over the workers, as a JSON summary.
+        """
+        logger = logging.getLogger('root')
+        logger.info('Saving profile||')
+        self.profile_file = os.path.join('results', self.now, f'{self.now}_profile.json')
+        get_profiler().save(self.profile_file)
+
+    def save_proxy_stats(self):
+        if self.proxies is None:
+            return
+        logger = logging.getLogger('root')
+        logger.info('Saving proxy stats||')
+        import pandas as pd
+        df_proxies = pd.DataFrame(self.proxies.get_stats()).sort_values('score', ascending=False)
+        df_proxies.to_csv(os.path.join('results', self.now, f'{self.now}_proxies.csv'), sep=';', index=False)
 
     @staticmethod
     def load_from_pickle(file):
@@ -239,109 +548,221 @@ class EmpireMovies(object):
             return pickle.load(f)
 
     def get_df(self):
+        if self.df is None and self.now in self.store.get_runs():
+            self.df = self.store.load(run=self.now)
         return self.df
 
-    @staticmethod
-    def __line_splitter(line):
-        return [i.strip() for i in line.split('|')]
+    def retry_failures(self):
+        """
+        Scrape the retryable reviews in the error ledger again, in parallel with the pipeline. They are fed from the
+        frontier by priority and the retried movies are appended to the checkpoint, where they replace the failed
+        ones. A review, which fails again, stays in the ledger with its attempts added up, so it is retried in the next
+        round (at most max_number_of_retries rounds).
+        :return: number of solved reviews
+        """
+        logger = logging.getLogger('root')
+        number_of_solved = 0
+        for _ in range(self.max_number_of_retries):
+            errors = self.ledger.get_retryable(kind='review')
+            if len(errors) == 0:
+                break
+            ids = {error['id'] for error in errors}
+            urls = [error['url'] for error in errors]
+            self.frontier.requeue(urls)
+            infos = self.frontier.get_pending(urls)
+            round_number = self.ledger.start_round()
+            logger.info(f'RetryFailures|{len(infos)}|round {round_number}')
+            if len(infos) == 0:
+                break
+
+            self.checkpoint.open()
+            try:
+                for movie in self.iter_movies_for_pages([], infos=infos):
+                    self.checkpoint.append(movie)
+                    self.mark_done(movie)
+            finally:
+                self.checkpoint.close()
+                self.search_index.commit()
+
+            # Reviews without a failure in this round have been solved
+            solved = [info_id for info_id in ids
+                      if (self.ledger.get(info_id) or {}).get('round', round_number) < round_number]
+            self.ledger.resolve(solved)
+            number_of_solved += len(solved)
+        logger.info(f'SolvedFailures|{number_of_solved}|{len(self.ledger)} left')
+        return number_of_solved
+
+    def process_images_in_pool(self):
+        """
+        Post-process the new thumbnails and pictures in a process pool; images of earlier runs are skipped.
+        """
+        if self.process_images:
+            self.image_processor.run(logging.getLogger('root'))
 
     @staticmethod
-    def __analyze_error_message(message):
-        solvable_error = True
-        if message[2].split('/')[4].startswith('55'):
-            solvable_error = False
-        elif message[2].count('/') > 6:
-            solvable_error = False
-        elif message[0] == '404':
-            solvable_error = False
-        else:
-            pass
-        return solvable_error
+    def check_image_files(movies):
+        """
+        The images are downloaded in the background, so only keep the paths of the images that made it to disk.
+        :param movies: dict with per ID a movie
+        """
+        for movie in movies.values():
+            for key in ['InfoThumbnail', 'Picture']:
+                image = movie.get(key)
+                if image is not None and image['File'] is not None and not os.path.exists(image['File']):
+                    image['File'] = None
 
-    def get_solvable_movies_from_log(self):
-        logger = logging.getLogger('root')
-        logger.info(f'Get solvable movies from log file||')
-        columns = ['asctime',
-                   'filename',
-                   'funcName',
-                   'lineno',
-                   'levelname',
-                   'message0',
-                   'message1',
-                   'message2']
-
-        with open(self.log_file, 'r') as f:
-            lines = f.readlines()
-        lines = [self.__line_splitter(line) for line in lines]
-        df_log_file = pd.DataFrame(data=lines, columns=columns)
-
-        df_error = df_log_file.query('levelname == "ERROR"')
-        if len(df_error) == 0:
-            logger.info(f'No errors found||')
+    def get_previous_pickle_file(self):
+        """
+        Find the pickle file of the most recent previous run.
+        :return: path of the pickle file or None
+        """
+        if not os.path.exists('results'):
             return None
+        for now in sorted(os.listdir('results'), reverse=True):
+            pickle_file = os.path.join('results', now, f'{now}_empire_movies.pickle')
+            if now != self.now and os.path.exists(pickle_file):
+                return pickle_file
+        return None
 
-        solvable_error = [EmpireMovies.__analyze_error_message(message)
-                          for message in df_error[['message0', 'message1', 'message2']].values]
-        df_error = df_error.assign(SolvableError=solvable_error)
-
-        logger.info(f'Saving errors to Excel||')
-        self.error_file = os.path.join('results', self.now, f'{self.now}_empire_movies_errors.xlsx')
-        df_error.to_excel(self.error_file, index=True)
+    def get_previous_movies(self):
+        """
+        Load the movies of the most recent previous run from the store (or from the pickle file of older runs).
+        :return: dict with the movies or None
+        """
+        logger = logging.getLogger('root')
+        runs = [run for run in self.store.get_runs() if run != self.now]
+        if len(runs) > 0:
+            logger.info(f'PreviousRun||{runs[-1]}')
+            return self.store.load_movies(runs[-1])
+        previous_file = self.get_previous_pickle_file()
+        if previous_file is not None:
+            logger.info(f'PreviousRun||{previous_file}')
+            return self.load_from_pickle(previous_file).movies
+        return None
 
-        query = 'SolvableError == True and message0 == "RequestsGetFailed"'
-        list_of_solvable_movies = list(df_error.query(query)['message1'].unique())
-        if len(list_of_solvable_movies) == 0:
-            logger.info(f'No movies to be solved||')
-            return None
+    @staticmethod
+    def merge_movies(previous_movies, new_movies):
+        """
+        Merge new movies into the movies of a previous run. The listing pages are sorted newest-first, so the new
+        movies come first and the IDs of the previous movies shift by the number of new movies.
+        :param previous_movies: dict with the movies of a previous run
+        :param new_movies: dict with the new movies
+        :return: dict with all movies
+        """
+        new_review_urls = {movie['InfoReviewUrl'] for movie in new_movies.values()}
+        ordered_movies = [new_movies[info_id] for info_id in sorted(new_movies)]
+        ordered_movies += [previous_movies[info_id] for info_id in sorted(previous_movies)
+                           if previous_movies[info_id]['InfoReviewUrl'] not in new_review_urls]
+        articles_per_page = max([movie['InfoArticle'] for movie in ordered_movies], default=1)
 
-        solvable_movies = dict()
-        [solvable_movies.update({key: value}) for key, value in self.movies.items() if key in list_of_solvable_movies]
-        return solvable_movies
+        movies = dict()
+        for position, movie in enumerate(ordered_movies):
+            page, article = position // articles_per_page + 1, position % articles_per_page + 1
+            info_id = f'{page:03d}-{article:02d}'
+            movies[info_id] = dict(movie)
+            movies[info_id]['InfoPage'] = page
+            movies[info_id]['InfoArticle'] = article
+            movies[info_id]['InfoUrl'] = f"https://www.empireonline.com/movies/reviews/{page}/"
+        return movies
 
-    def solve_movies(self):
+    def get_new_infos_for_page(self, page, logger, known_review_urls):
+        """
+        A listing page, which could not be fetched, says nothing about whether its reviews are known, so it is
+        retried instead of ending the walk.
+        :return: dict with the infos of the new reviews on the page
+        """
+        for _ in range(self.max_number_of_retries + 1):
+            infos = self.get_infos_for_page(page, logger=logger, known_review_urls=known_review_urls)
+            if infos is not None:
+                # Earlier failures of the page are in the ledger
+                self.ledger.resolve([f'{page:03d}'])
+                return infos
+        raise RuntimeError(f'Listing page {page} could not be fetched, so the new reviews are unknown; see the error '
+                           f'ledger')
+
+    def get_movies_incremental(self, pages=None):
+        """
+        Only scrape the reviews, which are new since the previous run. The listing pages are walked from page 1 until
+        a page only contains known reviews; the new movies are merged into the movies of the previous run. Without a
+        previous run, all pages are scraped to the checkpoint like a full crawl.
+        :param pages: upper bound for the listing pages (optional)
+        :return: dict with all movies
+        """
         logger = logging.getLogger('root')
 
-        solvable_movies = self.get_solvable_movies_from_log()
-        if solvable_movies is None:
-            logger.info(f'No movies to be solved||')
-            return None
-
-        # solved_movies = dict()
-        # for key, value in solvable_movies.items():
-        #     logger.info(f'GetReviewSolvableMovie|{key}|{value["InfoReviewUrl"]}')
-        #     solved_movie = self.get_movies_for_pages(value["InfoPage"], value["InfoArticle"])
-        #     if solved_movie is not None:
-        #         if solved_movie[key]["InfoMovie"] != value["InfoMovie"]:
-        #             logger.error(f'IDMismatch|{solved_movie[key]["InfoMovie"]}|{value["InfoMovie"]}')
-        #             return None
-        #         else:
-        #             solved_movies.update(solved_movie)
-        #return solved_movies
-
-    def get_movies(self, pages=None, article_number=None):
+        max_page = None
+        if pages is not None:
+            max_page = pages if isinstance(pages, int) else max(pages)
+
+        previous_movies = self.get_previous_movies()
+        if previous_movies is None:
+            logger.info('NoPreviousRun||')
+            self.scrape_to_checkpoint(None if max_page is None else range(1, max_page + 1))
+            self.retry_failures()
+            return self.checkpoint.get_movies()
+        known_review_urls = {movie['InfoReviewUrl'] for movie in previous_movies.values()}
+
+        infos = dict()
+        page = 1
+        while max_page is None or page <= max_page:
+            new_infos = self.get_new_infos_for_page(page, logger, known_review_urls)
+            if len(new_infos) == 0:
+                break
+            infos.update(new_infos)
+            page += 1
+        logger.info(f'NewReviews|{len(infos)}|{page} pages')
+
+        if len(infos) > 0:
+            infos = self.frontier.add_infos(infos)
+            self.checkpoint.open()
+            try:
+                for movie in self.iter_movies_for_pages([], infos=list(infos.values())):
+                    self.checkpoint.append(movie)
+                    self.mark_done(movie)
+            finally:
+                self.checkpoint.close()
+                self.search_index.commit()
+            # The IDs change when merging, so the failures are retried first
+            self.retry_failures()
+
+        return self.merge_movies(previous_movies, self.checkpoint.get_movies())
+
+    def get_movies(self, pages=None, article_number=None, incremental=False, resume=False):
+        """
+        :param incremental: only scrape the reviews, which are new since the previous run
+        :param resume: continue the most recent run and skip the IDs in its checkpoint
+        """
         logger = logging.getLogger('root')
 
         logger.info('Get movies||')
-        movies = self.get_movies_for_pages(pages, article_number)
-        self.movies = movies
-
-        logger.info('Solve movies||')
-        solved_movies = self.solve_movies()
-        #if solved_movies is not None:
-        #    self.movies.update(solved_movies)
+        if incremental:
+            # The merged movies are renumbered, so they are saved directly instead of via the checkpoint
+            self.movies = self.get_movies_incremental(pages)
+            self.process_images_in_pool()
+            self.check_image_files(self.movies)
+            self.image_processor.annotate(self.movies)
+            self.store.save(self.now, self.movies)
+            self.report_parse_failures()
+        else:
+            skip_ids = self.resume() if resume else None
+            self.scrape_to_checkpoint(pages, article_number, skip_ids)
+            logger.info('Retry failures||')
+            self.retry_failures()
+            self.process_images_in_pool()
+            self.save_to_store()
+
+        # The DataFrame is loaded lazily from the store by get_df
+        self.df = None
+        if self.export_excel:
+            self.save_to_excel()
 
-        logger.info('Create DataFrame||')
-        self.df = pd.DataFrame.from_dict(self.movies, orient='index')
-        self.df.index.name = 'ID'
-        self.save_to_pickle()
-        self.save_to_excel()
+        self.save_profile()
+        self.save_proxy_stats()
 
         logger.info('Copy log files||')
         shutil.copyfile('root.log', f'results/{self.now}/{self.now}_root.log')
         shutil.copyfile('empire_movies.log', f'results/{self.now}/{self.now}_empire_movies.log')
 
-        #return solved_movies
-
 
 def test_pages(pages, number_of_processors=2):
     E = EmpireMovies(process_images=True, number_of_processors=min(number_of_processors, 5))
@@ -352,8 +773,6 @@ def test_pages(pages, number_of_processors=2):
 
 
 if __name__ == '__main__':
-    with open('root.yaml', 'r') as fh:
-        config_root = yaml.load(fh.read())
-    dictConfig(config_root)
-    root_logger = logging.getLogger('root')
-    test_pages(range(1, 501), 5)
+    # python -m empire_scraper crawl --pages 1-500 --processors 5 is the same as test_pages(range(1, 501), 5)
+    from empire_scraper.cli import main
+    sys.exit(main())
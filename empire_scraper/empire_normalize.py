@@ -0,0 +1,204 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Formats of the dates, tried in this order; the normalized dates are ISO strings. Partial dates (a month or a year
+# only) have no format, so they are reported instead of becoming the 1st of the month
+DATE_FORMATS = {
+    'ReleaseDate': ['%d %b %Y', '%d %B %Y', '%Y-%m-%d'],
+    'DatePublished': ['%Y-%m-%d'],
+    'LastUpdate': ['%Y-%m-%d'],
+}
+
+# 2 hrs 32 mins, 152 minutes or 152
+RUNNING_TIME_PATTERN = r'^\D*(?:(?P<hours>\d+)\s*h(?:ou)?rs?\.?\s*)?(?P<minutes>\d+)?'
+# Numbers with more digits are no running time, and they could overflow int64
+MAX_DIGITS = 9
+
+# BBFC certificates; they come first in the dictionary of the Certificate column, so their codes are the same in
+# every part of the store
+CERTIFICATES = ['U', 'PG', '12', '12A', '15', '18', 'R18', 'TBC']
+
+RATINGS = ['Rating', 'InfoRating']
+MAX_RATING = 5
+
+# Types of the columns as they are captured by the workers, before normalization
+RAW_TYPES = {
+    'ReleaseDate': pa.string(),
+    'DatePublished': pa.string(),
+    'LastUpdate': pa.string(),
+    'RunningTime': pa.string(),
+    'Certificate': pa.string(),
+    'Rating': pa.int64(),
+    'InfoRating': pa.int64(),
+}
+
+
+def get_raw_type(field):
+    if field.name in RAW_TYPES:
+        return RAW_TYPES[field.name]
+    return pa.int64() if pa.types.is_integer(field.type) else field.type
+
+
+def get_raw_schema(schema):
+    """
+    :param schema: schema of the store
+    :return: same schema with the raw types of the normalized columns; the narrow integer columns are captured as
+        int64, so a value out of their range is reported by the normalization instead of raising
+    """
+    return pa.schema([pa.field(field.name, get_raw_type(field)) for field in schema])
+
+
+def to_raw_value(name, value):
+    """
+    Raw value of a column of a movie; movies from the store are normalized already, so e.g. their running time is an
+    int, which is turned back into a string.
+    """
+    if value is None or RAW_TYPES.get(name) != pa.string():
+        return value
+    return str(value)
+
+
+def empty_to_null(array):
+    return pc.if_else(pc.equal(array, ''), pa.scalar(None, pa.string()), array)
+
+
+def is_present(array):
+    """
+    :return: boolean array, which is true for the values, which are not null or empty
+    """
+    if pa.types.is_string(array.type):
+        return pc.fill_null(pc.not_equal(pc.utf8_trim_whitespace(array), ''), False)
+    return pc.is_valid(array)
+
+
+def get_date_key(array):
+    """
+    :return: array with the dates in lower case, with single spaces and without leading zeros, so 1 feb 2018 and
+    01 Feb 2018 are the same
+    """
+    array = pc.replace_substring_regex(pc.utf8_lower(array), pattern=r'\s+', replacement=' ')
+    return pc.replace_substring_regex(array, pattern=r'\b0+(\d)', replacement=r'\1')
+
+
+def normalize_date(array, formats):
+    """
+    A parse only counts if it formats back to the input: strptime rolls over impossible dates, e.g. 31 Feb 2018
+    becomes 3 March.
+    :return: array with the dates as ISO strings; null if no format matches
+    """
+    array = empty_to_null(pc.utf8_trim_whitespace(array))
+    key = get_date_key(array)
+    result = pa.nulls(len(array), pa.timestamp('s'))
+    for date_format in formats:
+        parsed = pc.strptime(array, format=date_format, unit='s', error_is_null=True)
+        valid = pc.fill_null(pc.equal(get_date_key(pc.strftime(parsed, format=date_format)), key), False)
+        result = pc.coalesce(result, pc.if_else(valid, parsed, pa.scalar(None, pa.timestamp('s'))))
+    return pc.strftime(result, format='%Y-%m-%d')
+
+
+def get_integer_range(type):
+    """
+    :return: smallest and largest value of an integer type
+    """
+    if pa.types.is_signed_integer(type):
+        return -2 ** (type.bit_width - 1), 2 ** (type.bit_width - 1) - 1
+    return 0, 2 ** type.bit_width - 1
+
+
+def narrow_integer(array, type):
+    """
+    :return: array with the integers as type; null if the integer is out of the range of type
+    """
+    array = pc.cast(array, pa.int64())
+    low, high = get_integer_range(type)
+    valid = pc.and_(pc.greater_equal(array, low), pc.less_equal(array, high))
+    return pc.cast(pc.if_else(valid, array, pa.scalar(None, pa.int64())), type)
+
+
+def parse_digits(array):
+    """
+    :return: array with the numbers (int64); null if empty or longer than MAX_DIGITS
+    """
+    array = empty_to_null(array)
+    array = pc.if_else(pc.greater(pc.utf8_length(array), MAX_DIGITS), pa.scalar(None, pa.string()), array)
+    return pc.cast(array, pa.int64())
+
+
+def normalize_running_time(array):
+    """
+    :return: array with the running times in minutes (int16); null if the running time does not fit
+    """
+    groups = pc.extract_regex(empty_to_null(pc.utf8_trim_whitespace(array)), RUNNING_TIME_PATTERN)
+    hours = parse_digits(pc.struct_field(groups, 'hours'))
+    minutes = parse_digits(pc.struct_field(groups, 'minutes'))
+    total = pc.add(pc.multiply(pc.coalesce(hours, 0), 60), pc.coalesce(minutes, 0))
+    total = pc.if_else(pc.and_(pc.is_null(hours), pc.is_null(minutes)), pa.scalar(None, pa.int64()), total)
+    return narrow_integer(total, pa.int16())
+
+
+def normalize_certificate(array):
+    """
+    :return: dictionary array with the certificates; unknown certificates are added after the known ones
+    """
+    array = empty_to_null(pc.utf8_upper(pc.utf8_trim_whitespace(array)))
+    unknown = sorted(set(pc.unique(array).drop_null().to_pylist()) - set(CERTIFICATES))
+    dictionary = pa.array(CERTIFICATES + unknown, pa.string())
+    indices = pc.cast(pc.index_in(array, value_set=dictionary), pa.int8())
+    return pa.DictionaryArray.from_arrays(indices, dictionary)
+
+
+def normalize_rating(array):
+    """
+    :return: array with the ratings (int8); null if the rating is not between 0 and MAX_RATING
+    """
+    array = pc.cast(array, pa.int64())
+    valid = pc.and_(pc.greater_equal(array, 0), pc.less_equal(array, MAX_RATING))
+    return pc.cast(pc.if_else(valid, array, pa.scalar(None, pa.int64())), pa.int8())
+
+
+def get_failures(table, raw, failed):
+    """
+    :return: list with the ID and the raw value of every failed row
+    """
+    if not pc.any(failed).as_py():
+        return []
+    return list(zip(table['ID'].filter(failed).to_pylist(), raw.filter(failed).to_pylist()))
+
+
+def normalize_table(table, schema):
+    """
+    Vectorized normalization of the raw columns of a batch of movies: the dates are parsed to ISO strings, the
+    running time is extracted in minutes, the certificates become categorical codes and the ratings and the other
+    integers are narrowed to small ints.
+    A value, which can not be parsed, becomes null and is reported instead of raising; an unknown certificate is
+    kept, but reported as well.
+    :param table: pyarrow Table with the raw columns
+    :param schema: schema of the normalized table
+    :return: normalized Table and dict with per column a list with the ID and the raw value of the failures
+    """
+    failures = dict()
+    columns = dict()
+    for name in table.column_names:
+        raw = table[name].combine_chunks()
+        if name in DATE_FORMATS:
+            normalized = normalize_date(raw, DATE_FORMATS[name])
+        elif name == 'RunningTime':
+            normalized = normalize_running_time(raw)
+        elif name == 'Certificate':
+            normalized = normalize_certificate(raw)
+        elif name in RATINGS:
+            normalized = normalize_rating(raw)
+        elif pa.types.is_integer(schema.field(name).type):
+            normalized = narrow_integer(raw, schema.field(name).type)
+        else:
+            columns[name] = raw
+            continue
+        if name == 'Certificate':
+            failed = pc.fill_null(pc.greater_equal(normalized.indices, len(CERTIFICATES)), False)
+        else:
+            failed = pc.and_(is_present(raw), pc.is_null(normalized))
+        column_failures = get_failures(table, raw, failed)
+        if len(column_failures) > 0:
+            failures[name] = column_failures
+        columns[name] = normalized
+    return pa.Table.from_pydict(columns, schema=schema), failures
@@ -0,0 +1,315 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+from empire_scraper.empire_helpers import configure_worker_logging, flush_worker_logging
+from empire_scraper.empire_profiler import get_profiler
+from empire_scraper.empire_images import get_image_downloader
+from empire_scraper.empire_record import MovieRecord
+
+
+def listing_worker(empire_movies, page_queue, article_queue, result_queue, log_queue, article_number=None,
+                   skip_ids=None):
+    """
+    First stage: parse listing pages and add the info of every article to the frontier, from which the main process
+    feeds the review workers. Articles with an ID in skip_ids (e.g. from the checkpoint of a resumed run) and
+    reviews, which are in the frontier already (e.g. because they shifted to the next page), are skipped. Articles
+    without a review URL can not be in the frontier, so they are put in the (bounded) article queue directly.
+    """
+    try:
+        configure_worker_logging(log_queue)
+        while True:
+            page = page_queue.get()
+            if page is None:
+                break
+            logger = logging.getLogger(f'sub_logger{page}')
+            # noinspection PyBroadException
+            try:
+                infos = empire_movies.get_infos_for_page(page, article_number, logger, known_ids=skip_ids)
+            except Exception as e:
+                logger.error(f'ListingWorkerFailed|{page}|{str(e)}')
+                infos = None
+            if infos is not None:
+                infos = empire_movies.frontier.add_infos(infos)
+                empire_movies.metrics.inc('reviews_found', len(infos))
+                for info_id, info in infos.items():
+                    if info[info_id]['InfoReviewUrl'] is None:
+                        article_queue.put(info)
+            result_queue.put(('page', page))
+        # The thumbnails are downloaded in the background
+        get_image_downloader().wait()
+    finally:
+        # The articles are sent by a feeder thread of the queue, so they have to be in the pipe before the main
+        # process is told that this worker is done and puts the sentinels of the review threads behind them
+        article_queue.close()
+        article_queue.join_thread()
+        flush_worker_logging()
+        result_queue.put(('profile', get_profiler().drain()))
+        result_queue.put(('done', ('listing', multiprocessing.current_process().name)))
+
+
+def get_batch(article_queue, batch_size):
+    """
+    Wait for an info and take the infos, which are waiting in the article queue already, up to batch_size.
+    :return: list with the infos and whether the sentinel has been taken
+    """
+    infos = []
+    while len(infos) < batch_size:
+        try:
+            info = article_queue.get() if len(infos) == 0 else article_queue.get_nowait()
+        except queue.Empty:
+            break
+        if info is None:
+            return infos, True
+        infos.append(info)
+    return infos, False
+
+
+def review_worker(empire_movies, article_queue, result_queue, log_queue, number_of_threads=10):
+    """
+    Second stage: turn the article infos into movies. Every process runs several threads, which share the fetch engine
+    of the process. A thread takes a batch of infos and fetches their reviews at once on the event loop of the fetch
+    engine, so the threads of a process keep up to max_concurrency requests in flight, while the parsing is spread
+    over the threads and the processes.
+    """
+    batch_size = max(1, empire_movies.fetcher_settings['max_concurrency'] // number_of_threads)
+
+    def consume():
+        stop = False
+        while not stop:
+            infos, stop = get_batch(article_queue, batch_size)
+            if len(infos) == 0:
+                continue
+            first_id = list(infos[0].keys())[0]
+            logger = logging.getLogger(f'sub_logger{infos[0][first_id]["InfoPage"]}')
+            # noinspection PyBroadException
+            try:
+                reviews = empire_movies.fetch_reviews(infos, logger)
+            except Exception as e:
+                # Every review is fetched on its own instead
+                logger.error(f'FetchReviewsFailed|{first_id}|{str(e)}')
+                reviews = dict()
+            for info in infos:
+                info_id = list(info.keys())[0]
+                logger = logging.getLogger(f'sub_logger{info[info_id]["InfoPage"]}')
+                # noinspection PyBroadException
+                try:
+                    html = reviews.get(info[info_id]['InfoReviewUrl'])
+                    movie, _ = empire_movies.get_movie_for_info(info, logger, html)
+                except Exception as e:
+                    logger.error(f'ReviewWorkerFailed|{info_id}|{str(e)}')
+                    empire_movies.ledger.record(info_id, info[info_id]['InfoReviewUrl'],
+                                                error_class=type(e).__name__)
+                    movie = info
+                # A compact record instead of the dict keeps the pickles small
+                result_queue.put(('movie', MovieRecord.from_movie(info_id, movie[info_id])))
+
+    try:
+        configure_worker_logging(log_queue)
+        threads = [threading.Thread(target=consume, name=f'review{i}') for i in range(number_of_threads)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        # The pictures are downloaded in the background
+        get_image_downloader().wait()
+    finally:
+        flush_worker_logging()
+        result_queue.put(('profile', get_profiler().drain()))
+        result_queue.put(('done', ('review', multiprocessing.current_process().name)))
+
+
+class EmpirePipeline(object):
+    """
+    Streaming producer/consumer pipeline for scraping pages. Movies are yielded as soon as they are finished, so
+    the review throughput does not depend on how the articles are spread across the pages.
+    """
+
+    def __init__(self, empire_movies, number_of_listing_workers=1, number_of_review_workers=1,
+                 number_of_review_threads=10, queue_size=100, poll_interval=1.0, feed_interval=0.1):
+        self.empire_movies = empire_movies
+        self.number_of_listing_workers = number_of_listing_workers
+        self.number_of_review_workers = number_of_review_workers
+        self.number_of_review_threads = number_of_review_threads
+        self.queue_size = queue_size
+        # Seconds between two checks whether the workers are still alive
+        self.poll_interval = poll_interval
+        # Seconds between two looks for new reviews in the frontier, while the listing workers are busy
+        self.feed_interval = feed_interval
+        self.number_of_pages = 0
+        self.number_of_movies = 0
+
+    def put_info(self, article_queue, info, stop):
+        """
+        Put an info in the article queue, unless the pipeline stops while the queue is full.
+        """
+        while not stop.is_set():
+            try:
+                article_queue.put(info, timeout=self.poll_interval)
+                return
+            except queue.Full:
+                pass
+
+    def feed_infos(self, infos, article_queue, result_queue, stop):
+        """
+        Replaces the first stage if the article infos are known already.
+        """
+        try:
+            for info in infos:
+                self.put_info(article_queue, info, stop)
+        finally:
+            result_queue.put(('done', ('feeder', 'infos')))
+
+    def feed_frontier(self, article_queue, result_queue, listing_finished, stop):
+        """
+        Feed the review workers from the frontier, to which the listing workers add the reviews: the pending
+        reviews are handed out by priority (newest first) in batches of at most the size of the article queue, so a
+        review of a lower page, which is found later, is still scraped before the reviews of the higher pages, which
+        are not in the queue yet.
+        """
+        frontier = self.empire_movies.frontier
+        try:
+            while not stop.is_set():
+                # Checked before the claim, so the reviews of the last listing pages are in the frontier already
+                finished = listing_finished.is_set()
+                infos = frontier.claim_pending(self.queue_size)
+                for info in infos:
+                    self.put_info(article_queue, info, stop)
+                if len(infos) == 0:
+                    if finished:
+                        break
+                    stop.wait(self.feed_interval)
+        finally:
+            result_queue.put(('done', ('feeder', 'frontier')))
+
+    @staticmethod
+    def check_workers(processes, finished, suspects):
+        """
+        A worker, which has exited without saying it is done (e.g. killed by the OOM killer, a segfault or an error
+        before its sentinel), would leave the pipeline waiting forever, so the pipeline fails instead. Its finished
+        movies are in the checkpoint already, so the run can be resumed. A dead worker is only given up on at the
+        next check, so the messages it sent before exiting have been read.
+        :param finished: names of the workers, which are done
+        :param suspects: names of the workers, which were found dead at the previous check
+        """
+        for process in processes:
+            if process.is_alive() or process.name in finished:
+                continue
+            if process.name not in suspects:
+                suspects.add(process.name)
+                continue
+            logging.getLogger('root').error(f'WorkerDied|{process.name}|exitcode {process.exitcode}')
+            raise RuntimeError(f'Worker {process.name} died with exit code {process.exitcode}; resume the run to '
+                               f'scrape the remaining reviews')
+
+    @staticmethod
+    def put_sentinels(article_queue, number_of_sentinels):
+        """
+        Put as many sentinels in the article queue as fit without waiting.
+        :return: number of sentinels, which did not fit
+        """
+        while number_of_sentinels > 0:
+            try:
+                article_queue.put_nowait(None)
+            except queue.Full:
+                break
+            number_of_sentinels -= 1
+        return number_of_sentinels
+
+    def run(self, pages, article_number=None, log_queue=None, infos=None, skip_ids=None):
+        """
+        :param pages: list of listing pages
+        :param article_number: only scrape this article of every page (optional)
+        :param log_queue: queue of the logging listener
+        :param infos: list of article infos, which are scraped instead of the pages (optional)
+        :param skip_ids: set of IDs, which are not scraped (optional)
+        :return: generator, which yields a dict with a single movie
+        """
+        page_queue = multiprocessing.Queue()
+        article_queue = multiprocessing.Queue(maxsize=self.queue_size)
+        result_queue = multiprocessing.Queue()
+
+        number_of_listing_workers = self.number_of_listing_workers if infos is None else 0
+        for page in pages:
+            page_queue.put(page)
+        for _ in range(number_of_listing_workers):
+            page_queue.put(None)
+
+        # The frontier is created before the workers are forked, so they do not race to switch it to WAL
+        self.empire_movies.frontier.connect()
+        self.empire_movies.frontier.close()
+
+        processes = []
+        for i in range(number_of_listing_workers):
+            processes.append(multiprocessing.Process(target=listing_worker,
+                                                     name=f'listing{i}',
+                                                     args=(self.empire_movies, page_queue, article_queue,
+                                                           result_queue, log_queue, article_number, skip_ids)))
+        for i in range(self.number_of_review_workers):
+            processes.append(multiprocessing.Process(target=review_worker,
+                                                     name=f'review{i}',
+                                                     args=(self.empire_movies, article_queue, result_queue,
+                                                           log_queue, self.number_of_review_threads)))
+        [process.start() for process in processes]
+
+        # The main process has to keep draining the results, so the review workers are fed from a thread. It is only
+        # started after the workers, so they are never forked while it holds the lock of the frontier
+        listing_finished, stop = threading.Event(), threading.Event()
+        if infos is not None:
+            feeder = threading.Thread(target=self.feed_infos, name='feeder',
+                                      args=(infos, article_queue, result_queue, stop), daemon=True)
+        else:
+            feeder = threading.Thread(target=self.feed_frontier, name='feeder',
+                                      args=(article_queue, result_queue, listing_finished, stop), daemon=True)
+        feeder.start()
+
+        try:
+            listing_done, review_done = 0, 0
+            finished, suspects = set(), set()
+            # Sentinels for the review threads, which did not fit in the article queue yet
+            number_of_sentinels = 0
+            next_check = time.monotonic() + self.poll_interval
+            while review_done < self.number_of_review_workers:
+                if time.monotonic() >= next_check:
+                    self.check_workers(processes, finished, suspects)
+                    next_check = time.monotonic() + self.poll_interval
+                # The sentinels are never put blocking, so a dead review worker can not hang the main process
+                number_of_sentinels = self.put_sentinels(article_queue, number_of_sentinels)
+                try:
+                    kind, value = result_queue.get(timeout=self.poll_interval)
+                except queue.Empty:
+                    continue
+                if kind == 'movie':
+                    self.number_of_movies += 1
+                    self.empire_movies.metrics.inc('reviews_done')
+                    yield dict([value.to_movie()])
+                elif kind == 'page':
+                    self.number_of_pages += 1
+                    self.empire_movies.metrics.inc('pages_done')
+                elif kind == 'profile':
+                    # The timings of the workers are aggregated in the profiler of the main process
+                    get_profiler().merge(value)
+                elif value[0] == 'listing':
+                    finished.add(value[1])
+                    listing_done += 1
+                    if listing_done == number_of_listing_workers:
+                        # The feeder stops once it has handed out all reviews in the frontier
+                        listing_finished.set()
+                elif value[0] == 'feeder':
+                    # All articles are in the queue, so the review threads can stop once it is empty
+                    number_of_sentinels = self.number_of_review_workers * self.number_of_review_threads
+                    number_of_sentinels = self.put_sentinels(article_queue, number_of_sentinels)
+                else:
+                    finished.add(value[1])
+                    review_done += 1
+        finally:
+            stop.set()
+            feeder.join()
+            for process in processes:
+                if process.is_alive() and review_done < self.number_of_review_workers:
+                    process.terminate()
+                process.join()
+            # What is left in the queues after a failure is never read, so the main process must not wait at exit
+            # until it has been sent
+            article_queue.cancel_join_thread()
+            result_queue.cancel_join_thread()
@@ -0,0 +1,100 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class EmpireProfiler(object):
+    """
+    Collects samples per stage (wall time in seconds, or bytes for the stages starting with 'bytes'). Every process
+    has its own profiler; the samples of the workers are drained and merged into the profiler of the main process.
+    """
+
+    # Upper bounds of the histogram buckets in seconds
+    buckets = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 60, math.inf]
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def record(self, stage, value):
+        if self.enabled:
+            with self.lock:
+                self.samples[stage].append(value)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def drain(self):
+        """
+        :return: dict with the samples per stage, which are removed from the profiler
+        """
+        with self.lock:
+            samples, self.samples = dict(self.samples), defaultdict(list)
+        return samples
+
+    def merge(self, samples):
+        with self.lock:
+            for stage, values in samples.items():
+                self.samples[stage].extend(values)
+
+    @staticmethod
+    def __percentile(values, percentage):
+        # Nearest-rank percentile of sorted values
+        return values[max(int(math.ceil(percentage / 100 * len(values))) - 1, 0)]
+
+    def get_summary(self):
+        """
+        :return: dict with per stage the count, total, mean, percentiles and (for timings) a histogram
+        """
+        summary = dict()
+        with self.lock:
+            samples = {stage: sorted(values) for stage, values in self.samples.items() if len(values) > 0}
+        for stage, values in sorted(samples.items()):
+            summary[stage] = {
+                'count': len(values),
+                'total': sum(values),
+                'mean': sum(values) / len(values),
+                'min': values[0],
+                'p50': self.__percentile(values, 50),
+                'p95': self.__percentile(values, 95),
+                'p99': self.__percentile(values, 99),
+                'max': values[-1],
+            }
+            if not stage.startswith('bytes'):
+                histogram, i = dict(), 0
+                for bucket in self.buckets:
+                    count = 0
+                    while i < len(values) and values[i] <= bucket:
+                        count += 1
+                        i += 1
+                    histogram[f'le_{bucket}'] = count
+                summary[stage]['histogram'] = histogram
+        return summary
+
+    def save(self, file):
+        with open(file, 'w') as f:
+            json.dump(self.get_summary(), f, indent=4)
+
+
+_profiler = None
+
+
+def get_profiler():
+    """
+    Get the profiler of the current process.
+    """
+    global _profiler
+    if _profiler is None or _profiler.pid != os.getpid():
+        _profiler = EmpireProfiler()
+    return _profiler
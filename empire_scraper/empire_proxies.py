@@ -0,0 +1,126 @@
+import multiprocessing
+import random
+import threading
+import time
+from multiprocessing.context import get_spawning_popen
+
+
+class ProxyScheduler(object):
+    """
+    Routes requests to the healthiest proxies.
+
+    Per proxy the scheduler keeps the number of successes and failures, an EWMA of the latency, the number of
+    consecutive failures and the time until which the proxy is quarantined. The state lives in shared memory, so all
+    worker processes, which are created with the scheduler, learn from each other. A proxy is chosen with the power of
+    two choices: the better of two random healthy proxies. After max_consecutive_failures the proxy is quarantined;
+    every failed re-probe doubles the quarantine (up to max_quarantine seconds).
+    """
+
+    fields = ['successes', 'failures', 'consecutive_failures', 'latency', 'quarantine_until']
+
+    def __init__(self, proxies, alpha=0.3, initial_latency=1.0, max_consecutive_failures=3, quarantine=30,
+                 max_quarantine=1800):
+        """
+        :param proxies: list of proxies in the format of requests
+        :param alpha: weight of the latest latency in the EWMA
+        :param initial_latency: latency in seconds of a proxy, which has not been used yet
+        :param max_consecutive_failures: number of consecutive failures after which a proxy is quarantined
+        :param quarantine: quarantine in seconds after the first max_consecutive_failures failures
+        :param max_quarantine: maximum quarantine in seconds
+        """
+        self.proxies = proxies
+        self.alpha = alpha
+        self.max_consecutive_failures = max_consecutive_failures
+        self.quarantine = quarantine
+        self.max_quarantine = max_quarantine
+        self.state = multiprocessing.Array('d', len(proxies) * len(self.fields))
+        self.lock = self.state.get_lock()
+        for i in range(len(proxies)):
+            self.__set(i, 'latency', initial_latency)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if get_spawning_popen() is None:
+            # Pickled outside of the creation of a process (e.g. in save_to_pickle): keep a snapshot of the state
+            state['state'] = list(self.state)
+            state['lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.lock is None:
+            self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.proxies)
+
+    def __get(self, i, field):
+        return self.state[i * len(self.fields) + self.fields.index(field)]
+
+    def __set(self, i, field, value):
+        self.state[i * len(self.fields) + self.fields.index(field)] = value
+
+    def get_score(self, i):
+        """
+        Estimated success rate (with a uniform prior) per second of latency.
+        """
+        successes, failures = self.__get(i, 'successes'), self.__get(i, 'failures')
+        success_rate = (successes + 1) / (successes + failures + 2)
+        return success_rate / (self.__get(i, 'latency') + 0.1)
+
+    def choose(self):
+        """
+        :return: index and proxy, or (None, None) if there are no proxies
+        """
+        if len(self.proxies) == 0:
+            return None, None
+        now = time.time()
+        with self.lock:
+            healthy = [i for i in range(len(self.proxies)) if self.__get(i, 'quarantine_until') <= now]
+            if len(healthy) == 0:
+                # Every proxy is in quarantine: re-probe the one that is released first
+                i = min(range(len(self.proxies)), key=lambda j: self.__get(j, 'quarantine_until'))
+            elif len(healthy) == 1:
+                i = healthy[0]
+            else:
+                i, j = random.sample(healthy, 2)
+                i = i if self.get_score(i) >= self.get_score(j) else j
+        return i, self.proxies[i]
+
+    def report(self, i, success, latency=None):
+        """
+        Update the state of a proxy after a request.
+        :return: quarantine in seconds if the proxy has been quarantined, else None
+        """
+        if i is None:
+            return None
+        with self.lock:
+            if success:
+                self.__set(i, 'successes', self.__get(i, 'successes') + 1)
+                self.__set(i, 'consecutive_failures', 0)
+                if latency is not None:
+                    self.__set(i, 'latency', self.alpha * latency + (1 - self.alpha) * self.__get(i, 'latency'))
+                return None
+
+            self.__set(i, 'failures', self.__get(i, 'failures') + 1)
+            consecutive_failures = self.__get(i, 'consecutive_failures') + 1
+            self.__set(i, 'consecutive_failures', consecutive_failures)
+            if consecutive_failures < self.max_consecutive_failures:
+                return None
+            exponent = consecutive_failures - self.max_consecutive_failures
+            quarantine = min(self.quarantine * 2 ** exponent, self.max_quarantine)
+            self.__set(i, 'quarantine_until', time.time() + quarantine)
+            return quarantine
+
+    def get_stats(self):
+        """
+        :return: list with a dict per proxy
+        """
+        with self.lock:
+            stats = []
+            for i, proxy in enumerate(self.proxies):
+                stat = {field: self.__get(i, field) for field in self.fields}
+                stat['proxy'] = list(proxy.values())[0] if len(proxy) > 0 else None
+                stat['score'] = self.get_score(i)
+                stats.append(stat)
+        return stats
@@ -0,0 +1,208 @@
+import asyncio
+import collections
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+
+class TokenBucket(object):
+    """
+    Token bucket, which is used from the event loop of the fetch engine only. A request reserves a token right away,
+    possibly running into debt, so the waiting requests are served in order at the configured rate.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: number of tokens per second
+        :param capacity: maximum number of tokens, i.e. the burst size (defaults to the rate, but at least 1)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def reserve(self):
+        """
+        Take a token.
+        :return: number of seconds to wait before the token may be used
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= 1
+        return max(0, -self.tokens / self.rate)
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RateLimiter(object):
+    """
+    Global and per-host token buckets. A rate of None means unlimited.
+    """
+
+    def __init__(self, rate=None, rate_per_host=None, burst=None):
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.bucket = None if rate is None else TokenBucket(rate, burst)
+        self.host_buckets = dict()
+
+    def __get_host_bucket(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.host_buckets:
+            self.host_buckets[host] = TokenBucket(self.rate_per_host, self.burst)
+        return self.host_buckets[host]
+
+    def reserve(self, url):
+        """
+        :return: number of seconds to wait before the request may be sent
+        """
+        wait = 0
+        if self.bucket is not None:
+            wait = self.bucket.reserve()
+        if self.rate_per_host is not None:
+            wait = max(wait, self.__get_host_bucket(url).reserve())
+        return wait
+
+    async def acquire(self, url):
+        wait = self.reserve(url)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class AdaptiveLimiter(object):
+    """
+    Concurrency limit with additive increase and multiplicative decrease (AIMD), which is used from the event loop of
+    the fetch engine only. It is used like an asyncio.Semaphore; the outcome of every request is reported with
+    report.
+
+    The limit starts at initial and grows by 1 per success (slow start) until the first congestion signal, after
+    which it grows by 1 per limit successes, i.e. by about one slot per round trip. A failure (e.g. a 429, a 5xx or a
+    timeout) halves the limit and a latency of more than latency_factor times the baseline shrinks it by
+    latency_decrease. The baseline is the lowest latency of the last latency_window successes of the same class (e.g.
+    listing or review), so one unusually fast response only lowers it for a while. Every decrease only counts once
+    per round trip: outcomes of requests, which started before the last decrease, do not decrease the limit again.
+    The limit stays between min_limit and max_limit.
+    """
+
+    def __init__(self, min_limit=1, max_limit=10, initial=None, decrease=0.5, latency_factor=3.0,
+                 latency_decrease=0.9, latency_window=50, on_change=None):
+        """
+        :param latency_window: number of latencies per class, of which the lowest is the baseline
+        :param on_change: function, which is called with the old and the new (integer) limit
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min_limit if initial is None else min(max(initial, min_limit), max_limit))
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latency_decrease = latency_decrease
+        self.latency_window = latency_window
+        self.on_change = on_change
+        self.slow_start = True
+        self.latencies = dict()
+        self.last_decrease = 0.0
+        self.in_flight = 0
+        self.waiters = collections.deque()
+        if self.on_change is not None:
+            self.on_change(0, int(self.limit))
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                raise
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self.__wake()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def __wake(self):
+        # A woken waiter checks the limit again, so waking one too many is harmless
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def __set_limit(self, limit):
+        old = int(self.limit)
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+        if self.on_change is not None and int(self.limit) != old:
+            self.on_change(old, int(self.limit))
+        self.__wake()
+
+    def get_baseline(self, latency_class=None):
+        """
+        :return: lowest recent latency of a class in seconds or None
+        """
+        latencies = self.latencies.get(latency_class)
+        return min(latencies) if latencies else None
+
+    def report(self, start, success, latency=None, latency_class=None):
+        """
+        :param start: time.perf_counter() at which the request was sent
+        :param success: whether the server handled the request, False for signs of overload
+        :param latency: duration of the request in seconds (only for successes)
+        :param latency_class: class of the request, of which the latency is compared with the baseline of the same
+        class only, e.g. listing or review
+        """
+        if not success:
+            self.__decrease(start, self.decrease)
+            return
+        if latency is not None:
+            if latency_class not in self.latencies:
+                self.latencies[latency_class] = collections.deque(maxlen=self.latency_window)
+            self.latencies[latency_class].append(latency)
+            if latency > self.latency_factor * self.get_baseline(latency_class):
+                self.__decrease(start, self.latency_decrease)
+                return
+        self.__set_limit(self.limit + (1 if self.slow_start else 1 / self.limit))
+
+    def __decrease(self, start, factor):
+        self.slow_start = False
+        if start < self.last_decrease:
+            return
+        self.last_decrease = time.perf_counter()
+        self.__set_limit(self.limit * factor)
+
+
+def get_backoff(number_of_attempts, base=0.5, cap=30):
+    """
+    Exponential backoff with full jitter.
+    :param number_of_attempts: number of attempts so far (at least 1)
+    :return: number of seconds to wait
+    """
+    return random.uniform(0, min(cap, base * 2 ** (number_of_attempts - 1)))
+
+
+def parse_retry_after(value):
+    """
+    :param value: Retry-After header in seconds or as HTTP date
+    :return: number of seconds to wait or None
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
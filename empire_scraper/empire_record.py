@@ -0,0 +1,119 @@
+import json
+import sys
+from operator import attrgetter
+
+
+class MovieRecord(object):
+    """
+    Compact record of a movie with a slot per column of the store instead of a (nested) dict per movie. The
+    thumbnail and the picture are flattened and the info entries of a review, which have no slot, are kept in
+    ExtraInfo. Fields with few distinct values are interned, so all records share the same string objects, and a
+    record is pickled as a plain tuple of its values.
+    """
+
+    __slots__ = ['ID', 'InfoPage', 'InfoArticle', 'InfoUrl', 'InfoMovie', 'IsEssay', 'InfoReviewUrl', 'InfoRating',
+                 'InfoThumbnailSource', 'InfoThumbnailFile', 'InfoThumbnailWidth', 'InfoThumbnailHeight',
+                 'InfoThumbnailBytes', 'InfoThumbnailHash', 'ReleaseDate', 'Certificate', 'RunningTime', 'Rating',
+                 'Author', 'DatePublished', 'LastUpdate', 'Introduction', 'Review', 'PictureSource', 'PictureFile',
+                 'PictureWidth', 'PictureHeight', 'PictureBytes', 'PictureHash', 'ExtraInfo']
+
+    # Categorical fields, which are interned
+    categorical = ['InfoUrl', 'Certificate', 'Author']
+
+    # Sub-dicts of a movie in the format of EmpireMovie, which are flattened; the dimensions, byte size and hash are
+    # added by the ImageProcessor
+    nested = {'InfoThumbnail': ['Source', 'File', 'Width', 'Height', 'Bytes', 'Hash'],
+              'Picture': ['Source', 'File', 'Width', 'Height', 'Bytes', 'Hash']}
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.get(name))
+        self.__intern()
+
+    def __intern(self):
+        for name in self.categorical:
+            value = getattr(self, name)
+            if isinstance(value, str):
+                setattr(self, name, sys.intern(value))
+
+    def __reduce__(self):
+        return MovieRecord.from_values, (self.get_values(),)
+
+    def __eq__(self, other):
+        return isinstance(other, MovieRecord) and self.get_values() == other.get_values()
+
+    def __repr__(self):
+        return f'MovieRecord({self.ID}, {self.InfoMovie})'
+
+    def get_values(self):
+        return _get_values(self)
+
+    @classmethod
+    def from_values(cls, values):
+        record = cls.__new__(cls)
+        for name, value in zip(cls.__slots__, values):
+            setattr(record, name, value)
+        record.__intern()
+        return record
+
+    @classmethod
+    def from_movie(cls, info_id, movie):
+        """
+        :param info_id: ID of the movie
+        :param movie: dict with the movie in the format of EmpireMovie
+        """
+        record = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(record, name, None)
+        record.ID = info_id
+        extra_info = dict()
+        for key, value in movie.items():
+            if key in cls.nested:
+                for sub_key in cls.nested[key]:
+                    setattr(record, f'{key}{sub_key}', None if value is None else value.get(sub_key))
+            elif key in cls.__slots__ and key not in ['ID', 'ExtraInfo']:
+                setattr(record, key, value)
+            else:
+                extra_info[key] = value
+        record.ExtraInfo = extra_info if len(extra_info) > 0 else None
+        record.__intern()
+        return record
+
+    def to_movie(self):
+        """
+        Inverse of from_movie; fields without a value are None.
+        :return: ID and dict with the movie in the format of EmpireMovie
+        """
+        movie = dict()
+        for key, sub_keys in self.nested.items():
+            sub_values = {sub_key: getattr(self, f'{key}{sub_key}') for sub_key in sub_keys}
+            movie[key] = None if all(value is None for value in sub_values.values()) else sub_values
+        flattened = {f'{key}{sub_key}' for key, sub_keys in self.nested.items() for sub_key in sub_keys}
+        for name in self.__slots__:
+            if name not in flattened and name not in ['ID', 'ExtraInfo']:
+                movie[name] = getattr(self, name)
+        if self.ExtraInfo is not None:
+            movie.update(self.ExtraInfo)
+        return self.ID, movie
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        :param row: dict with a row of the store (ExtraInfo as JSON)
+        """
+        values = [row.get(name) for name in cls.__slots__]
+        record = cls.from_values(values)
+        if isinstance(record.ExtraInfo, str):
+            record.ExtraInfo = json.loads(record.ExtraInfo)
+        return record
+
+    def to_row(self):
+        """
+        :return: dict with a row of the store (ExtraInfo as JSON)
+        """
+        row = {name: getattr(self, name) for name in self.__slots__}
+        row['ExtraInfo'] = None if self.ExtraInfo is None else json.dumps(self.ExtraInfo)
+        return row
+
+
+_get_values = attrgetter(*MovieRecord.__slots__)
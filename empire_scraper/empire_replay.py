@@ -0,0 +1,153 @@
+import datetime
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from empire_scraper.empire_cache import EmpireCache
+
+
+class FixtureArchive(object):
+    """
+    Archive of recorded responses (listing pages, review pages and images) for offline benchmarks.
+
+    The bodies are stored content-addressed in the objects directory and every recorded response is a line in
+    index.jsonl with its URL, status, headers and digest. Lines are appended with a single write, so all worker
+    processes can record into the same archive; the last line of a URL wins.
+    """
+
+    def __init__(self, directory='fixtures'):
+        self.directory = directory
+        self.index = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['index'], state['lock'] = None, None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __get_object_file(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], digest)
+
+    def save(self, url, status_code, headers, content):
+        """
+        Record a response.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        object_file = self.__get_object_file(digest)
+        if not os.path.exists(object_file):
+            os.makedirs(os.path.dirname(object_file), exist_ok=True)
+            temp_file = f'{object_file}.{os.getpid()}.{threading.get_ident()}.part'
+            with open(temp_file, 'wb') as f:
+                f.write(content)
+            os.replace(temp_file, object_file)
+        headers = {key: value for key, value in headers.items()
+                   if key.lower() in ['content-type', 'etag', 'last-modified']}
+        line = json.dumps({'url': url, 'status': status_code, 'headers': headers, 'digest': digest}) + '\n'
+        with self.lock:
+            with open(os.path.join(self.directory, 'index.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def load_index(self):
+        """
+        :return: dict with per URL the last recorded response
+        """
+        with self.lock:
+            if self.index is None:
+                self.index = dict()
+                index_file = os.path.join(self.directory, 'index.jsonl')
+                if os.path.exists(index_file):
+                    with open(index_file, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            try:
+                                entry = json.loads(line)
+                            except json.JSONDecodeError:
+                                continue
+                            self.index[entry['url']] = entry
+        return self.index
+
+    def get(self, url):
+        """
+        :return: dict with the status, the headers and the body of a recorded response or None
+        """
+        entry = self.load_index().get(url)
+        if entry is None:
+            return None
+        with open(self.__get_object_file(entry['digest']), 'rb') as f:
+            content = f.read()
+        return {'status': entry['status'], 'headers': entry['headers'], 'content': content}
+
+    def get_urls(self, url_class=None):
+        """
+        :param url_class: only the URLs of this class (listing, review or image)
+        :return: sorted list with the recorded URLs
+        """
+        return sorted(url for url in self.load_index()
+                      if url_class is None or EmpireCache.get_url_class(url) == url_class)
+
+
+class ReplayTransport(BaseAdapter):
+    """
+    Transport adapter for requests, which serves the responses of a FixtureArchive instead of going to the network.
+    Every response is delayed by latency plus a random jitter (in seconds) and a fraction error_rate of the requests
+    fails, half with error_status and half with a connection error. URLs, which are not in the archive, get a 404.
+    """
+
+    def __init__(self, archive, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, seed=None):
+        super().__init__()
+        self.archive = archive if isinstance(archive, FixtureArchive) else FixtureArchive(archive)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    def __getstate__(self):
+        return {'archive': self.archive, 'latency': self.latency, 'jitter': self.jitter,
+                'error_rate': self.error_rate, 'error_status': self.error_status, 'seed': self.seed}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @staticmethod
+    def __build_response(request, status, headers, content, elapsed):
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.elapsed = datetime.timedelta(seconds=elapsed)
+        return response
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        start = time.perf_counter()
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            if self.random.random() < 0.5:
+                time.sleep(delay)
+                raise requests.exceptions.ConnectionError(f'Injected connection error for {request.url}')
+            time.sleep(delay)
+            return self.__build_response(request, self.error_status, {}, b'', time.perf_counter() - start)
+        recorded = self.archive.get(request.url)
+        time.sleep(delay)
+        if recorded is None:
+            return self.__build_response(request, 404, {}, b'', time.perf_counter() - start)
+        return self.__build_response(request, recorded['status'], recorded['headers'], recorded['content'],
+                                     time.perf_counter() - start)
+
+    def close(self):
+        pass
@@ -0,0 +1,381 @@
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import unicodedata
+
+import numpy as np
+
+from empire_scraper.empire_frontier import normalize_url
+
+# Indexed fields and their weights in the term frequencies and document lengths (a simple BM25F)
+FIELDS = ['InfoMovie', 'Author', 'Introduction', 'Review']
+FIELD_WEIGHTS = np.array([3.0, 2.0, 1.5, 1.0], dtype=np.float32)
+# A position is the field in the high bits and the token number in the field in the low bits, so phrases never span
+# two fields
+FIELD_SHIFT = 24
+MAX_TERM_LENGTH = 40
+
+TOKEN_PATTERN = re.compile(r'\w+')
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(text):
+    """
+    :return: list with the lowercase words of a text without accents
+    """
+    if not text:
+        return []
+    text = str(text).lower()
+    if not text.isascii():
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return [token for token in TOKEN_PATTERN.findall(text) if len(token.encode('utf-8')) <= MAX_TERM_LENGTH]
+
+
+def parse_query(query):
+    """
+    :param query: words and "quoted phrases"
+    :return: list with per part of the query a list of tokens; a part with more than one token is a phrase
+    """
+    parts = []
+    for phrase, word in QUERY_PATTERN.findall(query):
+        tokens = tokenize(phrase or word)
+        if len(tokens) > 0:
+            parts.append(tokens)
+    return parts
+
+
+def to_bytes_array(values):
+    """
+    :param values: list of bytes
+    :return: fixed-width bytes array, which np.searchsorted can search in place when it is memory-mapped
+    """
+    return np.array(values, dtype=f'S{max([len(value) for value in values], default=1) or 1}')
+
+
+class SearchIndex(object):
+    """
+    Persistent full-text index over the Review, Introduction, InfoMovie and Author of the scraped movies, with
+    positional postings and BM25 ranking.
+
+    Movies are buffered and every segment_size movies the buffer is written as an immutable segment: a directory with
+    numpy arrays (the sorted terms, the postings with the document numbers and weighted term frequencies, and the
+    positions), which are memory-mapped for querying, so a search only touches the postings of its terms. The
+    segments.json manifest is replaced atomically after a segment is complete. A document is identified by its
+    normalized review URL; when the same review is indexed again (a retry or a later run), the newest segment wins.
+    When there are more than max_segments segments they are merged into one.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, directory, segment_size=1000, max_segments=10):
+        """
+        :param directory: directory of the index, shared by all runs
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.buffer = dict()
+        self.segments = None
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['buffer'], state['segments'], state['lock'] = dict(), None, None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __get_manifest_file(self):
+        return os.path.join(self.directory, 'segments.json')
+
+    def load_manifest(self):
+        """
+        :return: dict with the names of the segments, oldest first, and the number of the next segment
+        """
+        if not os.path.exists(self.__get_manifest_file()):
+            return {'segments': [], 'next': 0}
+        with open(self.__get_manifest_file(), 'r') as f:
+            return json.load(f)
+
+    def __save_manifest(self, manifest):
+        temp_file = f'{self.__get_manifest_file()}.{os.getpid()}.part'
+        with open(temp_file, 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(temp_file, self.__get_manifest_file())
+
+    def add_movies(self, movies, run=None):
+        """
+        :param movies: dict with per ID a movie
+        :param run: run of the movies
+        """
+        with self.lock:
+            for info_id, movie in movies.items():
+                review_url = movie.get('InfoReviewUrl')
+                key = normalize_url(review_url) if review_url else f'{run}/{info_id}'
+                self.buffer[key] = (info_id, run, movie.get('InfoMovie') or '',
+                                    [tokenize(movie.get(field)) for field in FIELDS])
+            full = len(self.buffer) >= self.segment_size
+        if full:
+            self.commit()
+
+    def commit(self):
+        """
+        Write the buffered movies as a new segment and merge the segments if there are too many.
+        """
+        with self.lock:
+            if len(self.buffer) > 0:
+                manifest = self.load_manifest()
+                name = f'segment_{manifest["next"]:06d}'
+                self.__write_segment(name, self.__build_segment(self.buffer))
+                manifest['segments'].append(name)
+                manifest['next'] += 1
+                self.__save_manifest(manifest)
+                self.buffer = dict()
+                self.segments = None
+            merge = len(self.load_manifest()['segments']) > self.max_segments
+        if merge:
+            self.merge()
+
+    @staticmethod
+    def __build_segment(documents):
+        """
+        :param documents: dict with per key the ID, run, title and tokens per field of a movie
+        :return: dict with the arrays of the segment
+        """
+        postings = dict()
+        doc_lengths = []
+        for doc, (info_id, run, title, fields) in enumerate(documents.values()):
+            term_positions = dict()
+            for field, tokens in enumerate(fields):
+                base = field << FIELD_SHIFT
+                for position, token in enumerate(tokens):
+                    term_positions.setdefault(token, []).append(base + position)
+            for term, positions in term_positions.items():
+                postings.setdefault(term.encode('utf-8'), []).append((doc, positions))
+            doc_lengths.append(sum(float(weight) * len(tokens) for weight, tokens in zip(FIELD_WEIGHTS, fields)))
+
+        terms = sorted(postings)
+        term_starts, posting_docs, position_starts, positions = [0], [], [0], []
+        for term in terms:
+            for doc, term_positions in postings[term]:
+                posting_docs.append(doc)
+                positions += term_positions
+                position_starts.append(len(positions))
+            term_starts.append(len(posting_docs))
+        positions = np.array(positions, dtype=np.uint32)
+        position_starts = np.array(position_starts, dtype=np.uint64)
+        # Weighted term frequency of every posting: the field weights summed over its positions
+        weights = FIELD_WEIGHTS[positions >> FIELD_SHIFT] if len(positions) > 0 else np.zeros(0, dtype=np.float32)
+        cumulative = np.concatenate([[0], np.cumsum(weights, dtype=np.float64)])
+        posting_tfs = (cumulative[position_starts[1:]] - cumulative[position_starts[:-1]]).astype(np.float32)
+
+        values = list(documents.values())
+        return {'terms': to_bytes_array(terms),
+                'term_starts': np.array(term_starts, dtype=np.uint64),
+                'posting_docs': np.array(posting_docs, dtype=np.uint32),
+                'posting_tfs': posting_tfs,
+                'position_starts': position_starts,
+                'positions': positions,
+                'doc_keys': to_bytes_array([key.encode('utf-8') for key in documents]),
+                'doc_ids': to_bytes_array([str(value[0]).encode('utf-8') for value in values]),
+                'doc_runs': to_bytes_array([str(value[1]).encode('utf-8') for value in values]),
+                'doc_titles': to_bytes_array([value[2].encode('utf-8') for value in values]),
+                'doc_lengths': np.array(doc_lengths, dtype=np.float32)}
+
+    def __write_segment(self, name, arrays):
+        directory = os.path.join(self.directory, 'segments', name)
+        temp_directory = f'{directory}.part'
+        if os.path.exists(temp_directory):
+            shutil.rmtree(temp_directory)
+        os.makedirs(temp_directory)
+        for key, array in arrays.items():
+            np.save(os.path.join(temp_directory, f'{key}.npy'), array)
+        os.replace(temp_directory, directory)
+
+    def __load_segments(self):
+        """
+        Memory-map the segments and mark, per segment, the documents which are not replaced by a newer segment.
+        :return: list of dicts with the arrays of the segments, oldest first
+        """
+        if self.segments is None:
+            segments = []
+            for name in self.load_manifest()['segments']:
+                directory = os.path.join(self.directory, 'segments', name)
+                segments.append({file[:-len('.npy')]: np.load(os.path.join(directory, file), mmap_mode='r')
+                                 for file in os.listdir(directory) if file.endswith('.npy')})
+            newer_keys = np.zeros(0, dtype='S1')
+            for segment in reversed(segments):
+                segment['live'] = ~np.isin(segment['doc_keys'], newer_keys)
+                newer_keys = np.concatenate([newer_keys, segment['doc_keys']])
+            self.segments = segments
+        return self.segments
+
+    def merge(self):
+        """
+        Merge all segments into one without the replaced documents.
+        """
+        with self.lock:
+            manifest = self.load_manifest()
+            if len(manifest['segments']) < 2:
+                return
+            segments = self.__load_segments()
+            terms = np.unique(np.concatenate([segment['terms'] for segment in segments]))
+
+            term_numbers, docs, tfs, starts, ends = [], [], [], [], []
+            doc_arrays = {key: [] for key in ['doc_keys', 'doc_ids', 'doc_runs', 'doc_titles', 'doc_lengths']}
+            doc_offset, position_offset, all_positions = 0, 0, []
+            for segment in segments:
+                live = segment['live']
+                # New number of every live document; the documents of older segments come first
+                doc_map = np.cumsum(live, dtype=np.int64) - 1 + doc_offset
+                counts = np.diff(segment['term_starts'].astype(np.int64))
+                segment_terms = np.repeat(np.searchsorted(terms, segment['terms']), counts)
+                segment_docs = np.asarray(segment['posting_docs'], dtype=np.int64)
+                keep = live[segment_docs]
+                term_numbers.append(segment_terms[keep])
+                docs.append(doc_map[segment_docs[keep]])
+                tfs.append(segment['posting_tfs'][keep])
+                position_starts = segment['position_starts'].astype(np.int64) + position_offset
+                starts.append(position_starts[:-1][keep])
+                ends.append(position_starts[1:][keep])
+                all_positions.append(segment['positions'])
+                position_offset += len(segment['positions'])
+                for key in doc_arrays:
+                    doc_arrays[key].append(segment[key][live])
+                doc_offset += int(live.sum())
+
+            term_numbers, docs = np.concatenate(term_numbers), np.concatenate(docs)
+            order = np.lexsort((docs, term_numbers))
+            starts, ends = np.concatenate(starts)[order], np.concatenate(ends)[order]
+            lengths = ends - starts
+            position_starts = np.concatenate([[0], np.cumsum(lengths)]).astype(np.uint64)
+            gather = np.repeat(starts - position_starts[:-1].astype(np.int64), lengths) + np.arange(lengths.sum())
+            counts = np.bincount(term_numbers, minlength=len(terms))
+            arrays = {'terms': terms[counts > 0],
+                      'term_starts': np.concatenate([[0], np.cumsum(counts[counts > 0])]).astype(np.uint64),
+                      'posting_docs': docs[order].astype(np.uint32),
+                      'posting_tfs': np.concatenate(tfs)[order],
+                      'position_starts': position_starts,
+                      'positions': np.concatenate(all_positions)[gather]}
+            for key, values in doc_arrays.items():
+                arrays[key] = np.concatenate(values)
+
+            name = f'segment_{manifest["next"]:06d}'
+            self.__write_segment(name, arrays)
+            old_segments = manifest['segments']
+            self.__save_manifest({'segments': [name], 'next': manifest['next'] + 1})
+            self.segments = None
+            for old_segment in old_segments:
+                shutil.rmtree(os.path.join(self.directory, 'segments', old_segment), ignore_errors=True)
+
+    @staticmethod
+    def __get_range(segment, term):
+        """
+        :return: start and end of the postings of a term in a segment or None
+        """
+        terms = segment['terms']
+        if len(term) > terms.dtype.itemsize:
+            return None
+        i = int(np.searchsorted(terms, term))
+        if i == len(terms) or terms[i] != term:
+            return None
+        return int(segment['term_starts'][i]), int(segment['term_starts'][i + 1])
+
+    def __get_matches(self, segment, tokens):
+        """
+        :param tokens: a term or a phrase
+        :return: documents and weighted term frequencies of the matches in a segment
+        """
+        ranges = [self.__get_range(segment, token.encode('utf-8')) for token in tokens]
+        if any(term_range is None for term_range in ranges):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            return np.asarray(segment['posting_docs'][start:end], dtype=np.int64), segment['posting_tfs'][start:end]
+
+        term_docs = [segment['posting_docs'][start:end] for start, end in ranges]
+        candidates = term_docs[0]
+        for docs in term_docs[1:]:
+            candidates = np.intersect1d(candidates, docs, assume_unique=True)
+        position_starts, positions = segment['position_starts'], segment['positions']
+        matched_docs, matched_tfs = [], []
+        for doc in candidates:
+            phrase_starts = None
+            for offset, ((start, _), docs) in enumerate(zip(ranges, term_docs)):
+                k = start + int(np.searchsorted(docs, doc))
+                term_positions = positions[position_starts[k]:position_starts[k + 1]].astype(np.int64) - offset
+                phrase_starts = term_positions if phrase_starts is None else \
+                    np.intersect1d(phrase_starts, term_positions, assume_unique=True)
+                if len(phrase_starts) == 0:
+                    break
+            if len(phrase_starts) > 0:
+                matched_docs.append(doc)
+                matched_tfs.append(FIELD_WEIGHTS[phrase_starts >> FIELD_SHIFT].sum())
+        return np.array(matched_docs, dtype=np.int64), np.array(matched_tfs, dtype=np.float32)
+
+    def search(self, query, limit=10, match_all=False):
+        """
+        :param query: words and "quoted phrases"
+        :param limit: maximum number of results
+        :param match_all: only return the movies, which match every word and phrase
+        :return: list of dicts with the ID, Run, InfoMovie, InfoReviewUrl and Score of the best matches
+        """
+        parts = parse_query(query)
+        with self.lock:
+            segments = self.__load_segments()
+        number_of_documents = sum(int(segment['live'].sum()) for segment in segments)
+        if len(parts) == 0 or number_of_documents == 0:
+            return []
+        average_length = sum(float(segment['doc_lengths'][segment['live']].sum()) for segment in segments) / \
+            number_of_documents
+
+        scores = [np.zeros(len(segment['doc_lengths']), dtype=np.float64) for segment in segments]
+        matches = [np.zeros(len(segment['doc_lengths']), dtype=np.int32) for segment in segments]
+        for tokens in parts:
+            segment_matches = []
+            for segment in segments:
+                docs, tfs = self.__get_matches(segment, tokens)
+                live = segment['live'][docs]
+                segment_matches.append((docs[live], tfs[live]))
+            df = sum(len(docs) for docs, _ in segment_matches)
+            idf = math.log(1 + (number_of_documents - df + 0.5) / (df + 0.5))
+            for segment, (docs, tfs), segment_scores, segment_match in zip(segments, segment_matches, scores,
+                                                                           matches):
+                norm = self.k1 * (1 - self.b + self.b * segment['doc_lengths'][docs] / average_length)
+                segment_scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+                segment_match[docs] += 1
+
+        results = []
+        minimum = len(parts) if match_all else 1
+        for segment, segment_scores, segment_match in zip(segments, scores, matches):
+            docs = np.flatnonzero(segment_match >= minimum)
+            if len(docs) > limit:
+                docs = docs[np.argpartition(-segment_scores[docs], limit - 1)[:limit]]
+            results += [(segment_scores[doc], segment, doc) for doc in docs]
+        results = sorted(results, key=lambda result: -result[0])[:limit]
+        return [{'ID': segment['doc_ids'][doc].decode('utf-8'),
+                 'Run': segment['doc_runs'][doc].decode('utf-8'),
+                 'InfoMovie': segment['doc_titles'][doc].decode('utf-8'),
+                 'InfoReviewUrl': segment['doc_keys'][doc].decode('utf-8'),
+                 'Score': float(score)} for score, segment, doc in results]
+
+    def get_counts(self):
+        """
+        :return: dict with the number of segments, documents, replaced documents and terms (summed over the segments)
+        """
+        with self.lock:
+            segments = self.__load_segments()
+            return {'segments': len(segments),
+                    'documents': sum(int(segment['live'].sum()) for segment in segments),
+                    'replaced': sum(int((~segment['live']).sum()) for segment in segments),
+                    'terms': sum(len(segment['terms']) for segment in segments),
+                    'buffered': len(self.buffer)}
+
+    def __len__(self):
+        return self.get_counts()['documents']
@@ -0,0 +1,117 @@
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from empire_scraper.empire_profiler import get_profiler
+
+
+class TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        get_profiler().record('dns_connect.http', time.perf_counter() - start)
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # Includes the TLS handshake
+        start = time.perf_counter()
+        super().connect()
+        get_profiler().record('dns_connect.https', time.perf_counter() - start)
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter, which records the time of every new (DNS lookup plus) connection in the profiler.
+    """
+    pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self.pool_classes_by_scheme
+
+    def proxy_manager_for(self, *args, **kwargs):
+        manager = super().proxy_manager_for(*args, **kwargs)
+        manager.pool_classes_by_scheme = self.pool_classes_by_scheme
+        return manager
+
+
+class SessionPool(object):
+    """
+    Keep-alive sessions, one per (proxy, host) pair, shared by all fetches of a process.
+
+    Reusing a session reuses its TCP and TLS connections, so only the first request to a host pays for the handshake.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, transport=None):
+        """
+        :param pool_connections: number of connection pools (hosts) per session
+        :param pool_maxsize: maximum number of connections kept alive per host, which should be at least the
+        number of concurrent requests per host
+        :param transport: adapter, which replaces the network, e.g. a ReplayTransport (optional)
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.transport = transport
+        self.sessions = dict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(url, proxy=None):
+        """
+        Only the proxy that requests actually uses for the scheme of the URL is part of the key.
+        :return: tuple with the proxy URL (or None) and the scheme and host of the URL
+        """
+        parts = urlsplit(url)
+        proxy_url = None if proxy is None else proxy.get(parts.scheme)
+        return proxy_url, parts.scheme, parts.netloc
+
+    def __create_session(self, proxy):
+        session = requests.Session()
+        adapter = self.transport
+        if adapter is None:
+            adapter = TimedHTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if proxy is not None:
+            session.proxies.update(proxy)
+        return session
+
+    def get_session(self, url, proxy=None):
+        key = self.get_key(url, proxy)
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.__create_session(proxy)
+                self.sessions[key] = session
+        return session
+
+    def get(self, url, timeout=5, proxy=None, **kwargs):
+        return self.get_session(url, proxy).get(url, timeout=timeout, **kwargs)
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = dict()
+
+    def __getstate__(self):
+        # Sessions and their connections cannot be shared with other processes
+        return {'pool_connections': self.pool_connections, 'pool_maxsize': self.pool_maxsize,
+                'transport': self.transport}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
@@ -0,0 +1,226 @@
+import json
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from empire_scraper.empire_normalize import get_raw_schema, normalize_table, to_raw_value
+from empire_scraper.empire_record import MovieRecord
+
+
+# Fixed schema of a movie; the nested thumbnail and picture dicts are flattened and the info entries of a review,
+# which are not in the schema, are kept as JSON in ExtraInfo
+SCHEMA = pa.schema([
+    ('ID', pa.string()),
+    ('InfoPage', pa.int16()),
+    ('InfoArticle', pa.int16()),
+    ('InfoUrl', pa.string()),
+    ('InfoMovie', pa.string()),
+    ('IsEssay', pa.bool_()),
+    ('InfoReviewUrl', pa.string()),
+    ('InfoRating', pa.int8()),
+    ('InfoThumbnailSource', pa.string()),
+    ('InfoThumbnailFile', pa.string()),
+    ('InfoThumbnailWidth', pa.int16()),
+    ('InfoThumbnailHeight', pa.int16()),
+    ('InfoThumbnailBytes', pa.int32()),
+    ('InfoThumbnailHash', pa.string()),
+    ('ReleaseDate', pa.string()),
+    ('Certificate', pa.dictionary(pa.int8(), pa.string())),
+    ('RunningTime', pa.int16()),
+    ('Rating', pa.int8()),
+    ('Author', pa.string()),
+    ('DatePublished', pa.string()),
+    ('LastUpdate', pa.string()),
+    ('Introduction', pa.string()),
+    ('Review', pa.string()),
+    ('PictureSource', pa.string()),
+    ('PictureFile', pa.string()),
+    ('PictureWidth', pa.int16()),
+    ('PictureHeight', pa.int16()),
+    ('PictureBytes', pa.int32()),
+    ('PictureHash', pa.string()),
+    ('ExtraInfo', pa.string()),
+])
+
+# Schema of the values as they are captured by the workers, which is normalized to SCHEMA before it is stored
+RAW_SCHEMA = get_raw_schema(SCHEMA)
+
+
+def get_pandas_types():
+    """
+    Nullable pandas types for the integer and boolean columns; pandas is only imported when a DataFrame is needed.
+    """
+    import pandas as pd
+    return {
+        pa.int8(): pd.Int8Dtype(),
+        pa.int16(): pd.Int16Dtype(),
+        pa.bool_(): pd.BooleanDtype(),
+    }
+
+
+def records_to_table(records, failures=None):
+    """
+    Build the raw columns straight from the slots of the records, without a dict per row, and normalize them.
+    :param records: list of MovieRecords
+    :param failures: dict, to which the values per column, which could not be normalized, are added (optional)
+    :return: pyarrow Table in the format of SCHEMA
+    """
+    columns = dict()
+    for name in SCHEMA.names:
+        if name == 'ExtraInfo':
+            values = [None if record.ExtraInfo is None else json.dumps(record.ExtraInfo) for record in records]
+        elif RAW_SCHEMA.field(name).type == pa.string():
+            values = [to_raw_value(name, getattr(record, name)) for record in records]
+        else:
+            values = [getattr(record, name) for record in records]
+        columns[name] = pa.array(values, type=RAW_SCHEMA.field(name).type)
+    table, table_failures = normalize_table(pa.Table.from_pydict(columns, schema=RAW_SCHEMA), SCHEMA)
+    if failures is not None:
+        for name, column_failures in table_failures.items():
+            failures.setdefault(name, []).extend(column_failures)
+    return table
+
+
+class EmpireStore(object):
+    """
+    Columnar storage of the movies in Parquet with a partition per run (results/store/run=<now>/part-*.parquet).
+    Movies are appended in batches, so a run never has to keep all of them in memory, and the store can be
+    loaded lazily, per run and per column.
+    """
+
+    def __init__(self, directory=os.path.join('results', 'store'), batch_size=1000, compression='zstd'):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.compression = compression
+        # Buffered MovieRecords of the current part
+        self.rows = []
+        self.run = None
+        self.number_of_parts = 0
+        # Values per column, which could not be normalized, since the last pop_failures
+        self.failures = dict()
+
+    def __getstate__(self):
+        # Buffered rows are never shipped to other processes
+        state = self.__dict__.copy()
+        state['rows'], state['failures'] = [], dict()
+        return state
+
+    def get_run_directory(self, run):
+        return os.path.join(self.directory, f'run={run}')
+
+    def get_runs(self):
+        """
+        :return: sorted list with the runs in the store
+        """
+        if not os.path.exists(self.directory):
+            return []
+        return sorted(name.split('=', 1)[1] for name in os.listdir(self.directory) if name.startswith('run='))
+
+    def clear_run(self, run):
+        """
+        Remove the partition of a run, e.g. before it is rewritten from its checkpoint.
+        """
+        if os.path.exists(self.get_run_directory(run)):
+            shutil.rmtree(self.get_run_directory(run))
+
+    def open_run(self, run):
+        self.flush()
+        self.run = run
+        os.makedirs(self.get_run_directory(run), exist_ok=True)
+        self.number_of_parts = len(os.listdir(self.get_run_directory(run)))
+
+    def append(self, movies):
+        """
+        :param movies: dict with per ID a movie
+        """
+        self.append_records(MovieRecord.from_movie(info_id, movie) for info_id, movie in movies.items())
+
+    def append_records(self, records):
+        """
+        :param records: iterable of MovieRecords
+        """
+        self.rows.extend(records)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.rows) == 0 or self.run is None:
+            return
+        # A batch, which can not be written, is dropped rather than failing every later flush as well
+        try:
+            table = records_to_table(self.rows, self.failures)
+            part_file = os.path.join(self.get_run_directory(self.run), f'part-{self.number_of_parts:05d}.parquet')
+            pq.write_table(table, part_file, compression=self.compression)
+            self.number_of_parts += 1
+        finally:
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.run = None
+
+    def pop_failures(self):
+        """
+        :return: dict with per column a list with the ID and the raw value of the values, which could not be
+            normalized
+        """
+        failures, self.failures = self.failures, dict()
+        return failures
+
+    def save(self, run, movies):
+        """
+        Write all movies of a run.
+        """
+        self.open_run(run)
+        self.append(movies)
+        self.close()
+
+    def get_dataset(self):
+        # pyarrow.dataset imports pandas, so it is only imported when the store is read
+        import pyarrow.dataset as ds
+        # The columns, which are missing in the parts of older runs, are read as nulls
+        partitioning = ds.partitioning(pa.schema([('run', pa.string())]), flavor='hive')
+        return ds.dataset(self.directory, schema=SCHEMA.append(pa.field('run', pa.string())), format='parquet',
+                          partitioning=partitioning)
+
+    def load_table(self, run=None, columns=None, filter=None):
+        """
+        :param run: only load this run (defaults to the latest run)
+        :param columns: only load these columns (defaults to all columns)
+        :param filter: pyarrow.dataset expression (optional)
+        :return: pyarrow Table with the movies
+        """
+        import pyarrow.dataset as ds
+        run = run if run is not None else self.get_runs()[-1]
+        expression = ds.field('run') == run
+        if filter is not None:
+            expression = expression & filter
+        if columns is not None and 'ID' not in columns:
+            columns = ['ID'] + list(columns)
+        table = self.get_dataset().to_table(columns=columns, filter=expression)
+        if 'run' in table.column_names:
+            table = table.drop(['run'])
+        return table
+
+    def load(self, run=None, columns=None, filter=None):
+        """
+        Same arguments as load_table.
+        :return: DataFrame with the movies, indexed by ID
+        """
+        table = self.load_table(run, columns, filter)
+        df = table.to_pandas(types_mapper=get_pandas_types().get)
+        return df.set_index('ID').sort_index()
+
+    def load_records(self, run=None):
+        """
+        :return: list with the MovieRecords of a run
+        """
+        return [MovieRecord.from_row(row) for row in self.load_table(run).to_pylist()]
+
+    def load_movies(self, run=None):
+        """
+        :return: dict with the movies of a run in the format of EmpireMovie
+        """
+        return dict(record.to_movie() for record in self.load_records(run))
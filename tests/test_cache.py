@@ -0,0 +1,110 @@
+import os
+
+import pytest
+import requests
+
+from empire_scraper.empire_cache import EmpireCache
+from empire_scraper.empire_fetcher import EmpireFetcher
+from empire_scraper.empire_replay import FixtureArchive, ReplayTransport
+
+REVIEW_URL = 'https://www.empireonline.com/movies/reviews/heat-review/'
+REVIEW = b'<html><h1>Heat</h1></html>'
+
+
+class RevalidatingTransport(ReplayTransport):
+    """
+    ReplayTransport, which answers a conditional request with a matching ETag with a 304.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statuses = []
+
+    def send(self, request, **kwargs):
+        recorded = self.archive.get(request.url)
+        if recorded is not None and request.headers.get('If-None-Match') == recorded['headers'].get('ETag'):
+            response = requests.Response()
+            response.status_code = 304
+            response._content = b''
+            response.url = request.url
+            response.request = request
+        else:
+            response = super().send(request, **kwargs)
+        self.statuses.append(response.status_code)
+        return response
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmpireCache(str(tmp_path / 'cache'))
+    yield cache
+    cache.close()
+
+
+@pytest.mark.parametrize('url, url_class', [
+    ('https://www.empireonline.com/movies/reviews/12/', 'listing'),
+    (REVIEW_URL, 'review'),
+    ('https://www.empireonline.com/movies/reviews/poster.JPG', 'image'),
+    ('https://images.bauerhosting.com/empire/heat', 'image'),
+])
+def test_url_class(url, url_class):
+    assert EmpireCache.get_url_class(url) == url_class
+
+
+def test_stored_response_is_loaded_with_its_validators(cache):
+    assert cache.lookup(REVIEW_URL) is None
+    cache.store(REVIEW_URL, REVIEW, {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+    entry = cache.lookup(REVIEW_URL)
+    assert entry['fresh'] and entry['url_class'] == 'review'
+    assert cache.load(REVIEW_URL, entry) == REVIEW
+    assert cache.get_conditional_headers(entry) == {'If-None-Match': '"v1"',
+                                                    'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'}
+    assert cache.get_conditional_headers(None) == dict()
+
+
+def test_bodies_are_stored_once(cache):
+    cache.store(REVIEW_URL, REVIEW, {})
+    cache.store('https://www.empireonline.com/movies/reviews/heat-review-2/', REVIEW, {})
+    assert cache.get_size() == len(REVIEW)
+    assert len(os.listdir(os.path.join(cache.directory, 'objects'))) == 1
+
+
+def test_expired_entry_is_fresh_again_after_revalidation(tmp_path):
+    cache = EmpireCache(str(tmp_path / 'cache'), ttl={'review': 0})
+    try:
+        cache.store(REVIEW_URL, REVIEW, {'ETag': '"v1"'})
+        entry = cache.lookup(REVIEW_URL)
+        assert not entry['fresh']
+        assert cache.revalidate(REVIEW_URL, entry) == REVIEW
+        assert cache.lookup(REVIEW_URL)['stored_at'] > entry['stored_at']
+    finally:
+        cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EmpireCache(str(tmp_path / 'cache'), max_size=250, evict_every=1)
+    try:
+        urls = [f'https://www.empireonline.com/movies/reviews/review-{i}/' for i in range(3)]
+        for i, url in enumerate(urls[:2]):
+            cache.store(url, bytes([i]) * 100, {})
+        # Reading the first entry makes the second the least recently used one
+        cache.load(urls[0], cache.lookup(urls[0]))
+        cache.store(urls[2], bytes([2]) * 100, {})
+        assert [cache.lookup(url) is not None for url in urls] == [True, False, True]
+        assert cache.get_size() == 200
+    finally:
+        cache.close()
+
+
+def test_fetcher_revalidates_expired_entries(tmp_path):
+    archive = FixtureArchive(str(tmp_path / 'fixtures'))
+    archive.save(REVIEW_URL, 200, {'Content-Type': 'text/html', 'ETag': '"v1"'}, REVIEW)
+    transport = RevalidatingTransport(archive)
+    fetcher = EmpireFetcher(transport=transport, cache=EmpireCache(str(tmp_path / 'cache'), ttl={'review': 0}),
+                            proxies=[], max_number_of_attempts=1, backoff=0)
+    try:
+        assert fetcher.get(REVIEW_URL) == REVIEW
+        assert fetcher.get(REVIEW_URL) == REVIEW
+    finally:
+        fetcher.close()
+    assert transport.statuses == [200, 304]
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from empire_scraper.empire_checkpoint import EmpireCheckpoint, get_latest_checkpoint_file
+from empire_scraper.empire_movies import EmpireMovies
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    checkpoint = EmpireCheckpoint(str(tmp_path / 'checkpoint.jsonl'), sync_every=1)
+    yield checkpoint
+    checkpoint.close()
+
+
+def test_truncated_line_is_removed_on_open(checkpoint):
+    checkpoint.open()
+    checkpoint.append({'001-01': {'InfoMovie': 'Heat'}})
+    checkpoint.close()
+    with open(checkpoint.file, 'a', encoding='utf-8') as f:
+        f.write('{"ID": "001-02", "Movie": {"InfoMo')
+    assert checkpoint.get_ids() == {'001-01'}
+
+    checkpoint.open()
+    checkpoint.append({'001-03': {'InfoMovie': 'Alien'}})
+    checkpoint.close()
+    with open(checkpoint.file, 'r', encoding='utf-8') as f:
+        assert len(f.readlines()) == 2
+    assert checkpoint.get_ids() == {'001-01', '001-03'}
+
+
+def test_last_line_of_a_movie_wins(checkpoint):
+    checkpoint.open()
+    checkpoint.append({'001-01': {'InfoMovie': 'Heat', 'Review': None}, '001-02': {'InfoMovie': 'Alien'}})
+    checkpoint.append({'001-01': {'InfoMovie': 'Heat', 'Review': 'Retried'}})
+    checkpoint.close()
+    assert checkpoint.get_movies() == {'001-01': {'InfoMovie': 'Heat', 'Review': 'Retried'},
+                                       '001-02': {'InfoMovie': 'Alien'}}
+    assert checkpoint.get_movies(ids={'001-02'}) == {'001-02': {'InfoMovie': 'Alien'}}
+    assert [len(batch) for batch in checkpoint.iter_movies(batch_size=1)] == [1, 1]
+
+
+def test_latest_checkpoint_file(tmp_path):
+    directory = str(tmp_path / 'results')
+    assert get_latest_checkpoint_file(directory) == (None, None)
+    for now in ['20240101-000000', '20240102-000000', '20240103-000000']:
+        os.makedirs(os.path.join(directory, now))
+    for now in ['20240101-000000', '20240102-000000']:
+        open(os.path.join(directory, now, f'{now}_checkpoint.jsonl'), 'w').close()
+    # The run without a checkpoint is skipped
+    assert get_latest_checkpoint_file(directory) == \
+        ('20240102-000000', os.path.join(directory, '20240102-000000', '20240102-000000_checkpoint.jsonl'))
+
+
+def test_resume_continues_the_latest_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first = EmpireMovies(process_images=False, use_proxies=False, use_cache=False)
+    first.checkpoint.open()
+    first.checkpoint.append({'001-01': {'InfoMovie': 'Heat'}})
+    first.checkpoint.close()
+    first.frontier.add_infos({'001-02': {'001-02': {'InfoReviewUrl': 'https://www.empireonline.com/movies/reviews/'
+                                                                     'alien-review/', 'InfoPage': 1,
+                                                    'InfoArticle': 2}}})
+    first.frontier.close()
+
+    second = EmpireMovies(process_images=False, use_proxies=False, use_cache=False)
+    # A later run, which has not written anything yet
+    second.now = '99991231-000000'
+    os.makedirs(os.path.join('results', second.now))
+    assert second.resume() == {'001-01'}
+    assert second.now == first.now and second.checkpoint.file == first.checkpoint.file
+    assert not os.path.exists(os.path.join('results', '99991231-000000'))
+    # The review, which was in flight, is found again by its listing page
+    assert second.frontier.get_counts() == dict()
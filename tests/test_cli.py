@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from empire_scraper.cli import parse_pages
+from empire_scraper.empire_checkpoint import EmpireCheckpoint
+from empire_scraper.empire_ledger import ErrorLedger
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+HEAVY_MODULES = ['numpy', 'pandas', 'pyarrow', 'bs4', 'lxml', 'requests', 'PIL', 'empire_scraper.empire_movies']
+
+
+@pytest.mark.parametrize('value, pages', [
+    ('3', [1, 2, 3]),
+    ('5-7', [5, 6, 7]),
+    ('1,4-5,9', [1, 4, 5, 9]),
+])
+def test_parse_pages(value, pages):
+    assert parse_pages(value) == pages
+
+
+def run_python(code, cwd):
+    """
+    Run code in a fresh interpreter, which prints the heavy modules it has imported on its last line.
+    :return: lines of the output
+    """
+    code += f'\nprint(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))\n'
+    completed = subprocess.run([sys.executable, '-c', 'import json, sys\n' + code], cwd=cwd, capture_output=True,
+                               text=True, env=dict(os.environ, PYTHONPATH=ROOT))
+    assert completed.returncode == 0, completed.stderr
+    return completed.stdout.splitlines()
+
+
+def test_stats_only_needs_the_standard_library(tmp_path):
+    run = '20240101-000000'
+    os.makedirs(tmp_path / 'results' / run)
+    checkpoint = EmpireCheckpoint(str(tmp_path / 'results' / run / f'{run}_checkpoint.jsonl'))
+    checkpoint.open()
+    checkpoint.append({'001-01': {'InfoMovie': 'Heat'}, '001-02': {'InfoMovie': 'Alien'}})
+    checkpoint.close()
+    ledger = ErrorLedger(str(tmp_path / 'results' / run / f'{run}_errors.sqlite'))
+    ledger.record('001-03', 'https://www.empireonline.com/movies/reviews/ronin-review/', status=503)
+    ledger.close()
+
+    lines = run_python("from empire_scraper.cli import main\nmain(['stats'])", str(tmp_path))
+    assert lines[:3] == [f'Run: {run}', 'Movies: 2', 'Errors: 1 (1 retryable)']
+    assert json.loads(lines[-1]) == []
+
+
+def test_cli_imports_no_heavy_modules(tmp_path):
+    lines = run_python('from empire_scraper.cli import get_parser\nget_parser()', str(tmp_path))
+    assert json.loads(lines[-1]) == []
@@ -0,0 +1,29 @@
+import multiprocessing
+import pickle
+
+from empire_scraper.empire_imaging import ImageCatalog
+
+
+def put_image(catalog, file):
+    catalog.put([{'file': file, 'size': 10, 'mtime': 1.0, 'dhash': '00000000000000ff'}])
+    catalog.close()
+
+
+def test_catalog_creates_its_directory_and_schema(tmp_path):
+    catalog = ImageCatalog(str(tmp_path / 'variants' / 'catalog.sqlite'))
+    put_image(catalog, 'thumbnails/a.jpg')
+    assert catalog.get_processed() == {'thumbnails/a.jpg': (10, 1.0)}
+    catalog.close()
+
+
+def test_pickled_catalog_opens_its_own_connection(tmp_path):
+    catalog = ImageCatalog(str(tmp_path / 'catalog.sqlite'))
+    catalog.get_counts()
+    copy = pickle.loads(pickle.dumps(catalog))
+    assert copy.connection is None and copy.file == catalog.file
+    process = multiprocessing.get_context('fork').Process(target=put_image, args=(catalog, 'pictures/b.jpg'))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert catalog.get_counts()['images'] == 1
+    catalog.close()
@@ -0,0 +1,111 @@
+import os
+import time
+
+import pytest
+
+from empire_scraper.empire_distributed import EmpireCoordinator, EmpireWorker, TaskQueue
+from empire_scraper.empire_movies import EmpireMovies
+
+
+@pytest.fixture
+def tasks(tmp_path):
+    tasks = TaskQueue(str(tmp_path / 'tasks.sqlite'), visibility_timeout=300, max_attempts=2)
+    yield tasks
+    tasks.close()
+
+
+def test_tasks_are_unique_by_key(tasks):
+    assert tasks.publish('page', [('page:1', 1, 1), ('page:2', 2, 2)]) == 2
+    assert tasks.publish('page', [('page:2', 2, 2), ('page:3', 3, 3)]) == 1
+    assert tasks.get_counts() == {'page': {'queued': 3}}
+
+
+def test_reviews_are_leased_before_pages(tasks):
+    tasks.publish('page', [('page:1', 1, 1)])
+    tasks.publish('review', [('review:b', 2, {'ID': 'b'}), ('review:a', 1, {'ID': 'a'})])
+    leased = [tasks.lease('worker') for _ in range(4)]
+    assert [task['payload'] for task in leased[:3]] == [{'ID': 'a'}, {'ID': 'b'}, 1]
+    assert leased[3] is None
+
+
+def test_failed_task_is_retried_up_to_max_attempts(tasks):
+    tasks.publish('page', [('page:1', 1, 1)])
+    task = tasks.lease('worker')
+    tasks.fail(task['id'], task['attempts'])
+    task = tasks.lease('worker')
+    assert task['attempts'] == 2
+    tasks.fail(task['id'], task['attempts'])
+    assert tasks.lease('worker') is None
+    assert tasks.get_counts() == {'page': {'failed': 1}}
+
+
+def test_expired_lease_becomes_visible_again(tmp_path):
+    tasks = TaskQueue(str(tmp_path / 'tasks.sqlite'), visibility_timeout=0.01, max_attempts=3)
+    tasks.publish('page', [('page:1', 1, 1)])
+    first = tasks.lease('node-a')
+    time.sleep(0.02)
+    second = tasks.lease('node-b')
+    assert second['id'] == first['id'] and second['attempts'] == 2
+    tasks.complete(second['id'])
+    assert not tasks.is_finished()
+    tasks.set_meta('closed', True)
+    assert tasks.is_finished()
+    tasks.close()
+
+
+@pytest.fixture
+def empire_movies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return EmpireMovies(process_images=False, use_proxies=False, use_cache=False)
+
+
+def test_second_crawl_in_the_same_directory_is_refused(empire_movies):
+    empire_movies.now = '20240101-000000'
+    coordinator = EmpireCoordinator(empire_movies, 'shared')
+    assert coordinator.publish([1, 2]) == 2
+    coordinator.results.put({'001-01': {'InfoMovie': 'Old'}}, 'worker')
+
+    empire_movies.now = '20240102-000000'
+    coordinator = EmpireCoordinator(empire_movies, 'shared')
+    with pytest.raises(RuntimeError, match='20240101-000000'):
+        coordinator.publish([1, 2])
+    with pytest.raises(RuntimeError):
+        coordinator.collect()
+    # A reset removes the previous crawl, so the pages are published again and no old results are collected
+    assert coordinator.publish([1, 2], reset=True) == 2
+    assert len(coordinator.results) == 0
+    assert coordinator.get_crawl() == '20240102-000000'
+
+
+def test_images_of_workers_are_collected(empire_movies, tmp_path):
+    worker = EmpireWorker(empire_movies, 'shared', number_of_threads=1)
+    with open(os.path.join('pictures', 'picture.jpg'), 'wb') as f:
+        f.write(b'picture')
+    worker.share_images([os.path.join('pictures', 'picture.jpg'), os.path.join('pictures', 'missing.jpg'), None])
+    assert os.listdir(os.path.join('shared', 'images', 'pictures')) == ['picture.jpg']
+
+    # The coordinator runs on another node
+    os.remove(os.path.join('pictures', 'picture.jpg'))
+    coordinator = EmpireCoordinator(empire_movies, 'shared')
+    assert coordinator.collect_images() == 1
+    with open(os.path.join('pictures', 'picture.jpg'), 'rb') as f:
+        assert f.read() == b'picture'
+    assert coordinator.collect_images() == 0
+
+
+def test_collect_keeps_the_paths_of_shared_images(empire_movies):
+    coordinator = EmpireCoordinator(empire_movies, 'shared')
+    coordinator.publish([1])
+    worker = EmpireWorker(empire_movies, 'shared', number_of_threads=1)
+    with open(os.path.join('pictures', 'picture.jpg'), 'wb') as f:
+        f.write(b'picture')
+    worker.share_images([os.path.join('pictures', 'picture.jpg')])
+    worker.results.put({'001-01': {'InfoPage': 1, 'InfoArticle': 1, 'InfoMovie': 'Movie',
+                                   'InfoThumbnail': None,
+                                   'Picture': {'Source': 'https://images.example.com/picture.jpg',
+                                               'File': os.path.join('pictures', 'picture.jpg')}}}, worker.name)
+    os.remove(os.path.join('pictures', 'picture.jpg'))
+
+    assert coordinator.collect() == 1
+    movies = empire_movies.store.load_movies(empire_movies.now)
+    assert movies['001-01']['Picture']['File'] == os.path.join('pictures', 'picture.jpg')
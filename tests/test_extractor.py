@@ -0,0 +1,57 @@
+import logging
+
+import pytest
+
+from empire_scraper.empire_movie import EmpireMovie
+
+REVIEW_PAGE = b'''<html><body>
+<div class="article__header">
+  <div class="  author ">Ian Freer</div>
+  <time class="datePublished" datetime=" 2024-01-05T10:00:00Z">5 January 2024</time>
+  <time datetime="2024-02-01T09:00:00Z"><strong>Updated</strong> 1 February 2024</time>
+</div>
+<div class="imageWrapper imageWrapper--kenburns"><img src="https://images.example.com/no-photo.jpg"></div>
+<div class="imageWrapper imageWrapper--kenburns"><img src="https://images.example.com/second.jpg"></div>
+<ul class="list__keyline delta  txt--mid-grey"><li><strong>Release date</strong><span>12 Feb 1996</span></li><li>\
+<strong>Certificate</strong><span>15</span></li><li><strong>Running time</strong><span>171 mins</span></li></ul>
+<span class="stars--on">&#9733;&#9733;&#9733;&#9733;&#9733;</span><span class="stars--off"></span>
+<h2 class="gamma gamma--tall txt--black"> Pacino and De Niro, finally together. </h2>
+<div class="article__text"><p> First paragraph. </p><div><p>Second paragraph.</p></div></div>
+<div class="article__text"><p>Related article.</p></div>
+</body></html>'''
+
+EMPTY_PAGE = b'<html><body><div class="author">Ian Freer</div></body></html>'
+
+LATIN_1_PAGE = REVIEW_PAGE.replace(b'<html>', b'<html><head><meta charset="iso-8859-1"></head>').replace(
+    b'First paragraph.', 'Café, naïve and Señor.'.encode('latin-1'))
+
+
+def get_movie(html, single_pass):
+    info = {'001-01': {'InfoMovie': 'Heat', 'InfoRating': 5, 'InfoReviewUrl': None}}
+    movie = EmpireMovie(logging.getLogger('test'), info, process_images=False, use_proxies=False, fetcher=object(),
+                        single_pass=single_pass)
+    movie.get_review(html)
+    return movie.movie['001-01']
+
+
+@pytest.mark.parametrize('html', [REVIEW_PAGE, EMPTY_PAGE, LATIN_1_PAGE])
+def test_single_pass_matches_beautifulsoup(html):
+    assert get_movie(html, True) == get_movie(html, False)
+
+
+def test_single_pass_fields():
+    movie = get_movie(REVIEW_PAGE, True)
+    assert movie['Author'] == 'Ian Freer' and movie['Rating'] == 5
+    assert (movie['DatePublished'], movie['LastUpdate']) == ('2024-01-05', '2024-02-01')
+    assert (movie['ReleaseDate'], movie['Certificate'], movie['RunningTime']) == ('12 Feb 1996', '15', '171 mins')
+    assert movie['Introduction'] == 'Pacino and De Niro, finally together.'
+    assert movie['Review'] == 'First paragraph.\nSecond paragraph.'
+    assert movie['Picture'] == {'Source': None, 'File': None}
+
+
+def test_declared_encoding_is_used():
+    assert get_movie(LATIN_1_PAGE, True)['Review'] == 'Café, naïve and Señor.\nSecond paragraph.'
+
+
+def test_page_without_info_is_left_alone():
+    assert get_movie(EMPTY_PAGE, True) == {'InfoMovie': 'Heat', 'InfoRating': 5, 'InfoReviewUrl': None}
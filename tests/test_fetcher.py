@@ -0,0 +1,261 @@
+import os
+import threading
+import time
+
+import pytest
+
+from empire_scraper.empire_cache import EmpireCache
+from empire_scraper.empire_fetcher import EmpireFetcher
+from empire_scraper.empire_images import ImageDownloader
+from empire_scraper.empire_replay import FixtureArchive, ReplayTransport
+
+PAGE_URL = 'https://www.empireonline.com/movies/reviews/1/'
+IMAGE_URL = 'https://images.example.com/thumbnail.jpg'
+IMAGE = b'\xff\xd8\xff' + bytes(range(256)) * 40
+
+
+class CountingTransport(ReplayTransport):
+    """
+    ReplayTransport, which counts the requests that would have gone to the network.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.number_of_requests = 0
+
+    def send(self, request, **kwargs):
+        self.number_of_requests += 1
+        return super().send(request, **kwargs)
+
+
+class TruncatingTransport(CountingTransport):
+    """
+    CountingTransport, which announces more bytes than it sends, like a connection, which is dropped halfway.
+    """
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        response.headers['Content-Length'] = str(len(response.content) + 100)
+        return response
+
+
+class ConcurrencyTransport(ReplayTransport):
+    """
+    ReplayTransport, which keeps track of the maximum number of requests in flight and answers the first attempts
+    (failures) of every URL with a 503.
+    """
+
+    def __init__(self, *args, failures=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+        self.attempts = dict()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.counter_lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        with self.counter_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.attempts[request.url] = self.attempts.get(request.url, 0) + 1
+            fail = self.attempts[request.url] <= self.failures
+        try:
+            if fail:
+                time.sleep(self.latency)
+                response = super().send(request, **kwargs)
+                response.status_code = 503
+                return response
+            return super().send(request, **kwargs)
+        finally:
+            with self.counter_lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = FixtureArchive(str(tmp_path / 'fixtures'))
+    archive.save(PAGE_URL, 200, {'Content-Type': 'text/html'}, b'<html><article></article></html>')
+    archive.save(IMAGE_URL, 200, {'Content-Type': 'image/jpeg', 'ETag': '"abc"'}, IMAGE)
+    return archive
+
+
+def get_fetcher(transport, cache):
+    return EmpireFetcher(transport=transport, cache=cache, proxies=[], max_number_of_attempts=1, backoff=0)
+
+
+def test_image_download_is_cached(tmp_path, archive):
+    cache = EmpireCache(str(tmp_path / 'cache'))
+    transport = CountingTransport(archive)
+    fetcher = get_fetcher(transport, cache)
+    out_file = str(tmp_path / 'first.jpg')
+    try:
+        assert fetcher.get(IMAGE_URL, out_file=out_file) == out_file
+        # A second download of the same image is served from the cache
+        second_file = str(tmp_path / 'second.jpg')
+        assert fetcher.get(IMAGE_URL, out_file=second_file) == second_file
+    finally:
+        fetcher.close()
+    assert transport.number_of_requests == 1
+    for file in [out_file, second_file]:
+        with open(file, 'rb') as f:
+            assert f.read() == IMAGE
+    entry = cache.lookup(IMAGE_URL)
+    assert entry['url_class'] == 'image' and entry['etag'] == '"abc"'
+    assert cache.get_size() == len(IMAGE)
+
+
+def test_offline_image_never_hits_the_network(tmp_path, archive):
+    directory = str(tmp_path / 'cache')
+    online = get_fetcher(CountingTransport(archive), EmpireCache(directory))
+    try:
+        online.get(IMAGE_URL, out_file=str(tmp_path / 'online.jpg'))
+    finally:
+        online.close()
+
+    transport = CountingTransport(archive)
+    offline = get_fetcher(transport, EmpireCache(directory, offline=True))
+    out_file = str(tmp_path / 'offline.jpg')
+    missing_file = str(tmp_path / 'missing.jpg')
+    try:
+        assert offline.get(IMAGE_URL, out_file=out_file) == out_file
+        assert offline.get('https://images.example.com/missing.jpg', out_file=missing_file) == -1
+        assert offline.get(PAGE_URL) == -1
+    finally:
+        offline.close()
+    assert transport.number_of_requests == 0
+    with open(out_file, 'rb') as f:
+        assert f.read() == IMAGE
+    assert not os.path.exists(missing_file)
+    assert offline.pop_failure('https://images.example.com/missing.jpg')['error_class'] == 'CacheMiss'
+
+
+def test_image_survives_eviction_of_its_object(tmp_path, archive):
+    cache = EmpireCache(str(tmp_path / 'cache'))
+    fetcher = get_fetcher(CountingTransport(archive), cache)
+    out_file = str(tmp_path / 'image.jpg')
+    try:
+        fetcher.get(IMAGE_URL, out_file=out_file)
+    finally:
+        fetcher.close()
+    digest = cache.lookup(IMAGE_URL)['digest']
+    os.remove(os.path.join(cache.directory, 'objects', digest[:2], digest))
+    with open(out_file, 'rb') as f:
+        assert f.read() == IMAGE
+    # The entry without a body is a miss
+    assert cache.load(IMAGE_URL, cache.lookup(IMAGE_URL), str(tmp_path / 'again.jpg')) is None
+
+
+def test_truncated_image_is_not_kept(tmp_path, archive):
+    cache = EmpireCache(str(tmp_path / 'cache'))
+    transport = TruncatingTransport(archive)
+    fetcher = EmpireFetcher(transport=transport, cache=cache, proxies=[], max_number_of_attempts=2, backoff=0)
+    out_file = str(tmp_path / 'image.jpg')
+    try:
+        assert fetcher.get(IMAGE_URL, out_file=out_file) == -1
+    finally:
+        fetcher.close()
+    # Both attempts got a truncated body, which was neither renamed nor cached
+    assert transport.number_of_requests == 2
+    assert sorted(os.listdir(str(tmp_path))) == ['cache', 'fixtures']
+    assert cache.lookup(IMAGE_URL) is None
+
+
+def test_partial_image_is_downloaded_again(tmp_path, archive):
+    cache = EmpireCache(str(tmp_path / 'cache'))
+    transport = CountingTransport(archive)
+    downloader = ImageDownloader(get_fetcher(transport, cache))
+    directory = str(tmp_path / 'images')
+    os.makedirs(directory)
+    out_file = downloader.get_file(IMAGE_URL, directory)
+    try:
+        downloader.download(IMAGE_URL, directory)[1].result()
+        # A leftover of an older, interrupted download is not mistaken for the image (the image is a link to the body
+        # in the cache, so the leftover is a new file)
+        os.remove(out_file)
+        with open(out_file, 'wb') as f:
+            f.write(IMAGE[:100])
+        assert not downloader.exists(out_file, cache.get_object_size(IMAGE_URL))
+        assert downloader.download(IMAGE_URL, directory)[1].result() == out_file
+    finally:
+        downloader.fetcher.close()
+    with open(out_file, 'rb') as f:
+        assert f.read() == IMAGE
+    # The second download is served from the cache
+    assert downloader.exists(out_file, cache.get_object_size(IMAGE_URL)) and transport.number_of_requests == 1
+
+
+def test_adaptive_limit_only_learns_from_2xx(tmp_path, archive):
+    fetcher = EmpireFetcher(transport=ReplayTransport(archive), proxies=[], max_number_of_attempts=1, adaptive=True,
+                            min_per_host=1, max_per_host=10)
+    try:
+        for page in range(2, 7):
+            assert fetcher.get(f'https://www.empireonline.com/movies/reviews/{page}/') == -1
+        limiter = fetcher.host_semaphores['www.empireonline.com']
+        # The 404s are neither successes nor congestion
+        assert limiter.limit == 1 and limiter.latencies == {}
+        fetcher.get(PAGE_URL)
+        assert limiter.limit == 2 and list(limiter.latencies) == ['listing']
+    finally:
+        fetcher.close()
+
+
+def get_review_urls(archive, number):
+    urls = [f'https://www.empireonline.com/movies/reviews/review-{i}/' for i in range(number)]
+    for i, url in enumerate(urls):
+        archive.save(url, 200, {'Content-Type': 'text/html'}, f'<html>{i}</html>'.encode('utf-8'))
+    return urls
+
+
+def test_fetches_run_concurrently_within_the_host_limit(archive):
+    urls = get_review_urls(archive, 24)
+    transport = ConcurrencyTransport(archive, latency=0.05)
+    fetcher = EmpireFetcher(transport=transport, proxies=[], max_per_host=6, max_number_of_attempts=1)
+    try:
+        start = time.perf_counter()
+        contents = fetcher.get_many(urls + urls[:3])
+        elapsed = time.perf_counter() - start
+    finally:
+        fetcher.close()
+    assert list(contents) == urls and contents[urls[5]] == b'<html>5</html>'
+    assert transport.max_in_flight == 6
+    # Sequential fetches would take 24 * 0.05 seconds
+    assert elapsed < 0.6
+
+
+def test_failed_attempts_are_retried(archive):
+    urls = get_review_urls(archive, 2)
+    transport = ConcurrencyTransport(archive, failures=2)
+    fetcher = EmpireFetcher(transport=transport, proxies=[], max_number_of_attempts=3, backoff=0.01)
+    try:
+        assert fetcher.get(urls[0]) == b'<html>0</html>'
+        assert fetcher.get(urls[1], max_number_of_attempts=2) == -1
+    finally:
+        fetcher.close()
+    assert transport.attempts == {urls[0]: 3, urls[1]: 2}
+    assert fetcher.pop_failure(urls[0]) is None
+    assert fetcher.pop_failure(urls[1]) == {'status': 503, 'attempts': 2, 'error_class': 'HTTPError'}
+
+
+def test_missing_page_is_not_retried(archive):
+    transport = ConcurrencyTransport(archive)
+    fetcher = EmpireFetcher(transport=transport, proxies=[], max_number_of_attempts=5, backoff=0.01)
+    url = 'https://www.empireonline.com/movies/reviews/missing/'
+    try:
+        assert fetcher.get(url) == -1
+    finally:
+        fetcher.close()
+    assert transport.attempts == {url: 1}
+    assert fetcher.pop_failure(url)['status'] == 404
+
+
+def test_deadline_stops_the_retries(archive):
+    urls = get_review_urls(archive, 1)
+    fetcher = EmpireFetcher(transport=ConcurrencyTransport(archive, failures=10), proxies=[],
+                            max_number_of_attempts=10, backoff=1, max_backoff=1, deadline=0.5)
+    try:
+        start = time.perf_counter()
+        assert fetcher.get(urls[0]) == -1
+        assert time.perf_counter() - start < 0.5
+    finally:
+        fetcher.close()
+    assert fetcher.pop_failure(urls[0])['error_class'] == 'DeadlineExceeded'
@@ -0,0 +1,120 @@
+import pytest
+
+import empire_scraper.empire_fetcher as empire_fetcher
+from empire_scraper.empire_frontier import UrlFrontier, find_last_page, normalize_url
+from empire_scraper.empire_movies import EmpireMovies
+from empire_scraper.empire_replay import FixtureArchive, ReplayTransport
+
+
+def get_info(info_id, review_url, page, article):
+    return {info_id: {info_id: {'InfoPage': page, 'InfoArticle': article, 'InfoReviewUrl': review_url}}}
+
+
+@pytest.fixture
+def frontier(tmp_path):
+    frontier = UrlFrontier(str(tmp_path / 'frontier.sqlite'))
+    yield frontier
+    frontier.close()
+
+
+@pytest.mark.parametrize('url', [
+    'https://www.empireonline.com/movies/reviews/heat-review/',
+    'https://www.empireonline.com/movies/reviews/heat-review',
+    'HTTPS://WWW.EmpireOnline.com//movies/reviews/heat-review/?utm_source=rss#comments',
+    ' https://www.empireonline.com/movies/reviews/heat-review/ ',
+])
+def test_normalize_url(url):
+    assert normalize_url(url) == 'https://www.empireonline.com/movies/reviews/heat-review/'
+
+
+def test_review_shifted_to_the_next_page_is_only_added_once(frontier):
+    infos = {**get_info('001-01', 'https://www.empireonline.com/movies/reviews/heat-review/', 1, 1),
+             **get_info('001-02', None, 1, 2)}
+    assert list(frontier.add_infos(infos)) == ['001-01', '001-02']
+    shifted = get_info('002-01', 'https://www.empireonline.com/movies/reviews/heat-review?page=2', 2, 1)
+    assert frontier.add_infos(shifted) == dict()
+    assert frontier.is_seen('https://www.empireonline.com/movies/reviews/heat-review')
+    # Articles without a review URL are never in the seen-set
+    assert frontier.get_counts() == {'pending': 1}
+
+
+def test_pending_entries_by_priority(frontier):
+    frontier.add_infos({**get_info('002-01', 'https://www.empireonline.com/movies/reviews/b/', 2, 1),
+                        **get_info('001-03', 'https://www.empireonline.com/movies/reviews/a/', 1, 3),
+                        **get_info('001-01', 'https://www.empireonline.com/movies/reviews/c/', 1, 1)})
+    assert [list(info)[0] for info in frontier.get_pending()] == ['001-01', '001-03', '002-01']
+    assert [list(info)[0] for info in frontier.get_pending(limit=1)] == ['001-01']
+
+    frontier.mark_done(['https://www.empireonline.com/movies/reviews/c', None])
+    assert frontier.get_counts() == {'done': 1, 'pending': 2}
+    frontier.requeue(['https://www.empireonline.com/movies/reviews/c/'])
+    assert frontier.get_counts() == {'pending': 3}
+
+    frontier.mark_done(['https://www.empireonline.com/movies/reviews/c/'])
+    frontier.forget_pending()
+    assert frontier.get_counts() == {'done': 1}
+    assert frontier.get_pending() == []
+
+
+def test_pending_entries_are_claimed_once(frontier):
+    frontier.add_infos({**get_info('002-01', 'https://www.empireonline.com/movies/reviews/b/', 2, 1),
+                        **get_info('001-01', 'https://www.empireonline.com/movies/reviews/a/', 1, 1)})
+    assert [list(info)[0] for info in frontier.claim_pending(1)] == ['001-01']
+    frontier.add_infos(get_info('001-02', 'https://www.empireonline.com/movies/reviews/c/', 1, 2))
+    assert [list(info)[0] for info in frontier.claim_pending(10)] == ['001-02', '002-01']
+    assert frontier.claim_pending(10) == []
+    assert frontier.get_counts() == {'queued': 3}
+
+    frontier.mark_done(['https://www.empireonline.com/movies/reviews/a/'])
+    frontier.forget_pending()
+    assert frontier.get_counts() == {'done': 1}
+
+
+@pytest.mark.parametrize('last_page', [0, 1, 2, 7, 64, 65, 1000])
+def test_find_last_page(last_page):
+    probes = []
+
+    def probe(page):
+        probes.append(page)
+        return page <= last_page
+
+    assert find_last_page(probe) == last_page
+    assert len(probes) <= 2 * max(last_page, 1).bit_length() + 2
+
+
+def test_find_last_page_stops_at_max_page():
+    assert find_last_page(lambda page: True, max_page=100) == 100
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    archive = FixtureArchive(str(tmp_path / 'fixtures'))
+    for page in range(1, 6):
+        archive.save(f'https://www.empireonline.com/movies/reviews/{page}/', 200, {'Content-Type': 'text/html'},
+                     b'<html><body><article></article></body></html>')
+    monkeypatch.setattr(empire_fetcher, '_fetcher', None)
+    yield archive
+    empire_fetcher.get_fetcher().close()
+    monkeypatch.setattr(empire_fetcher, '_fetcher', None)
+
+
+def get_empire_movies(archive):
+    empire_movies = EmpireMovies(process_images=False, use_proxies=False, use_cache=False,
+                                 transport=ReplayTransport(archive), rate=None, rate_per_host=None)
+    empire_movies.fetcher_settings['backoff'] = 0
+    return empire_movies
+
+
+def test_last_page_is_probed_until_a_missing_page(archive):
+    empire_movies = get_empire_movies(archive)
+    # Pages past the end are not in the archive, so they are a 404
+    assert empire_movies.probe_page(6) is False
+    assert empire_movies.get_last_page() == 5
+
+
+def test_failed_probe_is_not_the_last_page(archive):
+    archive.save('https://www.empireonline.com/movies/reviews/4/', 503, {}, b'')
+    empire_movies = get_empire_movies(archive)
+    with pytest.raises(RuntimeError, match='page 4'):
+        empire_movies.get_last_page()
@@ -0,0 +1,67 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from empire_scraper.empire_imaging import ImageCatalog, ImageProcessor, get_dhash
+
+
+def save_gradient(file, size, flip=False):
+    x = np.linspace(0, 255, size[0])
+    pixels = np.tile(np.sin(x / 20) * 127 + 128, (size[1], 1))
+    if flip:
+        pixels = pixels[:, ::-1]
+    Image.fromarray(pixels.astype(np.uint8)).convert('RGB').save(file, format='JPEG', quality=90)
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('thumbnails')
+    os.makedirs('pictures')
+    save_gradient(os.path.join('pictures', 'heat.jpg'), (800, 400))
+    save_gradient(os.path.join('thumbnails', 'heat.jpg'), (200, 100))
+    save_gradient(os.path.join('thumbnails', 'alien.jpg'), (200, 100), flip=True)
+    with open(os.path.join('thumbnails', 'broken.jpg'), 'wb') as f:
+        f.write(b'not an image')
+    with open(os.path.join('thumbnails', 'partial.jpg.part'), 'wb') as f:
+        f.write(b'\xff\xd8')
+    catalog = ImageCatalog(os.path.join('variants', 'catalog.sqlite'))
+    yield ImageProcessor(catalog, sizes=[160])
+    catalog.close()
+
+
+def test_dhash_survives_resizing():
+    image = Image.linear_gradient('L').rotate(30).resize((300, 200))
+    assert get_dhash(image) == get_dhash(image.resize((90, 60)))
+    assert len(get_dhash(image)) == 16
+
+
+def test_images_are_processed_once(processor):
+    assert processor.run() == 4
+    counts = processor.catalog.get_counts()
+    assert counts['images'] == 4 and counts['failed'] == 1
+    row = processor.catalog.get([os.path.join('pictures', 'heat.jpg')])[os.path.join('pictures', 'heat.jpg')]
+    assert (row['width'], row['height'], row['format']) == (800, 400, 'JPEG')
+    variant = json.loads(row['variants'])['160']
+    assert (variant['Width'], variant['Height']) == (160, 80) and os.path.exists(variant['File'])
+    # Nothing has changed, so nothing is processed again
+    assert processor.run() == 0
+
+
+def test_copies_are_found_as_duplicates(processor):
+    processor.run()
+    assert processor.catalog.find_duplicates() == [[os.path.join('pictures', 'heat.jpg'),
+                                                    os.path.join('thumbnails', 'heat.jpg')]]
+
+
+def test_movies_are_annotated(processor):
+    processor.run()
+    movies = {'001-01': {'InfoThumbnail': {'File': os.path.join('thumbnails', 'heat.jpg')}, 'Picture': None},
+              '001-02': {'InfoThumbnail': {'File': os.path.join('thumbnails', 'broken.jpg')}, 'Picture': None}}
+    processor.annotate(movies)
+    thumbnail = movies['001-01']['InfoThumbnail']
+    assert (thumbnail['Width'], thumbnail['Height']) == (200, 100) and len(thumbnail['Hash']) == 16
+    assert 'Width' not in movies['001-02']['InfoThumbnail']
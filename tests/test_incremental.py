@@ -0,0 +1,106 @@
+import pytest
+
+import empire_scraper.empire_fetcher as empire_fetcher
+from empire_scraper.empire_movies import EmpireMovies
+from empire_scraper.empire_replay import FixtureArchive, ReplayTransport
+
+
+def get_listing_page(slugs):
+    articles = ''.join(f'<article><a href="/movies/reviews/{slug}/"></a><p class="hdr no-marg gamma txt--black '
+                       f'pad__top--half">{slug.title()}</p></article>' for slug in slugs)
+    return f'<html><body>{articles}</body></html>'.encode('utf-8')
+
+
+def get_previous_movie(slug, page, article):
+    return {'InfoPage': page, 'InfoArticle': article, 'InfoUrl': None, 'InfoMovie': slug.title(),
+            'InfoReviewUrl': f'https://www.empireonline.com/movies/reviews/{slug}/', 'Review': 'Old'}
+
+
+@pytest.fixture
+def empire_movies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    archive = FixtureArchive(str(tmp_path / 'fixtures'))
+    for page, slugs in [(1, ['new', 'known-a']), (2, ['known-b', 'known-c']), (3, ['new-but-too-old'])]:
+        archive.save(f'https://www.empireonline.com/movies/reviews/{page}/', 200, {'Content-Type': 'text/html'},
+                     get_listing_page(slugs))
+    monkeypatch.setattr(empire_fetcher, '_fetcher', None)
+    empire_movies = EmpireMovies(process_images=False, use_proxies=False, use_cache=False,
+                                 transport=ReplayTransport(archive), rate=None, rate_per_host=None)
+    empire_movies.fetcher_settings['backoff'] = 0
+    empire_movies.archive = archive
+
+    def iter_movies_for_pages(pages, article_number=None, infos=None, skip_ids=None):
+        if infos is None:
+            infos = [info for page in pages for info in empire_movies.get_infos_for_page(page).values()]
+        for info in infos:
+            info_id = list(info)[0]
+            yield {info_id: dict(info[info_id], Review='New')}
+
+    monkeypatch.setattr(empire_movies, 'iter_movies_for_pages', iter_movies_for_pages)
+    yield empire_movies
+    empire_fetcher.get_fetcher().close()
+    monkeypatch.setattr(empire_fetcher, '_fetcher', None)
+
+
+def test_known_reviews_are_skipped(empire_movies):
+    known_review_urls = {'https://www.empireonline.com/movies/reviews/known-a/'}
+    assert list(empire_movies.get_infos_for_page(1, known_review_urls=known_review_urls)) == ['001-01']
+    assert list(empire_movies.get_infos_for_page(1, known_ids={'001-01'})) == ['001-02']
+
+
+def test_missing_page_is_empty_and_failed_page_is_none(empire_movies):
+    empire_movies.archive.save('https://www.empireonline.com/movies/reviews/5/', 503, {}, b'')
+    assert empire_movies.get_infos_for_page(4) == dict()
+    assert empire_movies.get_infos_for_page(5) is None
+    assert empire_movies.ledger.get('005')['kind'] == 'listing'
+
+
+def save_previous_run(empire_movies):
+    empire_movies.store.save('20240101-000000', {'001-01': get_previous_movie('known-a', 1, 1),
+                                                 '001-02': get_previous_movie('known-b', 1, 2),
+                                                 '002-01': get_previous_movie('known-c', 2, 1)})
+
+
+def test_only_new_reviews_are_scraped_and_merged(empire_movies):
+    save_previous_run(empire_movies)
+    movies = empire_movies.get_movies_incremental()
+    # The walk stops at page 2, which only has known reviews
+    assert [(info_id, movie['InfoMovie'], movie['Review']) for info_id, movie in movies.items()] == [
+        ('001-01', 'New', 'New'), ('001-02', 'Known-A', 'Old'), ('002-01', 'Known-B', 'Old'),
+        ('002-02', 'Known-C', 'Old')]
+    assert movies['002-01']['InfoUrl'] == 'https://www.empireonline.com/movies/reviews/2/'
+    assert empire_movies.frontier.get_counts() == {'done': 1}
+
+
+def test_failed_listing_page_is_retried(empire_movies, monkeypatch):
+    save_previous_run(empire_movies)
+    get_infos_for_page = empire_movies.get_infos_for_page
+    failures = {1: 2, 2: 1}
+
+    def flaky_get_infos_for_page(page, **kwargs):
+        if failures.get(page, 0) > 0:
+            failures[page] -= 1
+            return None
+        return get_infos_for_page(page, **kwargs)
+
+    monkeypatch.setattr(empire_movies, 'get_infos_for_page', flaky_get_infos_for_page)
+    movies = empire_movies.get_movies_incremental()
+    # A failed fetch of page 2 did not end the walk early, so known-c is still found on the listing
+    assert list(movies) == ['001-01', '001-02', '002-01', '002-02']
+    assert failures == {1: 0, 2: 0}
+
+
+def test_listing_page_which_keeps_failing_stops_the_crawl(empire_movies):
+    save_previous_run(empire_movies)
+    empire_movies.archive.save('https://www.empireonline.com/movies/reviews/1/', 503, {}, b'')
+    with pytest.raises(RuntimeError, match='page 1'):
+        empire_movies.get_movies_incremental()
+
+
+def test_first_incremental_run_scrapes_to_the_checkpoint(empire_movies, monkeypatch):
+    retries = []
+    monkeypatch.setattr(empire_movies, 'retry_failures', lambda: retries.append(True))
+    movies = empire_movies.get_movies_incremental(pages=3)
+    assert sorted(movies) == ['001-01', '001-02', '002-01', '002-02', '003-01']
+    assert empire_movies.checkpoint.get_ids() == set(movies)
+    assert retries == [True]
@@ -0,0 +1,99 @@
+import pytest
+
+from empire_scraper.empire_ledger import ErrorLedger
+from empire_scraper.empire_movies import EmpireMovies
+
+REVIEW_URL = 'https://www.empireonline.com/movies/reviews/some-movie-review/'
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = ErrorLedger(str(tmp_path / 'errors.sqlite'))
+    yield ledger
+    ledger.close()
+
+
+def test_record_adds_up_attempts(ledger):
+    ledger.record('001-01', REVIEW_URL, status=503, attempts=3, error_class='HTTPError')
+    ledger.record('001-01', REVIEW_URL, status=503, attempts=2, error_class='HTTPError')
+    error = ledger.get('001-01')
+    assert error['attempts'] == 5 and error['retryable'] == 1
+    assert [error['id'] for error in ledger.get_retryable()] == ['001-01']
+    ledger.resolve(['001-01'])
+    assert len(ledger) == 0
+
+
+def test_round_continues_after_restart(tmp_path, ledger):
+    ledger.start_round()
+    ledger.start_round()
+    ledger.record('001-01', REVIEW_URL, status=503)
+    ledger.close()
+    # A new process starts with a fresh ledger object
+    restarted = ErrorLedger(ledger.file)
+    assert restarted.start_round() == 3
+    restarted.close()
+
+
+@pytest.fixture
+def empire_movies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    movies = EmpireMovies(process_images=False, use_proxies=False, use_cache=False)
+    info = {'001-01': {'InfoPage': 1, 'InfoArticle': 1, 'InfoReviewUrl': REVIEW_URL}}
+    movies.frontier.add_infos({'001-01': info})
+    movies.frontier.mark_done([REVIEW_URL])
+    # An earlier retry (in another process) left the failure at round 2
+    earlier = ErrorLedger(movies.ledger.file)
+    earlier.round = 2
+    earlier.record('001-01', REVIEW_URL, status=503, attempts=5, error_class='HTTPError')
+    earlier.close()
+    return movies
+
+
+def test_retry_resolves_failure_of_an_earlier_process(empire_movies, monkeypatch):
+    def iter_movies_for_pages(pages, article_number=None, infos=None, skip_ids=None):
+        # The review is fetched successfully this time
+        yield {'001-01': {'InfoReviewUrl': REVIEW_URL, 'InfoMovie': 'Some Movie'}}
+
+    monkeypatch.setattr(empire_movies, 'iter_movies_for_pages', iter_movies_for_pages)
+    assert empire_movies.retry_failures() == 1
+    assert len(empire_movies.ledger) == 0
+
+
+def test_retry_keeps_failure_that_fails_again(empire_movies, monkeypatch):
+    def iter_movies_for_pages(pages, article_number=None, infos=None, skip_ids=None):
+        # The worker records the failure in the current round
+        empire_movies.ledger.record('001-01', REVIEW_URL, status=503, attempts=5, error_class='HTTPError')
+        yield {'001-01': {'InfoReviewUrl': REVIEW_URL, 'InfoMovie': None}}
+
+    monkeypatch.setattr(empire_movies, 'iter_movies_for_pages', iter_movies_for_pages)
+    assert empire_movies.retry_failures() == 0
+    error = empire_movies.ledger.get('001-01')
+    assert error['round'] == 2 + empire_movies.max_number_of_retries
+    assert error['attempts'] == 5 * (1 + empire_movies.max_number_of_retries)
+
+
+@pytest.mark.parametrize('url, retryable', [
+    ('https://www.empireonline.com/movies/reviews/some-movie-review/', True),
+    ('https://www.empireonline.com/movies/reviews/some-movie-review', True),
+    ('https://www.empireonline.com/movies/reviews/some-movie-review/gallery/', False),
+    ('https://www.empireonline.com/movies/reviews/some-movie-review/gallery/1/', False),
+    ('https://www.empireonline.com/movies/55-best-films-of-2018/', False),
+    ('https://www.empireonline.com/movies/news/some-news/', True),
+    (None, True),
+])
+def test_is_retryable_url(url, retryable):
+    assert ErrorLedger.is_retryable(url) is retryable
+
+
+@pytest.mark.parametrize('status, error_class, retryable', [
+    (503, 'HTTPError', True),
+    (429, 'HTTPError', True),
+    (408, 'HTTPError', True),
+    (404, 'HTTPError', False),
+    (403, 'HTTPError', False),
+    (None, 'ConnectionError', True),
+    (None, 'CacheMiss', False),
+    (None, 'NoReview', False),
+])
+def test_is_retryable_status(status, error_class, retryable):
+    assert ErrorLedger.is_retryable(REVIEW_URL, status, error_class) is retryable
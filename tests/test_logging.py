@@ -0,0 +1,54 @@
+import logging
+import pickle
+import queue
+import sys
+
+import pytest
+
+from empire_scraper.empire_helpers import BatchingQueueHandler
+
+
+@pytest.fixture
+def handler():
+    handler = BatchingQueueHandler(queue.Queue(), batch_size=3, flush_interval=60)
+    yield handler
+    handler.close()
+
+
+def get_record(message, *args, exc_info=None):
+    return logging.LogRecord('sub_logger1', logging.INFO, __file__, 1, message, args, exc_info)
+
+
+def test_records_are_sent_in_batches(handler):
+    for i in range(4):
+        handler.emit(get_record('GetReview|%s|', f'001-0{i}'))
+    batch = handler.queue.get_nowait()
+    assert [record.getMessage() for record in batch] == ['GetReview|001-00|', 'GetReview|001-01|',
+                                                         'GetReview|001-02|']
+    assert handler.queue.empty()
+    # The rest is sent when the worker flushes on exit
+    handler.flush()
+    assert [record.getMessage() for record in handler.queue.get_nowait()] == ['GetReview|001-03|']
+    handler.flush()
+    assert handler.queue.empty()
+
+
+def test_only_the_formatted_message_travels(handler):
+    try:
+        raise ValueError('broken page')
+    except ValueError:
+        record = get_record('ReviewWorkerFailed|%s|%s', '001-01', object(), exc_info=sys.exc_info())
+    handler.emit(record)
+    handler.flush()
+    record = pickle.loads(pickle.dumps(handler.queue.get_nowait()[0]))
+    assert record.args is None and record.exc_info is None
+    assert record.msg.startswith('ReviewWorkerFailed|001-01|<object object') and 'ValueError: broken page' in record.msg
+
+
+def test_buffer_is_flushed_periodically():
+    handler = BatchingQueueHandler(queue.Queue(), batch_size=100, flush_interval=0.01)
+    try:
+        handler.emit(get_record('GetReviewPage|1|'))
+        assert len(handler.queue.get(timeout=5)) == 1
+    finally:
+        handler.close()
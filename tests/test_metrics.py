@@ -0,0 +1,57 @@
+import io
+import multiprocessing
+import urllib.error
+import urllib.request
+
+import pytest
+
+from empire_scraper.empire_metrics import CrawlMetrics, MetricsServer, ProgressDisplay
+
+
+def count_requests(metrics, number):
+    for _ in range(number):
+        metrics.inc('requests')
+
+
+def test_workers_share_the_counters():
+    metrics = CrawlMetrics()
+    processes = [multiprocessing.get_context('fork').Process(target=count_requests, args=(metrics, 100))
+                 for _ in range(2)]
+    [process.start() for process in processes]
+    [process.join() for process in processes]
+    metrics.set('fetch_slots', 4)
+    values = metrics.get_values()
+    assert values['requests'] == 200 and values['fetch_slots'] == 4
+
+
+def test_server_serves_the_prometheus_format():
+    metrics = CrawlMetrics()
+    metrics.inc('reviews_done', 3)
+    server = MetricsServer(metrics, port=0)
+    server.start()
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics') as response:
+            body = response.read().decode('utf-8')
+        assert response.headers['Content-Type'].startswith('text/plain')
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'http://127.0.0.1:{server.port}/other')
+    finally:
+        server.stop()
+    assert '# TYPE empire_reviews_done_total counter\nempire_reviews_done_total 3\n' in body
+    assert '# TYPE empire_fetch_slots gauge\nempire_fetch_slots 0\n' in body
+    assert 'empire_uptime_seconds ' in body
+
+
+def test_progress_line():
+    metrics = CrawlMetrics()
+    display = ProgressDisplay(metrics, stream=io.StringIO())
+    metrics.set('pages_planned', 10)
+    metrics.inc('pages_done', 2)
+    metrics.inc('reviews_found', 40)
+    metrics.inc('reviews_done', 20)
+    metrics.inc('requests', 25)
+    metrics.inc('retries', 5)
+    line = display.get_line()
+    # 20 reviews on 2 of 10 pages, so about 200 reviews in total
+    assert line.startswith('pages 2/10 | reviews 20/200 |')
+    assert 'retries 20.0%' in line and 'errors 0.0%' in line and 'ETA 0:' in line
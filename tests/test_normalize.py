@@ -0,0 +1,88 @@
+import pyarrow as pa
+import pytest
+
+from empire_scraper.empire_normalize import (DATE_FORMATS, get_raw_schema, narrow_integer, normalize_certificate,
+                                             normalize_date, normalize_rating, normalize_running_time, normalize_table)
+
+SCHEMA = pa.schema([
+    ('ID', pa.string()),
+    ('ReleaseDate', pa.string()),
+    ('Certificate', pa.dictionary(pa.int8(), pa.string())),
+    ('RunningTime', pa.int16()),
+    ('Rating', pa.int8()),
+])
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('12 Feb 2018', '2018-02-12'),
+    ('1 feb 2018', '2018-02-01'),
+    ('01 Feb 2018', '2018-02-01'),
+    (' 3 March 2018 ', '2018-03-03'),
+    ('29 Feb 2020', '2020-02-29'),
+    ('2018-02-03', '2018-02-03'),
+    # Impossible dates are not rolled over to the next month
+    ('31 Feb 2018', None),
+    ('29 Feb 2019', None),
+    ('2018-02-31', None),
+    # Partial dates do not become the 1st of the month
+    ('Feb 2018', None),
+    ('2018', None),
+    ('TBC', None),
+    ('', None),
+    (None, None),
+])
+def test_normalize_release_date(value, expected):
+    assert normalize_date(pa.array([value], pa.string()), DATE_FORMATS['ReleaseDate']).to_pylist() == [expected]
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2 hrs 32 mins', 152),
+    ('1 hr 5 mins', 65),
+    ('152 minutes', 152),
+    ('152', 152),
+    ('2 hrs', 120),
+    ('unknown', None),
+    (None, None),
+    # Out of the range of int16
+    ('40000 mins', None),
+    ('1 hr 99999 mins', None),
+    ('12345678901234567890 mins', None),
+])
+def test_normalize_running_time(value, expected):
+    assert normalize_running_time(pa.array([value], pa.string())).to_pylist() == [expected]
+
+
+def test_normalize_certificate_keeps_known_codes():
+    certificates = normalize_certificate(pa.array(['15', ' pg ', 'X', None, '12A']))
+    assert certificates.to_pylist() == ['15', 'PG', 'X', None, '12A']
+    # The known certificates have the same code in every batch
+    assert certificates.dictionary.to_pylist()[:3] == ['U', 'PG', '12']
+
+
+def test_normalize_rating_range():
+    assert normalize_rating(pa.array([0, 3, 5, 6, -1, None])).to_pylist() == [0, 3, 5, None, None, None]
+
+
+def test_narrow_integer_range():
+    narrowed = narrow_integer(pa.array([1, 32767, 32768, -32769, None]), pa.int16())
+    assert narrowed.type == pa.int16() and narrowed.to_pylist() == [1, 32767, None, None, None]
+
+
+def test_normalize_table_reports_failures():
+    raw = pa.Table.from_pydict({
+        'ID': ['001-01', '001-02', '001-03', '001-04'],
+        'ReleaseDate': ['12 Feb 2018', '31 Feb 2018', '2018', None],
+        'Certificate': ['15', 'X', None, 'PG'],
+        'RunningTime': ['2 hrs 32 mins', 'soon', None, '90'],
+        'Rating': [4, 9, None, 5],
+    }, schema=get_raw_schema(SCHEMA))
+    table, failures = normalize_table(raw, SCHEMA)
+    assert table.schema == SCHEMA
+    assert table['ReleaseDate'].to_pylist() == ['2018-02-12', None, None, None]
+    assert table['RunningTime'].to_pylist() == [152, None, None, 90]
+    assert failures == {
+        'ReleaseDate': [('001-02', '31 Feb 2018'), ('001-03', '2018')],
+        'Certificate': [('001-02', 'X')],
+        'RunningTime': [('001-02', 'soon')],
+        'Rating': [('001-02', 9)],
+    }
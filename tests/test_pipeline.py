@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+
+import pytest
+
+from empire_scraper.empire_frontier import UrlFrontier
+from empire_scraper.empire_pipeline import EmpirePipeline, get_batch
+
+
+class StubMetrics(object):
+    def inc(self, name, value=1):
+        pass
+
+
+class StubMovies(object):
+    """
+    Stand-in for the worker copy of EmpireMovies with number_of_articles articles per page, which kills its worker
+    process on the given page or review.
+    """
+
+    def __init__(self, frontier_file, crash_page=None, crash_review=None, number_of_articles=1, review_urls=True):
+        self.crash_page = crash_page
+        self.crash_review = crash_review
+        self.number_of_articles = number_of_articles
+        self.review_urls = review_urls
+        self.metrics = StubMetrics()
+        self.frontier = UrlFrontier(frontier_file)
+        self.fetcher_settings = {'max_concurrency': 8}
+
+    def get_infos_for_page(self, page, article_number=None, logger=None, known_ids=None):
+        if page == self.crash_page:
+            os.kill(os.getpid(), signal.SIGKILL)
+        infos = dict()
+        for article in range(1, self.number_of_articles + 1):
+            info_id = f'{page:03d}-{article:02d}'
+            review_url = f'https://www.empireonline.com/movies/reviews/{info_id}/' if self.review_urls else None
+            infos[info_id] = {info_id: {'InfoPage': page, 'InfoArticle': article, 'InfoReviewUrl': review_url}}
+        return infos
+
+    @staticmethod
+    def fetch_reviews(infos, logger):
+        return {value['InfoReviewUrl']: f'<html>{info_id}</html>' for info in infos for info_id, value in info.items()
+                if value['InfoReviewUrl'] is not None}
+
+    def get_movie_for_info(self, info, logger, html=None):
+        info_id = list(info.keys())[0]
+        if info_id == self.crash_review:
+            os.kill(os.getpid(), signal.SIGKILL)
+        return {info_id: dict(info[info_id], InfoMovie=f'Movie {info_id}', Review=html)}, []
+
+
+@pytest.fixture
+def frontier_file(tmp_path):
+    return str(tmp_path / 'frontier.sqlite')
+
+
+def get_pipeline(empire_movies, number_of_review_workers=2, queue_size=100):
+    return EmpirePipeline(empire_movies, number_of_listing_workers=2,
+                          number_of_review_workers=number_of_review_workers, number_of_review_threads=2,
+                          queue_size=queue_size, poll_interval=0.1, feed_interval=0.01)
+
+
+def run_pipeline(empire_movies, pages, number_of_review_workers=2, queue_size=100):
+    movies = dict()
+    for movie in get_pipeline(empire_movies, number_of_review_workers, queue_size).run(
+            pages, log_queue=multiprocessing.Queue()):
+        movies.update(movie)
+    return movies
+
+
+def test_pipeline_yields_every_movie(frontier_file):
+    movies = run_pipeline(StubMovies(frontier_file), range(1, 11))
+    assert sorted(movies) == [f'{page:03d}-01' for page in range(1, 11)]
+    assert movies['003-01']['InfoMovie'] == 'Movie 003-01'
+    # The reviews have been fetched in batches before they were parsed
+    assert movies['003-01']['Review'] == '<html>003-01</html>'
+    # Every review has been handed out by the frontier
+    assert StubMovies(frontier_file).frontier.get_counts() == {'queued': 10}
+
+
+def test_pipeline_yields_the_articles_sent_just_before_the_sentinels(tmp_path):
+    # Articles without a review URL go straight to the article queue, so the last ones are still in the feeder
+    # thread of the queue when their listing worker is done
+    for i in range(5):
+        empire_movies = StubMovies(str(tmp_path / f'frontier{i}.sqlite'), number_of_articles=24, review_urls=False)
+        movies = run_pipeline(empire_movies, range(1, 5), queue_size=10)
+        assert len(movies) == 4 * 24
+
+
+def test_review_workers_are_fed_from_the_frontier_by_priority(frontier_file):
+    empire_movies = StubMovies(frontier_file, number_of_articles=2)
+    for page in [3, 1, 2]:
+        empire_movies.frontier.add_infos(empire_movies.get_infos_for_page(page))
+    pipeline = get_pipeline(empire_movies, queue_size=4)
+    article_queue, result_queue = queue.Queue(), queue.Queue()
+    listing_finished, stop = threading.Event(), threading.Event()
+    listing_finished.set()
+    pipeline.feed_frontier(article_queue, result_queue, listing_finished, stop)
+    assert [list(article_queue.get())[0] for _ in range(article_queue.qsize())] == [
+        '001-01', '001-02', '002-01', '002-02', '003-01', '003-02']
+    assert result_queue.get() == ('done', ('feeder', 'frontier'))
+
+
+def test_review_threads_take_the_waiting_infos_in_a_batch():
+    article_queue = queue.Queue()
+    for info in [{'001-01': {}}, {'001-02': {}}, {'001-03': {}}, None]:
+        article_queue.put(info)
+    assert get_batch(article_queue, 2) == ([{'001-01': {}}, {'001-02': {}}], False)
+    assert get_batch(article_queue, 2) == ([{'001-03': {}}], True)
+    article_queue.put({'002-01': {}})
+    assert get_batch(article_queue, 2) == ([{'002-01': {}}], False)
+
+
+def test_pipeline_fails_when_a_listing_worker_dies(frontier_file):
+    with pytest.raises(RuntimeError, match='listing'):
+        run_pipeline(StubMovies(frontier_file, crash_page=3), range(1, 11))
+
+
+def test_pipeline_fails_when_a_review_worker_dies(frontier_file):
+    with pytest.raises(RuntimeError, match='review'):
+        run_pipeline(StubMovies(frontier_file, crash_review='005-01'), range(1, 11), number_of_review_workers=1)
+
+
+def test_pipeline_fails_when_a_review_worker_dies_before_the_sentinels_fit(frontier_file):
+    # The article queue stays full, so the sentinels never fit
+    with pytest.raises(RuntimeError, match='review'):
+        run_pipeline(StubMovies(frontier_file, crash_review='010-01'), range(1, 11), number_of_review_workers=1,
+                     queue_size=1)
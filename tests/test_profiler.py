@@ -0,0 +1,37 @@
+import json
+
+from empire_scraper.empire_profiler import EmpireProfiler
+
+
+def test_summary_percentiles_and_histogram():
+    profiler = EmpireProfiler()
+    for value in [0.0005, 0.003, 0.003, 0.15, 3.0]:
+        profiler.record('review.total', value)
+    profiler.record('bytes.review', 2048)
+    summary = profiler.get_summary()
+    timing = summary['review.total']
+    assert timing['count'] == 5 and timing['min'] == 0.0005 and timing['max'] == 3.0
+    assert timing['p50'] == 0.003 and timing['p95'] == 3.0
+    assert timing['histogram']['le_0.001'] == 1 and timing['histogram']['le_0.005'] == 2
+    assert sum(timing['histogram'].values()) == 5
+    assert summary['bytes.review']['total'] == 2048 and 'histogram' not in summary['bytes.review']
+
+
+def test_worker_samples_are_drained_and_merged(tmp_path):
+    worker, main = EmpireProfiler(), EmpireProfiler()
+    with worker.stage('listing.soup'):
+        pass
+    main.record('listing.soup', 0.5)
+    main.merge(worker.drain())
+    assert worker.drain() == dict()
+    assert main.get_summary()['listing.soup']['count'] == 2
+    main.save(str(tmp_path / 'profile.json'))
+    with open(tmp_path / 'profile.json') as f:
+        assert list(json.load(f)) == ['listing.soup']
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = EmpireProfiler(enabled=False)
+    with profiler.stage('review.total'):
+        pass
+    assert profiler.get_summary() == dict()
@@ -0,0 +1,66 @@
+import multiprocessing
+import pickle
+import random
+
+import pytest
+
+from empire_scraper.empire_proxies import ProxyScheduler
+
+PROXIES = [{'https': f'http://10.0.0.{i}:8080'} for i in range(3)]
+
+
+def report_successes(scheduler, i, number):
+    for _ in range(number):
+        scheduler.report(i, True, latency=0.2)
+
+
+@pytest.fixture
+def scheduler():
+    random.seed(0)
+    return ProxyScheduler(PROXIES, max_consecutive_failures=2, quarantine=30, max_quarantine=100)
+
+
+def test_healthiest_proxy_is_preferred(scheduler):
+    report_successes(scheduler, 1, 10)
+    for _ in range(5):
+        scheduler.report(2, False)
+        scheduler.report(2, True, latency=3.0)
+    chosen = [scheduler.choose()[0] for _ in range(300)]
+    assert chosen.count(1) > chosen.count(0) > chosen.count(2)
+    assert scheduler.get_stats()[1]['proxy'] == 'http://10.0.0.1:8080'
+
+
+def test_failing_proxy_is_quarantined_with_backoff(scheduler, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('time.time', lambda: now[0])
+    assert scheduler.report(0, False) is None
+    assert scheduler.report(0, False) == 30
+    assert all(scheduler.choose()[0] != 0 for _ in range(50))
+    assert scheduler.report(0, False) == 60
+    assert scheduler.report(0, False) == 100
+    # A success ends the quarantine streak
+    now[0] += 200
+    scheduler.report(0, True, latency=0.5)
+    assert scheduler.get_stats()[0]['consecutive_failures'] == 0
+    assert scheduler.report(0, False) is None
+
+
+def test_all_quarantined_reprobes_the_first_released(scheduler, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('time.time', lambda: now[0])
+    for i in [2, 0, 1]:
+        scheduler.report(i, False)
+        scheduler.report(i, False)
+        now[0] += 1
+    assert scheduler.choose() == (2, PROXIES[2])
+    assert ProxyScheduler([]).choose() == (None, None)
+
+
+def test_workers_share_the_state(scheduler):
+    process = multiprocessing.get_context('fork').Process(target=report_successes, args=(scheduler, 2, 5))
+    process.start()
+    process.join()
+    assert scheduler.get_stats()[2]['successes'] == 5
+    # Outside of the creation of a process a snapshot of the state is pickled
+    copy = pickle.loads(pickle.dumps(scheduler))
+    assert copy.get_stats()[2]['successes'] == 5
@@ -0,0 +1,138 @@
+import asyncio
+import random
+import time
+from email.utils import formatdate
+
+import pytest
+
+from empire_scraper.empire_ratelimit import AdaptiveLimiter, RateLimiter, TokenBucket, get_backoff, \
+    parse_retry_after
+
+
+def test_adaptive_limiter_slow_start_and_halving():
+    changes = []
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=10, on_change=lambda old, new: changes.append((old, new)))
+    for _ in range(5):
+        limiter.report(time.perf_counter(), True)
+    assert int(limiter.limit) == 6
+    limiter.report(time.perf_counter(), False)
+    assert int(limiter.limit) == 3
+    # After the first congestion signal the limit grows by about one slot per limit successes
+    for _ in range(3):
+        limiter.report(time.perf_counter(), True)
+    assert int(limiter.limit) == 3
+    for _ in range(10):
+        limiter.report(time.perf_counter(), True)
+    assert 4 <= int(limiter.limit) <= 6
+    assert changes[0] == (0, 1) and (6, 3) in changes
+
+
+def test_adaptive_limiter_decreases_once_per_round_trip():
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=16, initial=16)
+    start = time.perf_counter()
+    # All requests were in flight when the first failure came in
+    for _ in range(5):
+        limiter.report(start, False)
+    assert int(limiter.limit) == 8
+    limiter.report(time.perf_counter(), False)
+    assert int(limiter.limit) == 4
+
+
+def test_adaptive_limiter_stays_within_bounds():
+    limiter = AdaptiveLimiter(min_limit=2, max_limit=4)
+    for _ in range(10):
+        limiter.report(time.perf_counter(), True)
+    assert limiter.limit == 4
+    for _ in range(10):
+        limiter.report(time.perf_counter(), False)
+    assert limiter.limit == 2
+
+
+def test_fast_outlier_does_not_pin_the_baseline():
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=10, initial=10, latency_window=10)
+    for _ in range(10):
+        limiter.report(time.perf_counter(), True, 1.0, 'review')
+    # One unusually fast review lowers the baseline, but only while it is in the window
+    limiter.report(time.perf_counter(), True, 0.05, 'review')
+    assert limiter.get_baseline('review') == 0.05
+    for _ in range(10):
+        limiter.report(time.perf_counter(), True, 1.0, 'review')
+    assert limiter.get_baseline('review') == 1.0
+    # Once the outlier has left the window, normal latencies are no congestion and the limit grows again
+    limit = limiter.limit
+    for _ in range(20):
+        limiter.report(time.perf_counter(), True, 1.0, 'review')
+    assert limiter.limit > limit
+
+
+def test_latency_is_compared_per_class():
+    limiter = AdaptiveLimiter(min_limit=1, max_limit=10, initial=10)
+    for _ in range(5):
+        limiter.report(time.perf_counter(), True, 0.05, 'listing')
+    # Reviews are slower than listing pages, which is no congestion
+    for _ in range(5):
+        limiter.report(time.perf_counter(), True, 1.0, 'review')
+    assert limiter.limit == 10
+    limiter.report(time.perf_counter(), True, 4.0, 'review')
+    assert int(limiter.limit) == 9
+
+
+def test_adaptive_limiter_bounds_concurrency():
+    limiter = AdaptiveLimiter(min_limit=2, max_limit=2)
+    running, peak = 0, 0
+
+    async def task():
+        nonlocal running, peak
+        async with limiter:
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def main():
+        await asyncio.gather(*[task() for _ in range(10)])
+
+    asyncio.run(main())
+    assert peak == 2 and limiter.in_flight == 0
+
+
+def test_token_bucket_serves_waiting_requests_in_order(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    bucket = TokenBucket(rate=2, capacity=2)
+    # The burst is served right away, the next requests go into debt at the rate
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+    now[0] += 1.0
+    assert bucket.reserve() == 0.5
+
+
+def test_rate_limiter_applies_the_slowest_bucket(monkeypatch):
+    monkeypatch.setattr(time, 'monotonic', lambda: 100.0)
+    limiter = RateLimiter(rate=10, rate_per_host=1, burst=1)
+    assert limiter.reserve('https://a.example.com/1') == 0
+    assert limiter.reserve('https://a.example.com/2') == 1.0
+    # Another host is only held back by the global bucket, which has served two requests already
+    assert limiter.reserve('https://b.example.com/1') == pytest.approx(0.2)
+    assert RateLimiter().reserve('https://a.example.com/1') == 0
+
+
+def test_backoff_is_jittered_and_capped():
+    random.seed(1)
+    for number_of_attempts, upper in [(1, 0.5), (2, 1.0), (4, 4.0), (20, 30)]:
+        waits = [get_backoff(number_of_attempts) for _ in range(200)]
+        assert all(0 <= wait <= upper for wait in waits) and max(waits) > upper / 2
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, None),
+    ('120', 120),
+    (' 0 ', 0),
+    ('soon', None),
+    (formatdate(0, usegmt=True), 0),
+])
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_date():
+    assert 55 < parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
@@ -0,0 +1,67 @@
+import pickle
+
+import pytest
+import requests
+
+from empire_scraper.empire_fetcher import EmpireFetcher
+from empire_scraper.empire_replay import FixtureArchive, ReplayTransport
+
+LISTING_URL = 'https://www.empireonline.com/movies/reviews/1/'
+REVIEW_URL = 'https://www.empireonline.com/movies/reviews/heat-review/'
+IMAGE_URL = 'https://images.example.com/heat.jpg'
+
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = FixtureArchive(str(tmp_path / 'fixtures'))
+    archive.save(LISTING_URL, 200, {'Content-Type': 'text/html', 'Set-Cookie': 'session=1'}, b'<html>1</html>')
+    archive.save(REVIEW_URL, 200, {'Content-Type': 'text/html'}, b'<html>old</html>')
+    archive.save(REVIEW_URL, 200, {'Content-Type': 'text/html'}, b'<html>new</html>')
+    archive.save(IMAGE_URL, 200, {'Content-Type': 'image/jpeg'}, b'\xff\xd8\xff')
+    return archive
+
+
+def test_archive_keeps_the_last_response(archive):
+    reopened = pickle.loads(pickle.dumps(archive))
+    assert reopened.get(REVIEW_URL)['content'] == b'<html>new</html>'
+    # Only the headers, which matter for replaying, are recorded
+    assert reopened.get(LISTING_URL)['headers'] == {'Content-Type': 'text/html'}
+    assert reopened.get('https://www.empireonline.com/movies/reviews/2/') is None
+    assert reopened.get_urls('listing') == [LISTING_URL]
+    assert reopened.get_urls() == [IMAGE_URL, LISTING_URL, REVIEW_URL]
+
+
+def get_outcomes(transport, url, number):
+    session = requests.Session()
+    session.mount('https://', transport)
+    outcomes = []
+    for _ in range(number):
+        try:
+            outcomes.append(session.get(url).status_code)
+        except requests.exceptions.ConnectionError:
+            outcomes.append('error')
+    return outcomes
+
+
+def test_transport_replays_and_injects_errors(archive):
+    outcomes = get_outcomes(ReplayTransport(archive, error_rate=0.5, seed=3), REVIEW_URL, 200)
+    assert 60 < outcomes.count(200) < 140
+    assert outcomes.count(503) > 20 and outcomes.count('error') > 20
+    # The same seed injects the same errors, also in another process
+    transport = pickle.loads(pickle.dumps(ReplayTransport(archive, error_rate=0.5, seed=3)))
+    assert get_outcomes(transport, REVIEW_URL, 200) == outcomes
+    assert get_outcomes(ReplayTransport(archive), 'https://www.empireonline.com/movies/reviews/2/', 1) == [404]
+
+
+def test_fetcher_records_the_responses(tmp_path, archive):
+    recorded = FixtureArchive(str(tmp_path / 'recorded'))
+    fetcher = EmpireFetcher(transport=ReplayTransport(archive), recorder=recorded, proxies=[],
+                            max_number_of_attempts=1)
+    try:
+        fetcher.get_many([LISTING_URL, REVIEW_URL, 'https://www.empireonline.com/movies/reviews/2/'])
+        fetcher.get(IMAGE_URL, out_file=str(tmp_path / 'heat.jpg'))
+    finally:
+        fetcher.close()
+    # Only the successful responses are recorded
+    assert recorded.get_urls() == [IMAGE_URL, LISTING_URL, REVIEW_URL]
+    assert recorded.get(IMAGE_URL)['content'] == b'\xff\xd8\xff'
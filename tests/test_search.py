@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from empire_scraper.empire_movies import EmpireMovies
+from empire_scraper.empire_search import SearchIndex, parse_query, tokenize
+
+
+def get_movie(info_id, title, review, introduction=None, author='Ian Freer'):
+    return {info_id: {'InfoMovie': title, 'InfoReviewUrl': f'https://www.empireonline.com/movies/reviews/{info_id}/',
+                      'Review': review, 'Introduction': introduction, 'Author': author}}
+
+
+@pytest.fixture
+def search_index(tmp_path):
+    search_index = SearchIndex(str(tmp_path / 'index'), segment_size=2, max_segments=10)
+    search_index.add_movies({**get_movie('001-01', 'Heat', 'A heist thriller in Los Angeles with Pacino'),
+                             **get_movie('001-02', 'Alien', 'A horror film set in space, the best space horror'),
+                             **get_movie('001-03', 'Space Jam', 'Basketball and cartoons', author='Kim Newman'),
+                             **get_movie('001-04', 'Ronin', 'Car chases in Paris', 'A heist thriller')},
+                            run='20240101-000000')
+    search_index.commit()
+    return search_index
+
+
+def get_ids(results):
+    return [result['ID'] for result in results]
+
+
+@pytest.fixture
+def empire_movies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return EmpireMovies(process_images=False, use_proxies=False, use_cache=False)
+
+
+def test_movies_for_pages_are_committed_to_the_index(empire_movies, monkeypatch):
+    movies = [get_movie('001-01', 'Heat', 'A heist thriller in Los Angeles'),
+              get_movie('001-02', 'Alien', 'A space horror classic')]
+    monkeypatch.setattr(empire_movies, 'iter_movies_for_pages', lambda pages, article_number=None: iter(movies))
+    assert len(empire_movies.get_movies_for_pages([1])) == 2
+
+    search_index = SearchIndex(os.path.join('results', 'index'))
+    assert len(search_index) == 2
+    assert [result['ID'] for result in search_index.search('heist')] == ['001-01']
+
+
+def test_tokenize_and_parse_query():
+    assert tokenize('Amélie: Le Fabuleux Destin!') == ['amelie', 'le', 'fabuleux', 'destin']
+    assert tokenize(None) == []
+    assert parse_query('heist "Los  Angeles" !') == [['heist'], ['los', 'angeles']]
+
+
+def test_fields_are_weighted(search_index):
+    # The title outweighs the review and the introduction outweighs the review
+    assert get_ids(search_index.search('space')) == ['001-03', '001-02']
+    assert get_ids(search_index.search('heist')) == ['001-04', '001-01']
+    results = search_index.search('heist thriller pacino')
+    assert get_ids(results) == ['001-01', '001-04'] and results[0]['Score'] > results[1]['Score']
+    assert search_index.search('godfather') == [] and search_index.search('') == []
+
+
+def test_phrases_and_match_all(search_index):
+    assert get_ids(search_index.search('"space horror"')) == ['001-02']
+    assert search_index.search('"horror space"') == []
+    # A phrase never spans two fields: the title of Ronin ends in "ronin" and its review starts with "car"
+    assert search_index.search('"ronin car"') == []
+    assert get_ids(search_index.search('heist pacino', match_all=True)) == ['001-01']
+    assert get_ids(search_index.search('space', limit=1)) == ['001-03']
+
+
+def test_newest_version_of_a_review_wins(search_index):
+    search_index.add_movies(get_movie('001-01', 'Heat', 'A crime epic'), run='20240102-000000')
+    search_index.commit()
+    assert search_index.search('heist pacino', match_all=True) == []
+    results = search_index.search('crime')
+    assert get_ids(results) == ['001-01'] and results[0]['Run'] == '20240102-000000'
+    assert search_index.get_counts()['replaced'] == 1 and len(search_index) == 4
+
+
+def test_merge_keeps_the_results(search_index):
+    search_index.add_movies(get_movie('001-01', 'Heat', 'A crime epic'), run='20240102-000000')
+    search_index.commit()
+    queries = ['space', 'heist', '"space horror"', 'crime', 'paris chases']
+    before = [search_index.search(query) for query in queries]
+    search_index.merge()
+    counts = search_index.get_counts()
+    assert counts['segments'] == 1 and counts['documents'] == 4 and counts['replaced'] == 0
+    reopened = SearchIndex(search_index.directory)
+    for query, results in zip(queries, before):
+        after = reopened.search(query)
+        assert get_ids(after) == get_ids(results)
+        assert [result['Score'] for result in after] == pytest.approx([result['Score'] for result in results])
@@ -0,0 +1,37 @@
+import pickle
+
+import pytest
+
+from empire_scraper.empire_replay import FixtureArchive, ReplayTransport
+from empire_scraper.empire_sessions import SessionPool
+
+PROXY = {'http': 'http://10.0.0.1:8080', 'https': 'http://10.0.0.2:8080'}
+
+
+@pytest.mark.parametrize('url, proxy, key', [
+    ('https://www.empireonline.com/movies/reviews/1/', None, (None, 'https', 'www.empireonline.com')),
+    ('https://www.empireonline.com/movies/reviews/1/', PROXY,
+     ('http://10.0.0.2:8080', 'https', 'www.empireonline.com')),
+    ('http://images.example.com/a.jpg', PROXY, ('http://10.0.0.1:8080', 'http', 'images.example.com')),
+])
+def test_session_key(url, proxy, key):
+    assert SessionPool.get_key(url, proxy) == key
+
+
+def test_sessions_are_reused_per_proxy_and_host(tmp_path):
+    archive = FixtureArchive(str(tmp_path / 'fixtures'))
+    archive.save('https://www.empireonline.com/movies/reviews/1/', 200, {}, b'<html></html>')
+    pool = SessionPool(transport=ReplayTransport(archive))
+    try:
+        session = pool.get_session('https://www.empireonline.com/movies/reviews/1/')
+        assert pool.get_session('https://www.empireonline.com/movies/reviews/2/') is session
+        assert pool.get_session('https://www.empireonline.com/movies/reviews/2/', PROXY) is not session
+        assert pool.get_session('https://images.example.com/a.jpg') is not session
+        assert pool.get('https://www.empireonline.com/movies/reviews/1/').content == b'<html></html>'
+        assert len(pool.sessions) == 3
+        # Sessions never travel to other processes
+        copy = pickle.loads(pickle.dumps(pool))
+        assert copy.sessions == dict() and copy.pool_maxsize == pool.pool_maxsize
+    finally:
+        pool.close()
+    assert pool.sessions == dict()
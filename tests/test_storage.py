@@ -0,0 +1,99 @@
+import os
+import pickle
+
+import pandas as pd
+import pytest
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from empire_scraper.empire_record import MovieRecord
+from empire_scraper.empire_storage import EmpireStore
+
+MOVIE = {'InfoPage': 1, 'InfoArticle': 2, 'InfoUrl': 'https://www.empireonline.com/movies/reviews/',
+         'InfoMovie': 'Heat', 'IsEssay': False, 'InfoReviewUrl': 'https://www.empireonline.com/movies/reviews/heat/',
+         'InfoRating': 5, 'InfoThumbnail': {'Source': 'https://images.example.com/heat.jpg',
+                                            'File': 'thumbnails/heat.jpg'},
+         'ReleaseDate': '12 Feb 1996', 'Certificate': '15', 'RunningTime': '171 mins', 'Rating': 5,
+         'Author': 'Ian Freer', 'Introduction': 'Pacino and De Niro.', 'Review': 'A heist thriller.',
+         'Picture': None, 'Director': 'Michael Mann'}
+
+
+def test_record_round_trips_a_movie():
+    record = MovieRecord.from_movie('001-02', MOVIE)
+    assert record.InfoThumbnailFile == 'thumbnails/heat.jpg' and record.ExtraInfo == {'Director': 'Michael Mann'}
+    info_id, movie = record.to_movie()
+    assert info_id == '001-02' and movie['InfoThumbnail']['File'] == 'thumbnails/heat.jpg'
+    assert movie['Picture'] is None and movie['Director'] == 'Michael Mann'
+    assert MovieRecord.from_row(record.to_row()) == record
+    assert pickle.loads(pickle.dumps(record)) == record
+
+
+def test_store_normalizes_and_loads_a_run(tmp_path):
+    store = EmpireStore(str(tmp_path / 'store'), batch_size=1)
+    store.save('20240101-000000', {'001-02': MOVIE})
+    assert store.pop_failures() == dict()
+
+    df = store.load(columns=['InfoMovie', 'ReleaseDate', 'RunningTime'])
+    assert df.loc['001-02', 'ReleaseDate'] == '1996-02-12' and df.loc['001-02', 'RunningTime'] == 171
+    movie = store.load_movies()['001-02']
+    assert movie['InfoMovie'] == 'Heat' and movie['Director'] == 'Michael Mann'
+
+
+def get_movies(number, **values):
+    return {f'001-{i:02d}': dict(MOVIE, InfoArticle=i, InfoMovie=f'Movie {i}', **values) for i in range(1, number + 1)}
+
+
+def test_runs_are_appended_in_parts(tmp_path):
+    store = EmpireStore(str(tmp_path / 'store'), batch_size=2)
+    store.open_run('20240101-000000')
+    movies = get_movies(3)
+    store.append({info_id: movies[info_id] for info_id in ['001-01', '001-02']})
+    store.append({'001-03': movies['001-03']})
+    assert len(os.listdir(store.get_run_directory('20240101-000000'))) == 1
+    store.close()
+    assert len(os.listdir(store.get_run_directory('20240101-000000'))) == 2
+    store.save('20240102-000000', get_movies(1, Rating=3))
+    assert store.get_runs() == ['20240101-000000', '20240102-000000']
+
+    assert list(store.load().index) == ['001-01']
+    old = store.load(run='20240101-000000', columns=['Rating'])
+    assert list(old.columns) == ['Rating'] and list(old.index) == ['001-01', '001-02', '001-03']
+    table = store.load_table(run='20240101-000000', filter=ds.field('InfoArticle') >= 2)
+    assert sorted(table.column('ID').to_pylist()) == ['001-02', '001-03']
+
+    store.clear_run('20240102-000000')
+    assert store.get_runs() == ['20240101-000000']
+
+
+def test_values_which_cannot_be_normalized_are_reported(tmp_path):
+    store = EmpireStore(str(tmp_path / 'store'))
+    store.save('20240101-000000', get_movies(1, ReleaseDate='31 Feb 1996', RunningTime='about two hours'))
+    failures = store.pop_failures()
+    assert failures == {'ReleaseDate': [('001-01', '31 Feb 1996')], 'RunningTime': [('001-01', 'about two hours')]}
+    df = store.load()
+    assert pd.isna(df.loc['001-01', 'ReleaseDate']) and pd.isna(df.loc['001-01', 'RunningTime'])
+    assert store.pop_failures() == dict()
+
+
+def test_values_out_of_range_are_reported(tmp_path):
+    store = EmpireStore(str(tmp_path / 'store'))
+    movies = get_movies(2, RunningTime='40000 mins')
+    movies['001-02']['InfoPage'] = 40000
+    store.save('20240101-000000', movies)
+    assert store.pop_failures() == {'InfoPage': [('001-02', 40000)],
+                                    'RunningTime': [('001-01', '40000 mins'), ('001-02', '40000 mins')]}
+    df = store.load()
+    assert df.loc['001-01', 'InfoPage'] == 1 and pd.isna(df.loc['001-02', 'InfoPage'])
+    assert df['RunningTime'].isna().all()
+
+
+def test_failed_flush_clears_the_buffer(tmp_path):
+    store = EmpireStore(str(tmp_path / 'store'))
+    store.open_run('20240101-000000')
+    store.append(get_movies(1, InfoPage='one'))
+    with pytest.raises(pa.ArrowException):
+        store.flush()
+    assert store.rows == []
+    store.append(get_movies(1))
+    store.close()
+    assert list(store.load().index) == ['001-01']
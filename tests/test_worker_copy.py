@@ -0,0 +1,31 @@
+import pickle
+
+import pytest
+
+from empire_scraper.empire_movies import EmpireMovies
+
+
+@pytest.fixture
+def empire_movies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return EmpireMovies(process_images=False, use_proxies=False, use_cache=False)
+
+
+def test_worker_copy_leaves_the_results_behind(empire_movies):
+    empire_movies.movies = {f'001-{i:02d}': {'Review': str(i) * 1000} for i in range(100)}
+    empire_movies.pages = list(range(1, 101))
+    worker_copy = empire_movies.get_worker_copy()
+    assert worker_copy.movies == dict() and worker_copy.pages is None and worker_copy.search_index is None
+    # The main process keeps its results
+    assert len(empire_movies.movies) == 100 and empire_movies.search_index is not None
+    assert len(pickle.dumps(worker_copy)) < len(pickle.dumps(empire_movies)) / 10
+
+
+def test_worker_copy_shares_the_state_of_the_crawl(empire_movies):
+    worker_copy = pickle.loads(pickle.dumps(empire_movies.get_worker_copy()))
+    assert worker_copy.now == empire_movies.now
+    assert worker_copy.checkpoint.file == empire_movies.checkpoint.file
+    worker_copy.ledger.record('001-01', 'https://www.empireonline.com/movies/reviews/heat-review/', status=503)
+    worker_copy.metrics.inc('reviews_done')
+    assert empire_movies.ledger.get('001-01')['status'] == 503
+    assert empire_movies.metrics.get_values()['reviews_done'] == 0